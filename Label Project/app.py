@@ -3,7 +3,6 @@ from utils.auth import AuthManager
 from utils.config import config
 import logging
 from datetime import datetime
-import pandas as pd
 
 logging.basicConfig(
     level=logging.INFO,
@@ -94,7 +93,7 @@ def main_app():
 
     st.header("🔧 System Modules")
 
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4 = st.columns(4)
 
     with col1:
         with st.container():
@@ -129,88 +128,68 @@ def main_app():
             if st.button("Open User Guide →", key="btn_user_guide", width='stretch'):
                 st.switch_page("pages/3_📝_User_Guide.py")
 
+    with col4:
+        with st.container():
+            st.markdown("""
+            <div style='padding: 1rem; border: 1px solid #ddd; border-radius: 0.5rem; height: 200px;'>
+                <h3>📊 Print Statistics</h3>
+                <p>The module is used to view daily label printing volume by customer, entity, label type and printer</p>
+            </div>
+            """, unsafe_allow_html=True)
+            if st.button("Open Print Statistics →", key="btn_print_stats", width='stretch'):
+                st.switch_page("pages/4_📊_Print_Statistics.py")
+
     st.markdown("---")
     st.header("📊 Quick Statistics")
     
-    try:
-        from utils.db import get_db_engine
-        from sqlalchemy import text
+    # Số liệu được cache dùng chung giữa các session (TTL), làm mới khi có requirement mới
+    from services import labels_v2 as labels_svc
+
+    stats = labels_svc.get_requirement_statistics()
+
+    if stats is None:
+        st.info("📊 Statistics will be available after creating requirements")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
         
-        engine = get_db_engine()
+        with col1:
+            st.metric("Total Requirements", stats['total_requirements'])
         
-        # Get statistics
-        stats_query = text("""
-        SELECT 
-            COUNT(DISTINCT id) as total_requirements,
-            COUNT(DISTINCT customer_id) as total_customers,
-            SUM(CASE WHEN status = 'ACTIVE' THEN 1 ELSE 0 END) as active_requirements,
-            SUM(CASE WHEN created_date >= DATE_SUB(NOW(), INTERVAL 7 DAY) THEN 1 ELSE 0 END) as recent_requirements
-        FROM customer_label_requirements
-        """)
+        with col2:
+            st.metric("Total Customers", stats['total_customers'])
         
-        with engine.connect() as conn:
-            stats = conn.execute(stats_query).fetchone()
+        with col3:
+            st.metric("Active Requirements", stats['active_requirements'])
         
-        if stats:
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("Total Requirements", int(stats[0] or 0))
-            
-            with col2:
-                st.metric("Total Customers", int(stats[1] or 0))
-            
-            with col3:
-                st.metric("Active Requirements", int(stats[2] or 0))
-            
-            with col4:
-                st.metric("Recent (7 days)", int(stats[3] or 0))
-        else:
-            st.info("No data available yet. Start by creating your first label requirement!")
-            
-    except Exception as e:
-        st.info("📊 Statistics will be available after creating requirements")
+        with col4:
+            st.metric("Recent (7 days)", stats['recent_requirements'])
     
     # Recent Activity
     st.markdown("---")
     st.header("⏰ Recent Activity")
     
-    try:
-        recent_query = text("""
-        SELECT 
-            requirement_name,
-            customer_name,
-            created_by,
-            created_date,
-            status
-        FROM customer_label_requirements
-        ORDER BY created_date DESC
-        LIMIT 5
-        """)
-        
-        with engine.connect() as conn:
-            recent_df = pd.read_sql(recent_query, conn)
-        
-        if not recent_df.empty:
-            for idx, row in recent_df.iterrows():
-                col1, col2, col3 = st.columns([3, 2, 1])
-                with col1:
-                    st.write(f"**{row['requirement_name']}** - {row['customer_name']}")
-                with col2:
-                    st.write(f"By {row['created_by']} on {row['created_date'].strftime('%Y-%m-%d')}")
-                with col3:
-                    status_color = {
-                        'ACTIVE': '🟢',
-                        'DRAFT': '🟡',
-                        'INACTIVE': '🔴',
-                        'ARCHIVED': '⚫'
-                    }
-                    st.write(f"{status_color.get(row['status'], '⚪')} {row['status']}")
-        else:
-            st.info("No recent activity")
-            
-    except Exception as e:
+    recent_requirements = labels_svc.get_recent_requirements(limit=5)
+
+    if recent_requirements is None:
         st.info("Recent activity will appear here")
+    elif recent_requirements:
+        status_color = {
+            'ACTIVE': '🟢',
+            'DRAFT': '🟡',
+            'INACTIVE': '🔴',
+            'ARCHIVED': '⚫'
+        }
+        for row in recent_requirements:
+            col1, col2, col3 = st.columns([3, 2, 1])
+            with col1:
+                st.write(f"**{row['requirement_name']}** - {row['customer_name']}")
+            with col2:
+                created_date = row['created_date'].strftime('%Y-%m-%d') if row['created_date'] else 'N/A'
+                st.write(f"By {row['created_by']} on {created_date}")
+            with col3:
+                st.write(f"{status_color.get(row['status'], '⚪')} {row['status']}")
+    else:
+        st.info("No recent activity")
     
     # Footer
     st.markdown("---")
@@ -6,14 +6,14 @@ import pandas as pd
 from services import labels_v2 as labels_svc
 from services import printer as printer_svc
 from services import form_builder as form_builder_svc
-import qrcode
 from io import BytesIO
 import html
 import textwrap
 from datetime import datetime
 import time
+import functools
+import mimetypes
 from utils.auth import AuthManager
-from utils.s3_utils import S3Manager
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,14 +23,6 @@ auth_manager = AuthManager()
 if not auth_manager.require_auth():
     st.stop()
 
-# Initialize S3
-try:
-    s3_manager = S3Manager()
-except Exception as e:
-    st.error("Unable to connect to file storage service. Please contact support.")
-    logger.error(f"S3 initialization failed: {e}")
-    st.stop()
-
 try:
     import win32print
 except ImportError:
@@ -68,6 +60,16 @@ def load_fields_from_db_once(requirement_id: int, force: bool = False):
     st.session_state["lf_db_fields"] = rows # Lưu toàn bộ dict từ DB
     st.session_state["lf_loaded_lt_id"] = requirement_id
 
+def read_requirement_file(s3_key: str) -> bytes:
+    """Đọc file đính kèm từ S3 khi người dùng bấm nút tải (data deferred của st.download_button)."""
+    ok, msg, stream = labels_svc.open_requirement_file(s3_key)
+    if not ok:
+        raise RuntimeError(msg)
+    try:
+        return stream.read()
+    finally:
+        stream.close()
+
 # Chọn Customer
 customers = labels_svc.get_active_customers()
 if not customers:
@@ -154,6 +156,43 @@ if lf_active_tab == "📄 Label Requirement List":
             # Hiển thị bảng dữ liệu với st.dataframe
             st.dataframe(display_df, width='stretch')
 
+            # File đính kèm (file yêu cầu, bản scan mẫu): chỉ tải từ S3 khi người dùng bấm
+            requirements_with_files = [
+                req for req in requirements
+                if req.get('requirement_file_s3_key') or req.get('sample_file_s3_key')
+            ]
+            if requirements_with_files:
+                with st.expander("📎 Requirement Files"):
+                    file_req_options = {
+                        f"{req['requirement_name']} (ID: {req['id']})": req
+                        for req in requirements_with_files
+                    }
+                    selected_file_req_label = st.selectbox(
+                        "Requirement",
+                        list(file_req_options.keys()),
+                        key="lf_files_requirement"
+                    )
+                    file_req = file_req_options[selected_file_req_label]
+
+                    # Nút tải luôn hiển thị; S3 chỉ được đọc khi bấm vào từng nút
+                    attachments = [
+                        ("Requirement File", file_req.get('requirement_file_s3_key')),
+                        ("Sample Scan", file_req.get('sample_file_s3_key')),
+                    ]
+                    for attachment_label, s3_key in attachments:
+                        if not s3_key:
+                            continue
+
+                        file_name = s3_key.rsplit('/', 1)[-1]
+                        st.download_button(
+                            label=f"💾 {attachment_label}: {file_name}",
+                            data=functools.partial(read_requirement_file, s3_key),
+                            file_name=file_name,
+                            mime=mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+                            on_click="ignore",
+                            key=f"lf_files_download_{file_req['id']}_{attachment_label}"
+                        )
+
 
 elif lf_active_tab == "➕ Create Label Requirement":
     if customer_id is None:
@@ -338,7 +377,7 @@ elif lf_active_tab == "➕ Create Label Fields":
         with c1: field_code = st.text_input("Field Code *")
         with c2: field_name = st.text_input("Field Name *")
         with c3:
-            VALID_FIELD_TYPES = ['TEXT', 'BARCODE_1D', 'BARCODE_2D', 'QRCODE', 'DATE', 'NUMBER', 'IMAGE']
+            VALID_FIELD_TYPES = ['TEXT', 'BARCODE_1D', 'BARCODE_2D', 'QRCODE', 'GS1_128', 'GS1_DATAMATRIX', 'DATE', 'NUMBER', 'IMAGE']
             field_type = st.selectbox("Field Type *", options=VALID_FIELD_TYPES)
 
         c4, c5, c6 = st.columns([2, 2, 1])
@@ -347,7 +386,7 @@ elif lf_active_tab == "➕ Create Label Fields":
         with c6: display_order = st.number_input("Display Order", min_value=1, step=1, value=len(current_fields_in_db) + len(st.session_state.get("lf_review_buffer", [])) + 1)
         
         c7, c8 = st.columns([3, 1])
-        with c7: data_source = st.text_input("Data Source")
+        with c7: data_source = st.text_input("Data Source", help="GS1 fields: AI template, e.g. (01){product_mapped_code}(10){batch_no}(17){expiry_date}")
         with c8: is_required = st.checkbox("Is Required?", value=True)
 
         special_rules = st.text_area("Special Rules")
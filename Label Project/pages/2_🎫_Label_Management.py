@@ -4,38 +4,45 @@ import base64
 import streamlit as st
 import pandas as pd
 import math
-import qrcode
-import barcode
-from barcode.writer import ImageWriter
 import html
 import textwrap
 import logging
-import json
+import time
 from services import labels_v2 as labels_svc
 from services import printer as printer_svc
 from services import form_builder as form_builder_svc
-from st_aggrid import AgGrid, GridOptionsBuilder, DataReturnMode
+from services import history_export as history_export_svc
+from services import package_aggregation as package_aggregation_svc
+from services import packaging as packaging_svc
+from services import serials as serials_svc
+from services import gs1 as gs1_svc
+from services import field_mapping as field_mapping_svc
+from services import formatting as formatting_svc
+from services import batch_validation as batch_validation_svc
+from services import form_schema as form_schema_svc
+from services.models import ProductLine
 from streamlit_modal import Modal
 from datetime import datetime, timedelta, date
 from io import BytesIO
 from utils.auth import AuthManager
-from utils.s3_utils import S3Manager
+from utils import session_state as session_state_mgr
+from utils.lazy import lazy_import
 
 logger = logging.getLogger(__name__)
 
+# Thư viện nặng chỉ dùng ở một số tab: import khi tab đó render lần đầu
+qrcode = lazy_import("qrcode")
+barcode = lazy_import("barcode")
+barcode_writer = lazy_import("barcode.writer")   # kéo theo PIL
+st_aggrid = lazy_import("st_aggrid")
+
+page_run_started = time.perf_counter()
+
 # Authentication check
 auth_manager = AuthManager()
 if not auth_manager.require_auth():
     st.stop()
 
-# Initialize S3
-try:
-    s3_manager = S3Manager()
-except Exception as e:
-    st.error("Unable to connect to file storage service. Please contact support.")
-    logger.error(f"S3 initialization failed: {e}")
-    st.stop()
-
 st.set_page_config(layout="wide")
 st.title("🏷️ Label Management")
 
@@ -64,7 +71,7 @@ if 'entity_id_for_label' not in st.session_state:
 
 # session_state lưu trữ thông tin cuối cùng để hiển thị trên nhãn
 if 'label_preview_data' not in st.session_state:
-    st.session_state.label_preview_data = {}
+    session_state_mgr.put("label_preview_data", {})
 
 # session_state lưu trữ tạm thông tin form trước khi confirm
 if 'temp_label_form_data' not in st.session_state:
@@ -100,13 +107,12 @@ def confirm_label_and_update_preview():
     else:
         updated_data = {**product_info, **form_data}
 
-    st.session_state.label_preview_data = updated_data
+    session_state_mgr.put("label_preview_data", updated_data)
 
     if confirmed_label_type != "PACKAGE_LABEL":
         if "is_package_from_history" in st.session_state:
             del st.session_state.is_package_from_history
-        if "package_history_data" in st.session_state:
-            del st.session_state.package_history_data
+        session_state_mgr.pop("package_history_ids")
 
     # Xóa dữ liệu tạm
     st.session_state.temp_label_form_data = {}
@@ -122,13 +128,13 @@ def confirm_and_switch_tab(product_data, customer_id, entity_id):
     st.session_state.customer_id_for_label = customer_id
     st.session_state.entity_id_for_label = entity_id
     st.session_state.next_tab = "👁️‍🗨️ Preview and Create Label"
-    st.session_state.label_preview_data = product_data.copy()
+    # ProductLine là bất biến: dùng chung object, không cần copy
+    session_state_mgr.put("label_preview_data", product_data)
     confirm_modal.close()
     
     if "is_package_from_history" in st.session_state:
         del st.session_state.is_package_from_history
-    if "package_history_data" in st.session_state:
-        del st.session_state.package_history_data
+    session_state_mgr.pop("package_history_ids")
 
 def switch_to_select_product_tab():
     
@@ -138,12 +144,11 @@ def switch_to_select_product_tab():
     st.session_state.product_for_label = None
     st.session_state.customer_id_for_label = None
     st.session_state.entity_id_for_label = None
-    st.session_state.label_preview_data = {}
+    session_state_mgr.put("label_preview_data", {})
 
     if "is_package_from_history" in st.session_state:
         del st.session_state.is_package_from_history
-    if "package_history_data" in st.session_state:
-        del st.session_state.package_history_data
+    session_state_mgr.pop("package_history_ids")
 
 # --- GIAO DIỆN CHÍNH ---
 
@@ -155,6 +160,12 @@ label_management_tabs = [
 
 tab_selection = st.radio(" ", label_management_tabs, key="active_tab", horizontal=True, label_visibility="collapsed")
 
+# Dữ liệu chỉ dùng trong một tab: xóa khỏi session_state khi chuyển sang tab khác
+session_state_mgr.drop_stale_keys(tab_selection, {
+    "📦 Select Product": ["dn_df"],
+    "👁️‍🗨️ Preview and Create Label": ["temp_label_form_data", "temp_label_settings", "temp_content_fields_map", "label_form_data", "label_layout"],
+})
+
 st.divider()
 
 # --- TAB 1: LỰA CHỌN SẢN PHẨM ---
@@ -171,11 +182,21 @@ if tab_selection == "📦 Select Product":
         if not customer_code or not entity_code: return []
         return labels_svc.get_dns_for_customer_and_entity(customer_code, entity_code)
 
-    @st.cache_data(ttl=600)
+    # cache_resource: trả về chính các ProductLine bất biến, dùng chung giữa các session (không pickle/copy)
+    @st.cache_resource(ttl=600)
     def load_products(dns: tuple[str], group_by_batch: bool):
         if not dns: return []
         return labels_svc.get_products_by_dns(list(dns), group_by_batch_no=group_by_batch)
 
+    # Điền + kiểm tra cả danh sách sản phẩm chỉ chạy lại khi đổi requirement/DN, không phải mỗi lần chọn dòng.
+    # fields_hash: content field của requirement đã sửa thì key đổi theo (_content_fields không được hash)
+    @st.cache_resource(ttl=600)
+    def load_filled_products(dns: tuple[str], group_by_batch: bool, requirement_id: int, fields_hash: int, _content_fields):
+        df_products = pd.DataFrame(load_products(dns, group_by_batch))
+        filled_df = field_mapping_svc.fill_labels_for_products(df_products, _content_fields)
+        batch_result = batch_validation_svc.validate_product_lines(df_products, _content_fields)
+        return filled_df, batch_result
+
     customers, entities = load_initial_data()
 
     selected_customer = None
@@ -220,17 +241,18 @@ if tab_selection == "📦 Select Product":
         dns_list = load_dns(customer_code, entity_code)
         
         if dns_list:
-            if 'dn_df' not in st.session_state or set(st.session_state.dn_df['DN Number']) != set(dns_list):
-                st.session_state.dn_df = pd.DataFrame({
+            dn_df = session_state_mgr.get("dn_df")
+            if dn_df is None or set(dn_df['DN Number']) != set(dns_list):
+                session_state_mgr.put("dn_df", pd.DataFrame({
                     'Choose': [False] * len(dns_list),
                     'DN Number': dns_list
-                })
+                }), tab="📦 Select Product")
 
             def select_all_dns():
-                st.session_state.dn_df['Choose'] = True
+                session_state_mgr.put("dn_df", session_state_mgr.get("dn_df").assign(Choose=True), tab="📦 Select Product")
 
             def deselect_all_dns():
-                st.session_state.dn_df['Choose'] = False
+                session_state_mgr.put("dn_df", session_state_mgr.get("dn_df").assign(Choose=False), tab="📦 Select Product")
 
             btn_col1, btn_col2, _ = st.columns([1, 1, 4])
 
@@ -240,7 +262,7 @@ if tab_selection == "📦 Select Product":
                 st.button("Deselect all", on_click=deselect_all_dns, width='stretch')
 
             edited_dn_df = st.data_editor(
-                st.session_state.dn_df,
+                session_state_mgr.get("dn_df"),
                 width='stretch',
                 hide_index=True,
                 disabled=["DN Number"] 
@@ -271,16 +293,16 @@ if tab_selection == "📦 Select Product":
             st.write(f"Found: **{len(df_products)}** products")
             st.caption("Select a product from the table below to prepare the label for printing")
             
-            gb = GridOptionsBuilder.from_dataframe(df_products)
+            gb = st_aggrid.GridOptionsBuilder.from_dataframe(df_products)
             gb.configure_selection('single', use_checkbox=True, header_checkbox=False)
             gb.configure_pagination(paginationAutoPageSize=True)
             gb.configure_side_bar()
             gridOptions = gb.build()
 
-            grid_response = AgGrid(
+            grid_response = st_aggrid.AgGrid(
                 df_products,
                 gridOptions=gridOptions,
-                data_return_mode=DataReturnMode.AS_INPUT,
+                data_return_mode=st_aggrid.DataReturnMode.AS_INPUT,
                 update_on=['selectionChanged'],
                 fit_columns_on_grid_load=True,
                 height=350,
@@ -288,6 +310,49 @@ if tab_selection == "📦 Select Product":
                 key='product_grid'
             )
             selected_product_df = pd.DataFrame(grid_response['selected_rows'])
+
+            customer_id_for_fill = selected_customer.get('customer_id') if selected_customer else None
+            requirement_bundles_for_fill = labels_svc.get_requirement_bundles(customer_id_for_fill) if customer_id_for_fill else {}
+            if requirement_bundles_for_fill:
+                with st.expander("🧾 Auto-filled label data & validation for the selected DNs"):
+                    fill_bundle = st.selectbox(
+                        "Label requirement:",
+                        options=list(requirement_bundles_for_fill.values()),
+                        format_func=lambda bundle: f"{bundle.requirement.get('requirement_name')} ({bundle.requirement.get('requirement_type')})",
+                        key="auto_fill_requirement"
+                    )
+                    # Một lượt theo cột cho cả danh sách sản phẩm, từ data_source của các content field
+                    filled_df, batch_result = load_filled_products(
+                        tuple(selected_dns), group_by_batch,
+                        fill_bundle.requirement.get('id'), hash(fill_bundle.fields), fill_bundle.fields
+                    )
+                    if filled_df.empty or filled_df.columns.empty:
+                        st.info("No content field of this requirement has a data source to fill from.")
+                    else:
+                        field_names = {f.get('field_code'): f.get('field_name') or f.get('field_code') for f in fill_bundle.fields}
+                        filled_df = filled_df.rename(columns=field_names)
+                        filled_df.insert(0, 'DN', df_products.get('dn_number'), allow_duplicates=True)
+                        filled_df.insert(1, 'Product Code', df_products.get('product_pn'), allow_duplicates=True)
+                        st.dataframe(filled_df, hide_index=True, width='stretch')
+
+                        # Kiểm tra trước mọi dòng sản phẩm, sửa dữ liệu trước khi in hàng loạt thay vì lỗi giữa chừng
+                        if batch_result.error_count:
+                            st.error(
+                                f"{batch_result.error_count} problems in {batch_result.invalid_row_count} "
+                                f"of {len(df_products)} product lines",
+                                icon="🚨"
+                            )
+                            st.dataframe(
+                                batch_validation_svc.error_matrix_for_display(batch_result, df_products, fill_bundle.fields),
+                                hide_index=True,
+                                width='stretch'
+                            )
+                        else:
+                            st.success(f"All {len(df_products)} product lines pass the requirement's checks", icon="✅")
+
+                        if batch_result.manual_fields:
+                            manual_names = [field_names.get(code, code) for code in batch_result.manual_fields]
+                            st.caption(f"Entered when printing (not checked here): {', '.join(manual_names)}")
         else:
             st.warning("No products found for the selected businesses", icon="🚨")
 
@@ -316,7 +381,7 @@ if tab_selection == "📦 Select Product":
 
             modal_col1, modal_col2 = st.columns(2)
             with modal_col1:
-                product_data_to_pass = display_df.to_dict('records')[0]
+                product_data_to_pass = ProductLine.from_row(display_df.to_dict('records')[0])
                 customer_id_to_pass = selected_customer.get('customer_id') if selected_customer else None
                 entity_id_to_pass = selected_entity.get('entity_id') if selected_entity else None
                 
@@ -336,309 +401,90 @@ if tab_selection == "📦 Select Product":
 # --- TAB 2: XEM TRƯỚC VÀ TẠO NHÃN ---
 elif tab_selection == "👁️‍🗨️ Preview and Create Label":
 
-    @st.cache_data(ttl=300)
-    def load_label_requirements(customer_id: int):
-        if not customer_id:
-            return []
-        return labels_svc.get_customer_label_requirements(customer_id)
-    
-    @st.cache_data(ttl=300)
-    def load_label_content_fields(requirement_id: int):
-        if not requirement_id:
-            return []
-        return labels_svc.get_label_content_fields(requirement_id)
-
-    if st.session_state.product_for_label:
-        product_info = st.session_state.product_for_label
-        customer_id = st.session_state.get('customer_id_for_label')
-        entity_id = st.session_state.get('entity_id_for_label')
-        label_requirements = load_label_requirements(customer_id)
-        
-        col1, col2 = st.columns(2)
-        with col1:
-            st.subheader("📃 Product Information")
-            with st.container(border=True):
-                c1_info, c2_info = st.columns(2)
-                with c1_info:
-                    st.text_input("Customer", value=product_info.get('customer', 'N/A'), disabled=True)
-                    st.text_input("DN Number", value=product_info.get('dn_number', 'N/A'), disabled=True)
-                    st.text_input("Vendor Product Code", value=product_info.get('product_mapped_code', 'N/A'), disabled=True)
-                    st.text_input("PT Code", value=product_info.get('pt_code', 'N/A'), disabled=True)
-                    st.text_input("Package Size", value=product_info.get('package_size', 'N/A'), disabled=True)
-                    st.text_input("Total Standard Qty", value=product_info.get('total_standard_qty', 'N/A'), disabled=True)
-                    st.text_input("Brand", value=product_info.get('brand', 'N/A'), disabled=True)
-                with c2_info:
-                    st.text_input("Entity", value=product_info.get('legal_entity', 'N/A'), disabled=True)
-                    st.text_input("Product Code", value=product_info.get('product_pn', 'N/A'), disabled=True)
-                    st.text_input("Vendor Product Name", value=product_info.get('product_mapped_name', 'N/A'), disabled=True)
-                    st.text_input("Batch No", value=product_info.get('batch_no', 'N/A'), disabled=True)
-                    st.text_input("Shelf Life", value=product_info.get('shelf_life', 'N/A'), disabled=True)
-                    st.text_input("Total Selling Qty", value=product_info.get('total_selling_qty', 'N/A'), disabled=True)
-                    st.text_input("UOM", value=product_info.get('uom', 'N/A'), disabled=True)
+    # Không dùng st.cache_data ở đây: service layer đã cache dùng chung (requirement
+    # kèm content field, chỉ đọc) và tự xóa đúng customer khi có thay đổi (services.events)
+    def load_content_fields_from_bundles(requirement_bundles, requirement_id: int):
+        bundle = requirement_bundles.get(requirement_id) if requirement_id else None
+        return bundle.fields if bundle else ()
 
-        number_of_labels = 0
-        qty_per_carton = 1
+    @st.fragment
+    @session_state_mgr.timed_rerun("label form")
+    def render_label_form(selected_requirement, content_fields, product_info, is_locked_for_package):
+        # Nhập liệu chỉ chạy lại form; form_data được ghi vào session_state cho nút Preview Label
         form_data = {}
-        content_fields = []
-
-        with col2:
-            st.subheader("🎫 Customer Label Requirements")
-
-            selected_requirement = None
-
-            if label_requirements:
-                if len(label_requirements) > 1:
-                    requirement_options = {
-                        f"{req['requirement_name']} ({req['requirement_type']})": req
-                        for req in label_requirements
-                    }
-                    selected_option_key = st.selectbox(
-                        "Select a label requirement:",
-                        options=requirement_options.keys()
-                    )
-                    selected_requirement = requirement_options[selected_option_key]
-                else:
-                    selected_requirement = label_requirements[0]
-
-            if selected_requirement:
-                with st.container(border=True):
-                    req_col1, req_col2 = st.columns(2)
-                    with req_col1:
-                        st.text_input("Label Name", value=selected_requirement.get('requirement_name', 'N/A'), disabled=True, key="selected_req_name")
-                        st.text_input("Label Type", value=selected_requirement.get('requirement_type', 'N/A'), disabled=True, key="selected_req_type")
-                        st.text_input("Printer Dpi", value=selected_requirement.get('printer_dpi', 'N/A'), disabled=True, key="selected_req_dpi")
-                    with req_col2:
-                        st.text_input("Label Size", value=selected_requirement.get('label_size', 'N/A'), disabled=True, key="selected_req_size")
-                        st.text_input("Special Notes", value=selected_requirement.get('special_notes', 'N/A'), disabled=True, key="selected_req_notes")
-                        st.text_input("Printer Type", value=selected_requirement.get('printer_type', 'N/A'), disabled=True, key="selected_req_printer")
-            else:
-                st.warning("No existing Customer Label Requirements")
-
-        st.divider()
-
-        st.subheader("⌨️ Enter data for the label")
-
-        # Lấy cờ khóa (lock flag) ra ngoài để cả col1 (form) và col2 (settings) đều dùng được
-        is_locked_for_package = st.session_state.get("is_package_from_history", False)
-
-        col1, col2 = st.columns(2)
-        with col1:
-            if selected_requirement:
-                with st.container(border=True):
-
-                    if is_locked_for_package:
-                        st.info("ℹ️ Data entry is disabled when creating a Package Label from history. Data will be aggregated from selected items.")
-
-                    requirement_id = selected_requirement.get('id')
-                    content_fields = load_label_content_fields(requirement_id)
-
-                    if content_fields:
-                        form_col1, form_col2 = st.columns(2)
-                        for i, field in enumerate(content_fields):
-                            target_col = form_col1 if i % 2 == 0 else form_col2
-                            with target_col:
-                                field_type = field.get('field_type', 'TEXT').upper()
-                                label = field.get('field_name')
-                                placeholder = field.get('sample_value')
-                                key = f"dynamic_field_{field.get('id')}"
-                                field_code = field.get('field_code')
-
-                                default_value = st.session_state.label_preview_data.get(field_code, "")
-
-                                value = None
-
-                                if field_type == 'NUMBER':
-                                    value = st.number_input(
-                                        label=label,
-                                        placeholder=placeholder,
-                                        key=key,
-                                        step=1,
-                                        format="%d",
-                                        value=int(default_value) if isinstance(default_value, (int, float)) or (isinstance(default_value, str) and default_value.isdigit()) else 0,
-                                        disabled=is_locked_for_package
-                                    )
-                                elif field_type == 'DATE':
-                                    try:
-                                        default_date = datetime.strptime(str(default_value) if default_value else placeholder, "%Y-%m-%d").date()
-                                    except (ValueError, TypeError):
-                                        default_date = datetime.now().date()
-                                    value = st.date_input(
-                                        label=label, 
-                                        key=key, 
-                                        value=default_date,
-                                        disabled=is_locked_for_package
-                                    )
-                                else:
-                                    value = st.text_input(
-                                        label=label,
-                                        placeholder=placeholder,
-                                        key=key,
-                                        value=str(default_value),
-                                        disabled=is_locked_for_package
-                                    )
-                                
-                                if value is not None:
-                                    form_data[field.get('field_code')] = value
-                    else:
-                        st.warning("This label request has no content fields", icon='🚨')
-        with col2:
-            with st.container(border=True):
-
-                label_type_options = ["ITEM_LABEL", "CARTON_LABEL", "PACKAGE_LABEL"]
-                default_index = 0
-                
-                if is_locked_for_package:
-                    # 1. Ưu tiên cao nhất: Khóa nếu là package từ history
-                    default_index = label_type_options.index("PACKAGE_LABEL")
-                    # Xóa cờ "override" dùng một lần nếu có, vì cờ "is_locked" đã thay thế
-                    if 'default_label_type_override' in st.session_state:
-                        del st.session_state.default_label_type_override
-                
-                elif 'default_label_type_override' in st.session_state and st.session_state.default_label_type_override in label_type_options:
-                    # 2. Ưu tiên nhì: Tín hiệu 1 lần (nếu có, mặc dù Tab 3 set cả 2)
-                    default_index = label_type_options.index(st.session_state.default_label_type_override)
-                    # Xóa tín hiệu để không bị dính cho lần sau
-                    del st.session_state.default_label_type_override
-                
-                elif selected_requirement: 
-                    # 3. Mặc định: Lấy từ requirement
-                    default_label_type = selected_requirement.get('requirement_type')
-                    if default_label_type in label_type_options:
-                        default_index = label_type_options.index(default_label_type)
-
-                label_template = st.selectbox(
-                    "Label Type:",
-                    options=label_type_options,
-                    index=default_index,
-                    disabled=is_locked_for_package
-                )
-
-                total_selling_qty = int(product_info.get('total_selling_qty', 0))
-
-                if label_template == "ITEM_LABEL" or label_template == "CARTON_LABEL":
-                    qty_per_carton_value = int(product_info.get('total_standard_qty', 1))
-                    qty_per_carton = st.number_input(
-                        "Quantity Per Carton:",
-                        min_value=1,
-                        max_value=total_selling_qty if total_selling_qty > 0 else 1,
-                        value=qty_per_carton_value,
-                        help=f"Nhập số lượng sản phẩm trong một thùng / một pcs. Tối đa: {total_selling_qty}"
-                    )
-                    ceil_value = math.ceil(total_selling_qty / qty_per_carton) if qty_per_carton > 0 else 0
-                    floor_value = math.floor(total_selling_qty / qty_per_carton) if qty_per_carton > 0 else 0
-                    if ceil_value == floor_value or floor_value == 0:
-                        number_of_labels = st.number_input(
-                            "Number of Labels:",
-                            value=ceil_value,
-                            disabled=True,
-                            help="Số lượng thùng được tính tự động bằng công thức total_selling_quantity / Quantity Per Carton"
-                        )
-                    else:
-                        st.caption("Due to odd products, please select the number of boxes to print labels")
-                        number_of_labels = st.radio(
-                            "Select the number of labels:",
-                            options=[floor_value, ceil_value],
-                            index=1,
-                            format_func=lambda x: f"{x} labels (Round down)" if x == floor_value else f"{x} labels (Round up)",
-                            horizontal=True
-                        )
-                else: # PACKAGE_LABEL
-                    number_of_labels = st.number_input(
-                        "Number of Label:",
-                        min_value=1,
-                        value=1,
-                        disabled=True,
-                        help="Với 'PACKAGE_LABEL', số lượng nhãn luôn là 1"
-                    )
-
-        if st.button("👁️ Preview Label", type="primary", width='stretch'):
+        with st.container(border=True):
+
+            if is_locked_for_package:
+                st.info("ℹ️ Data entry is disabled when creating a Package Label from history. Data will be aggregated from selected items.")
+
+            if content_fields:
+                # data_source (trường sản phẩm, ghép chuỗi, hạn dùng = ngày sản xuất + shelf_life...) biên dịch một lần cho mỗi requirement
+                mapping_plan = field_mapping_svc.get_mapping_plan(content_fields)
+
+                # Widget, key, giá trị mặc định đã phân tích sẵn, cache cùng bundle của requirement
+                form_schema = form_schema_svc.get_form_schema(content_fields)
+
+                form_col1, form_col2 = st.columns(2)
+                for i, spec in enumerate(form_schema):
+                    target_col = form_col1 if i % 2 == 0 else form_col2
+                    with target_col:
+                        default_value = session_state_mgr.get("label_preview_data", {}).get(spec.field_code, "")
+
+                        accessor = mapping_plan.get(spec.field_code)
+                        derived_date = None
+                        if accessor and not default_value:
+                            # Điền từ thông tin sản phẩm và các trường đã nhập phía trước
+                            source_record = {**product_info, **form_data}
+                            if accessor.kind == field_mapping_svc.ACCESS_DERIVED:
+                                derived_date = accessor.derived.evaluate_date(source_record)
+                            default_value = accessor(source_record) or ""
+
+                        value = None
+
+                        if spec.widget == form_schema_svc.WIDGET_NUMBER:
+                            value = st.number_input(
+                                label=spec.field_name,
+                                placeholder=spec.placeholder,
+                                key=spec.key,
+                                step=1,
+                                format="%d",
+                                value=int(spec.bind(default_value)),
+                                disabled=is_locked_for_package
+                            )
+                        elif spec.widget == form_schema_svc.WIDGET_DATE:
+                            value = st.date_input(
+                                label=spec.field_name, 
+                                key=spec.key, 
+                                value=derived_date or spec.bind(default_value),
+                                disabled=is_locked_for_package
+                            )
+                        else:
+                            value = st.text_input(
+                                label=spec.field_name,
+                                placeholder=spec.placeholder,
+                                key=spec.key,
+                                value=spec.bind(default_value),
+                                disabled=is_locked_for_package
+                            )
 
-            errors = {}
-            
-            if label_template != "PACKAGE_LABEL":
-                data_for_validation = {
-                    field.get('field_name'): form_data.get(field.get('field_code'))
-                    for field in content_fields
-                }
-                
-                errors = form_builder_svc.validate_form(data_for_validation, content_fields)
-            
-            if errors:
-                error_messages = []
-                for field_name, message in errors.items():
-                    error_messages.append(f"- **{field_name}** {message}")
-                st.warning("Please check the form again:\n" + "\n".join(error_messages), icon="🚨")
+                        if value is not None:
+                            form_data[spec.field_code] = value
             else:
-                st.session_state.temp_label_form_data = form_data
-                st.session_state.temp_label_settings = {
-                    "label_type": label_template, 
-                    "number_of_labels": number_of_labels
-                }
-                st.session_state.temp_content_fields_map = {
-                    f.get('field_code'): f.get('field_name') for f in content_fields
-                }
-                review_label_modal.open()
-
-        # Hiển thị modal review
-        if review_label_modal.is_open():
-            with review_label_modal.container():
-                
-                # Lấy dữ liệu tạm thời
-                form_data_review = st.session_state.get('temp_label_form_data', {})
-                settings_review = st.session_state.get('temp_label_settings', {})
-                field_map_review = st.session_state.get('temp_content_fields_map', {})
-
-                st.subheader("⌨️ Label Data")
-                with st.container(border=True):
-                    col_set1, col_set2 = st.columns(2)
-                    with col_set1:
-                        st.text_input("Label Type", value=settings_review.get('label_type', 'N/A'), disabled=True, key="modal_label_type")
-                    with col_set2:
-                        st.text_input("Number of Labels", value=settings_review.get('number_of_labels', 'N/A'), disabled=True, key="modal_num_labels")
-                if form_data_review:
-                    display_data = []
-                    for field_code, value in form_data_review.items():
-                        field_name = field_map_review.get(field_code, field_code) 
-                        display_data.append({"Field": field_name, "Data": str(value)})
-                    
-                    st.dataframe(pd.DataFrame(display_data), hide_index=True, width='stretch')
-                else:
-                    st.warning("No additional data is entered", icon="🚨")
-                
-                st.divider()
-
-                modal_col1, modal_col2 = st.columns(2)
-                with modal_col1:
-                    st.button(
-                        "✅ Confirm & Update Preview", 
-                        type="primary", 
-                        width='stretch',
-                        on_click=confirm_label_and_update_preview
-                    )
-                with modal_col2:
-                    if st.button("❌ Cancel", width='stretch'):
-                        st.session_state.temp_label_form_data = {}
-                        st.session_state.temp_label_settings = {}
-                        st.session_state.temp_content_fields_map = {}
-                        review_label_modal.close()
-
-        st.divider()
-        
-        st.header("👁️‍🗨️ Preview & Customize Layout")
-
-        st.divider()
-
+                st.warning("This label request has no content fields", icon='🚨')
+        st.session_state.label_form_data = form_data
+
+    @st.fragment
+    @session_state_mgr.timed_rerun("label layout")
+    def render_label_layout(selected_requirement, content_fields_for_preview, number_of_labels):
+        # Cài đặt bố cục + preview: đổi cỡ chữ, lề, kích thước mã... chỉ chạy lại fragment này.
+        # Bố cục tính xong được ghi vào session_state (label_layout) cho fragment in nhãn
         lt_name = selected_requirement.get('requirement_name', 'Untitled Label') if selected_requirement else 'Untitled Label'
         
-        # Dữ liệu cơ sở (thông tin sản phẩm + dữ liệu form mới)
-        base_label_info = st.session_state.label_preview_data
-
         label_info = {}
         
-        content_fields_for_preview = []
-        if selected_requirement:
-            requirement_id = selected_requirement.get('id')
-            content_fields_for_preview = load_label_content_fields(requirement_id)
+        # Dữ liệu cơ sở (thông tin sản phẩm + dữ liệu form mới), đã áp format_pattern của từng field:
+        # preview, ZPL, EZPX và printed_data đều dùng cùng giá trị này
+        base_label_info = formatting_svc.format_label_data(session_state_mgr.get("label_preview_data", {}), content_fields_for_preview)
 
         col_settings, col_space, col_preview = st.columns([2, 1, 4]) 
 
@@ -664,36 +510,58 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                     except (ValueError, TypeError):
                         pass 
             
+            # Key gắn với requirement: đổi requirement thì khổ giấy trở về mặc định của requirement đó
+            size_key = selected_requirement.get('id') if selected_requirement else "default"
             col_w, col_h = st.columns(2)
             with col_w:
-                paper_width = st.number_input("Paper Width (mm)", min_value=10, max_value=500, value=paper_width_default, step=1)
+                paper_width = st.number_input("Paper Width (mm)", min_value=10, max_value=500, value=paper_width_default, step=1, key=f"layout_paper_width_{size_key}")
             with col_h:
-                paper_height = st.number_input("Paper Height (mm)", min_value=10, max_value=500, value=paper_height_default, step=1)
+                paper_height = st.number_input("Paper Height (mm)", min_value=10, max_value=500, value=paper_height_default, step=1, key=f"layout_paper_height_{size_key}")
             
-            font_size = st.slider("Font Size (pt)", 6, 48, 12)
+            font_size = st.slider("Font Size (pt)", 6, 48, 12, key="layout_font_size")
 
-            text_orientation = st.radio("Rotate data", ["Horizontal", "Vertical"], horizontal=True)
+            text_orientation = st.radio("Rotate data", ["Horizontal", "Vertical"], horizontal=True, key="layout_text_orientation")
             
             st.markdown("---")
 
             st.write("**Margins (mm)**")
             m_col1, m_col2 = st.columns(2)
             with m_col1:
-                margin_top = st.number_input("Top", min_value=0, max_value=paper_height, value=6, step=1)
-                margin_left = st.number_input("Left", min_value=0, max_value=int(paper_width/2), value=6, step=1)
+                margin_top = st.number_input("Top", min_value=0, max_value=paper_height, value=6, step=1, key="layout_margin_top")
+                margin_left = st.number_input("Left", min_value=0, max_value=int(paper_width/2), value=6, step=1, key="layout_margin_left")
             with m_col2:
-                margin_bottom = st.number_input("Bottom", min_value=0, max_value=paper_height, value=6, step=1)
-                margin_right = st.number_input("Right", min_value=0, max_value=int(paper_width/2), value=6, step=1)
+                margin_bottom = st.number_input("Bottom", min_value=0, max_value=paper_height, value=6, step=1, key="layout_margin_bottom")
+                margin_right = st.number_input("Right", min_value=0, max_value=int(paper_width/2), value=6, step=1, key="layout_margin_right")
 
             qr_codes = []
             qr_field_codes = []
             barcodes_1d = []
             barcode_1d_field_codes = []
+            gs1_128_codes = []
+            gs1_datamatrix_codes = []
+            gs1_values = {} # field_code -> chuỗi GS1 dạng (AI)value để in dưới mã và lưu lịch sử
             
             for field in content_fields_for_preview:
                 field_code = field.get("field_code", "")
                 field_type = field.get("field_type", "").upper()
                 content = base_label_info.get(field_code)
+
+                if field_type in ('GS1_128', 'GS1_DATAMATRIX'):
+                    try:
+                        elements = gs1_svc.resolve_field_elements(content, field.get("data_source"), base_label_info)
+                    except ValueError as e:
+                        st.warning(f"{field.get('field_name') or field_code}: {e}")
+                        continue
+                    if not elements: continue
+
+                    gs1_values[field_code] = gs1_svc.to_human_readable(elements)
+                    if field_type == 'GS1_128':
+                        gs1_128_codes.append(elements)
+                        barcode_1d_field_codes.append(field_code)
+                    else:
+                        gs1_datamatrix_codes.append(elements)
+                        qr_field_codes.append(field_code)
+                    continue
                 
                 if not content: continue
                 
@@ -711,15 +579,15 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
 
             available_height = paper_height - margin_top - margin_bottom
 
-            if qr_codes:
+            if qr_codes or gs1_datamatrix_codes:
                 st.markdown("---")
                 st.write("**QR Code Size (mm)**")
-                num_qrs = len(qr_codes)
+                num_qrs = len(qr_codes) + len(gs1_datamatrix_codes)
                 default_qr_size = max(25, int(available_height / num_qrs) - (5 * (num_qrs -1))) if num_qrs > 0 else 25
-                qr_width_mm = st.number_input("QR Size", min_value=10, value=default_qr_size, step=1)
+                qr_width_mm = st.number_input("QR Size", min_value=10, value=default_qr_size, step=1, key="layout_qr_size")
                 qr_height_mm = qr_width_mm 
 
-            if barcodes_1d:
+            if barcodes_1d or gs1_128_codes:
                 st.markdown("---")
                 st.write("**Barcode Size (mm)**")
                 default_bc_width = 60
@@ -727,9 +595,9 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                 
                 bc_col1, bc_col2 = st.columns(2)
                 with bc_col1:
-                    barcode_1d_width_mm = st.number_input("Barcode Width (mm)", min_value=10, value=default_bc_width, step=1)
+                    barcode_1d_width_mm = st.number_input("Barcode Width (mm)", min_value=10, value=default_bc_width, step=1, key="layout_barcode_width")
                 with bc_col2:
-                    barcode_1d_height_mm = st.number_input("Barcode Height (mm)", min_value=5, value=default_bc_height, step=1)
+                    barcode_1d_height_mm = st.number_input("Barcode Height (mm)", min_value=5, value=default_bc_height, step=1, key="layout_barcode_height")
 
         with col_preview:
             st.subheader("👁️ Label Preview")
@@ -741,8 +609,6 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
             margin_bottom_px = int(margin_bottom * px_per_mm)
             margin_left_px = int(margin_left * px_per_mm)
             margin_right_px = int(margin_right * px_per_mm)
-            inner_width_px = preview_width_px - margin_left_px - margin_right_px
-            inner_height_px = preview_height_px - margin_top_px - margin_bottom_px
             
             text_html_content = ' '
             all_display_fields = []
@@ -759,11 +625,7 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
             # 2. KIỂM TRA CHẾ ĐỘ TẠO PACKAGE TỪ HISTORY
             if st.session_state.get("is_package_from_history", False):
                 
-                final_package_data_for_preview = base_label_info.copy()
-                aggregated_data_for_print = {} # Đây là dữ liệu SẼ ĐƯỢC IN
-
-                history_items = st.session_state.get("package_history_data", [])
-
+                history_ids = session_state_mgr.get("package_history_ids", ())
 
                 new_dynamic_fields_html = ""
                 for key in all_display_fields:
@@ -781,83 +643,40 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                     text_html_content += '<br>'
                     text_html_content += new_dynamic_fields_html
 
-                # LOGIC GỘP DỮ LIỆU
-                aggregated_data_for_preview = {}
-
-                for item in history_items:
+                # LOGIC GỘP DỮ LIỆU: service tự đọc lịch sử, gộp theo quy tắc của từng field và nhớ kết quả
+                package_aggregate = package_aggregation_svc.aggregate_package(
+                    history_ids,
+                    rules=package_aggregation_svc.get_aggregation_rules(content_fields_for_preview),
+                    field_names=display_name_map
+                )
 
-                    # Parse JSON data
-                    data_str = item.get('printed_data')
-                    data_dict = {}
-                    if isinstance(data_str, str) and data_str:
-                        try:
-                            data_dict = json.loads(data_str)
-                        except json.JSONDecodeError:
-                            data_dict = {}
-                    elif isinstance(data_str, dict): 
-                        data_dict = data_str
+                # Hiển thị dữ liệu đã gộp
+                text_html_content += '<div style="font-size: 0.9em; margin-top: 5px; padding-top: 3px;">'
 
-                    # Gộp các giá trị từ printed_data, đảm bảo tính duy nhất
-                    for k, v in data_dict.items():
-                        field_name_check = display_name_map.get(k, k)
+                if package_aggregate:
+                    data_html = ""
+                    for _, field_name, values_str in package_aggregate.preview_rows:
+                        data_html += f"<div><strong>{html.escape(field_name)}: {html.escape(values_str)}</strong></div>"
+                    text_html_content += data_html
 
-                        # Kiểm tra tên trường để loại bỏ qr code, nhưng gộp text của barcode
-                        field_name_check_lower = str(field_name_check).lower()
-                        if 'qr code' in field_name_check_lower: continue
-
-                        if k not in aggregated_data_for_print: aggregated_data_for_print[k] = []
-
-                        str_v = str(v)
-                        if str_v not in aggregated_data_for_print[k]: # Chỉ thêm giá trị unique
-                            aggregated_data_for_print[k].append(str_v)
-
-                        # Gộp cho DỮ LIỆU PREVIEW (để hiển thị)
-                        if k not in aggregated_data_for_preview: aggregated_data_for_preview[k] = []
-                        if str_v not in aggregated_data_for_preview[k]:
-                            aggregated_data_for_preview[k].append(str_v)
-
-                # Hiển thị dữ liệu đã gộp VÀ CẬP NHẬT BIẾN DỮ LIỆU
-                text_html_content += '<div style="font-size: 0.9em; margin-top: 5px; padding-top: 3px;">'
-
-                # Hiển thị các trường data đã gộp (cho preview)
-                if aggregated_data_for_preview:
-                    data_html = ""
-                    for k in sorted(aggregated_data_for_preview.keys()): # Sắp xếp key
-                        v_list = aggregated_data_for_preview[k]
-                        v_list.sort() # Sắp xếp value
-
-                        field_name = display_name_map.get(k, k) 
-                        values_str = ", ".join(v_list)
-                        data_html += f"<div><strong>{html.escape(field_name)}: {html.escape(values_str)}</strong></div>"
-                        
-                        # Cập nhật dữ liệu gộp vào dict preview
-                        final_package_data_for_preview[k] = values_str 
-                
-                    text_html_content += data_html
-
-                text_html_content += "</div>"
+                text_html_content += "</div>"
 
                 # === THIẾT LẬP DỮ LIỆU IN CUỐI CÙNG CHO PACKAGE LABEL ===
-                
-                # 1. Chuyển đổi dữ liệu in (list) thành string
-                final_aggregated_data_for_print = {}
-                for k, v_list in aggregated_data_for_print.items():
-                    v_list.sort()
-                    final_aggregated_data_for_print[k] = ", ".join(v_list)
-
-                # 2. Gán CHỈ dữ liệu đã gộp cho label_info
-                label_info = final_aggregated_data_for_print
+                # Gán CHỈ dữ liệu đã gộp cho label_info
+                label_info = package_aggregate.print_data if package_aggregate else {}
                 
                 # 3. Xóa tất cả QR Code và Barcode (vì không lấy từ form mới)
                 qr_codes = []
                 qr_field_codes = []
                 barcodes_1d = []
                 barcode_1d_field_codes = []
+                gs1_128_codes = []
+                gs1_datamatrix_codes = []
 
             else:
                 # LOGIC HIỂN THỊ PREVIEW TIÊU CHUẨN (CHO ITEM/CARTON LABEL)
-                # Gán dict cơ sở cho label_info
-                label_info = base_label_info 
+                # Gán dict cơ sở cho label_info (kèm chuỗi GS1 đã dựng từ template)
+                label_info = {**base_label_info, **gs1_values} if gs1_values else base_label_info
                 
                 for key in all_display_fields:
 
@@ -871,7 +690,7 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
             
             # Đổi tên biến để bao gồm cả QR và Barcode
             image_html_block = ""
-            if qr_codes or barcodes_1d:
+            if qr_codes or barcodes_1d or gs1_128_codes or gs1_datamatrix_codes:
                 all_images_html_list = []
                 
                 if qr_codes:
@@ -890,15 +709,28 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                         all_images_html_list.append(
                             f'<img src="data:image/png;base64,{qr_image_b64}" style="width: {qr_width_px}px; height: auto;">'
                         )
+
+                if gs1_datamatrix_codes:
+                    # Preview không vẽ DataMatrix, chỉ giữ chỗ kèm dữ liệu (mã thật do máy in tạo bằng ^BX)
+                    dm_width_px = int(qr_width_mm * px_per_mm)
+                    for elements in gs1_datamatrix_codes:
+                        all_images_html_list.append(
+                            f'<div style="width: {dm_width_px}px; height: {dm_width_px}px; border: 1px dashed #555; font-size: 8pt; word-wrap: break-word; overflow: hidden; display: flex; align-items: center; justify-content: center; text-align: center;">'
+                            f'GS1 DataMatrix<br>{html.escape(gs1_svc.to_human_readable(elements))}'
+                            f'</div>'
+                        )
                 
-                if barcodes_1d: # Thêm logic tạo 1D barcode
+                if barcodes_1d or gs1_128_codes: # Thêm logic tạo 1D barcode
                     bc_width_px = int(barcode_1d_width_mm * px_per_mm)
                     bc_height_px = int(barcode_1d_height_mm * px_per_mm)
+
+                    barcode_items = [('code128', bc_content) for bc_content in barcodes_1d]
+                    barcode_items += [('gs1_128', "".join(ai + value for ai, value in elements)) for elements in gs1_128_codes]
                     
-                    for bc_content_item in barcodes_1d:
+                    for barcode_class_name, bc_content_item in barcode_items:
                         try:
-                            # Sử dụng Code 128 làm mặc định vì nó mạnh mẽ
-                            BARCODE_CLASS = barcode.get_barcode_class('code128')
+                            # Sử dụng Code 128 làm mặc định vì nó mạnh mẽ (GS1-128 cho field GS1)
+                            BARCODE_CLASS = barcode.get_barcode_class(barcode_class_name)
                             
                             options = {
                                 'module_height': barcode_1d_height_mm, # Chiều cao tính bằng mm
@@ -908,7 +740,7 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                                 'write_text': False # Ẩn văn bản
                             }
                             
-                            bc = BARCODE_CLASS(str(bc_content_item), writer=ImageWriter())
+                            bc = BARCODE_CLASS(str(bc_content_item), writer=barcode_writer.ImageWriter())
                             
                             buffered = BytesIO()
                             bc.write(buffered, options) # Ghi vào buffer
@@ -964,6 +796,65 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
             
             st.markdown(label_html, unsafe_allow_html=True)
 
+            # === KHỞI TẠO BẢN ĐỒ TÊN (NAME MAP) TỔNG HỢP ===
+
+            field_code_to_name = labels_svc.get_system_field_map()
+
+            # Tải và cập nhật các trường ĐỘNG (từ get_label_content_fields)
+            # Các trường này sẽ GHI ĐÈ tên mặc định nếu 'field_code' bị trùng.
+            db_fields = {
+                f.get('field_code'): f.get('field_name') 
+                for f in content_fields_for_preview 
+                if f.get('field_code') and f.get('field_name')
+            }
+            field_code_to_name.update(db_fields)
+
+            num_copies = max(1, int(number_of_labels))
+            qr_field_names = [field_code_to_name.get(code, code) for code in qr_field_codes]
+            ezpx_data = printer_svc.generate_ezpx_xml(
+                label_type_name=lt_name, label_data=label_info,
+                qr_codes=qr_codes, qr_field_names=qr_field_names,
+                paper_width_mm=paper_width, paper_height_mm=paper_height,
+                font_size_pt=font_size,
+                margins_mm=(margin_top, margin_bottom, margin_left, margin_right),
+                qr_size_mm=(qr_width_mm, qr_height_mm), num_copies=num_copies
+            )
+            
+            st.download_button(
+                label="💾 Save Label (EZPX)", data=ezpx_data,
+                file_name=f"{lt_name.replace(' ', '_')}.ezpx", mime="application/xml",
+                key="layout_save_ezpx"
+            )
+
+        # Fragment in đọc bố cục này khi bấm Print, không cần chạy lại phần preview
+        st.session_state.label_layout = {
+            "label_info": label_info,
+            "label_size": f"{paper_width}x{paper_height}mm",
+            "zpl_options": dict(
+                qr_codes=qr_codes, 
+                qr_field_codes=qr_field_codes,
+                paper_width_mm=paper_width, 
+                paper_height_mm=paper_height,
+                font_size_pt=font_size,
+                margins_mm=(margin_top, margin_bottom, margin_left, margin_right),
+                qr_size_mm=(qr_width_mm, qr_height_mm),
+                barcodes_1d=barcodes_1d,
+                barcode_1d_field_codes=barcode_1d_field_codes,
+                barcode_1d_size_mm=(barcode_1d_width_mm, barcode_1d_height_mm),
+                text_orientation=text_orientation,
+                display_name_map=field_code_to_name,
+                gs1_128_codes=gs1_128_codes,
+                gs1_datamatrix_codes=gs1_datamatrix_codes
+            ),
+        }
+
+    @st.fragment
+    @session_state_mgr.timed_rerun("print actions")
+    def render_print_actions(
+        selected_requirement, product_info, customer_id, entity_id,
+        label_template, number_of_labels, qty_per_carton, content_fields_for_preview
+    ):
+        # Chọn máy in / bấm Print chỉ chạy lại phần này; dữ liệu và bố cục lấy từ label_layout
         st.markdown("---")
 
         col_printer, col_copies = st.columns([3, 1])
@@ -981,32 +872,33 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                 "🖨️ Select printer:",
                 printers,
                 index=godex_printer_index if godex_printer_index is not None else 0,
+                key="print_printer",
                 help="Danh sách máy in đã được cài đặt trên máy tính Windows của bạn"
             )
             if not printers:
                 st.warning("Printer not found. Please install printer driver", icon="🚨")
         
         with col_copies:
-            num_copies = st.number_input("Copies", min_value=1, value=max(1, int(number_of_labels)), step=1, disabled=True)
+            # Số bản in lấy từ Number of Labels; ô này chỉ hiển thị (widget có key sẽ giữ giá trị cũ)
+            num_copies = max(1, int(number_of_labels))
+            st.number_input("Copies", min_value=1, value=num_copies, step=1, disabled=True)
+            unique_carton_serials = False
+            if label_template == "CARTON_LABEL" and selected_requirement:
+                unique_carton_serials = st.checkbox(
+                    "Unique carton numbers",
+                    value=False,
+                    key="print_unique_carton_serials",
+                    help="Mỗi nhãn thùng được in một số thứ tự riêng, liên tục theo Customer + Label Requirement"
+                )
         
         st.write("") 
 
-        # === KHỞI TẠO BẢN ĐỒ TÊN (NAME MAP) TỔNG HỢP ===
-
-        field_code_to_name = labels_svc.get_system_field_map()
-
-        # Tải và cập nhật các trường ĐỘNG (từ get_label_content_fields)
-        # Các trường này sẽ GHI ĐÈ tên mặc định nếu 'field_code' bị trùng.
-        db_fields = {
-            f.get('field_code'): f.get('field_name') 
-            for f in content_fields_for_preview 
-            if f.get('field_code') and f.get('field_name')
-        }
-        field_code_to_name.update(db_fields)
-        
-        col1_btn, col2_btn, col3_btn = st.columns([2, 2, 2]) 
+        col1_btn, col2_btn = st.columns(2)
         with col1_btn:
-            st.button("⬅️ Back to Select Product", on_click=switch_to_select_product_tab, width='stretch')
+            if st.button("⬅️ Back to Select Product", key="print_back_button", width='stretch'):
+                # Nút trong fragment chỉ chạy lại fragment: đổi tab cần chạy lại cả trang
+                switch_to_select_product_tab()
+                st.rerun(scope="app")
         
         with col2_btn:
             st.button(
@@ -1016,25 +908,11 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                 key="print_button",
                 width='stretch'
             )
-        
-        with col3_btn:
-            qr_field_names = [field_code_to_name.get(code, code) for code in qr_field_codes]
-            ezpx_data = printer_svc.generate_ezpx_xml(
-                label_type_name=lt_name, label_data=label_info,
-                qr_codes=qr_codes, qr_field_names=qr_field_names,
-                paper_width_mm=paper_width, paper_height_mm=paper_height,
-                font_size_pt=font_size,
-                margins_mm=(margin_top, margin_bottom, margin_left, margin_right),
-                qr_size_mm=(qr_width_mm, qr_height_mm), num_copies=num_copies
-            )
-            
-            st.download_button(
-                label="💾 Save Label (EZPX)", data=ezpx_data,
-                file_name=f"{lt_name.replace(' ', '_')}.ezpx", mime="application/xml",
-                width='stretch'
-            )
 
-        if st.session_state.get("print_button"):
+        layout = st.session_state.get("label_layout")
+        if st.session_state.get("print_button") and layout:
+            label_info = layout["label_info"]
+            zpl_options = layout["zpl_options"]
 
             # Kiểm tra xem đây có phải là trường hợp in PACKAGE_LABEL từ History không
             is_package_print_from_history = (
@@ -1042,7 +920,22 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                 st.session_state.get("is_package_from_history", False)
             )
 
+            package_sscc = None
             if is_package_print_from_history:
+                # Cấp SSCC cho package (nếu đã cấu hình GS1), in và lưu cùng dữ liệu đã gộp
+                if packaging_svc.is_sscc_enabled():
+                    try:
+                        package_sscc = packaging_svc.next_sscc()
+                        label_info = {**label_info, 'sscc': package_sscc}
+                        # Mã vạch GS1-128 (00) SSCC để máy quét ở kho nhận đọc được
+                        if package_sscc:
+                            zpl_options = {
+                                **zpl_options,
+                                "gs1_128_codes": list(zpl_options.get("gs1_128_codes") or []) + [(("00", package_sscc),)]
+                            }
+                    except Exception as e:
+                        logger.error(f"SSCC allocation failed: {e}")
+                        st.warning("Could not allocate an SSCC for this package. Printing without SSCC.")
                 all_display_fields = list(label_info.keys())
             
             else:
@@ -1051,25 +944,38 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                     if field.get('field_code'):
                         all_display_fields.append(field.get('field_code'))
 
-            zpl_commands = printer_svc.generate_zpl_commands( 
-                label_data=label_info,
-                qr_codes=qr_codes, 
-                qr_field_codes=qr_field_codes,
-                paper_width_mm=paper_width, 
-                paper_height_mm=paper_height,
-                font_size_pt=font_size,
-                margins_mm=(margin_top, margin_bottom, margin_left, margin_right),
-                qr_size_mm=(qr_width_mm, qr_height_mm),
-                barcodes_1d=barcodes_1d,
-                barcode_1d_field_codes=barcode_1d_field_codes,
-                barcode_1d_size_mm=(barcode_1d_width_mm, barcode_1d_height_mm),
-                num_copies=num_copies,
-                field_order=all_display_fields,
-                text_orientation=text_orientation,
-                display_name_map=field_code_to_name
-            )
+            carton_serials = None
+            if unique_carton_serials:
+                # Dành riêng một dải số thùng liên tục (một lần cập nhật DB), sinh ZPL cho từng nhãn
+                try:
+                    carton_serials = serials_svc.get_serial_allocator(customer_id, selected_requirement.get('id')).allocate(num_copies)
+                except Exception as e:
+                    logger.error(f"Carton serial allocation failed: {e}")
+                    st.error("Could not allocate carton numbers. Please try again.")
+                    st.stop()
+
+            if carton_serials is not None:
+                zpl_stream = printer_svc.generate_zpl_batch(
+                    label_data=label_info,
+                    per_label_values=(serials_svc.format_serial(n) for n in carton_serials),
+                    per_label_field_code=serials_svc.CARTON_SERIAL_FIELD,
+                    field_order=all_display_fields,
+                    **zpl_options
+                )
+                success, message = printer_svc.send_raw_stream_to_printer(selected_printer, zpl_stream)
 
-            success, message = printer_svc.send_raw_data_to_printer(selected_printer, zpl_commands)
+                # Lịch sử lưu dải số thùng đã in
+                label_info = {**label_info, serials_svc.CARTON_SERIAL_FIELD: serials_svc.format_serial_range(carton_serials)}
+                if serials_svc.CARTON_SERIAL_FIELD not in all_display_fields:
+                    all_display_fields = all_display_fields + [serials_svc.CARTON_SERIAL_FIELD]
+            else:
+                zpl_commands = printer_svc.generate_zpl_commands(
+                    label_data=label_info,
+                    num_copies=num_copies,
+                    field_order=all_display_fields,
+                    **zpl_options
+                )
+                success, message = printer_svc.send_raw_data_to_printer(selected_printer, zpl_commands)
 
             print_status = "SUCCESS" if success else "FAILED"
             error_msg = message if not success else None
@@ -1105,7 +1011,7 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
                 "pt_code": product_info.get('pt_code'),
                 "selling_quantity": product_info.get('total_selling_qty'),
                 "standard_quantity": qty_per_carton if label_template in ["CARTON_LABEL", "ITEM_LABEL"] else 1,
-                "label_size": f"{paper_width}x{paper_height}mm",
+                "label_size": layout["label_size"],
                 "printed_data": filtered_printed_data, # Dict chứa TẤT CẢ dữ liệu đã in
                 "print_status": print_status,
                 
@@ -1119,12 +1025,262 @@ elif tab_selection == "👁️‍🗨️ Preview and Create Label":
 
             if not hist_success:
                 st.error(f"LỖI LƯU LỊCH SỬ: {hist_msg}")
+            elif is_package_print_from_history and success:
+                # Ghi nhận các thùng con thuộc package vừa in (cấu trúc đóng gói)
+                pkg_success, pkg_msg, _ = packaging_svc.record_package_from_history(
+                    child_history_ids=session_state_mgr.get("package_history_ids", ()),
+                    print_history_id=new_hist_id,
+                    customer_id=customer_id,
+                    entity_id=entity_id,
+                    created_by=printed_by_user,
+                    sscc=package_sscc
+                )
+                if not pkg_success:
+                    st.warning(f"Package printed but packaging structure was not saved: {pkg_msg}")
             
             if success:
                 st.success(message)
             else:
                 st.error(message)
 
+
+
+    if st.session_state.product_for_label:
+        product_info = st.session_state.product_for_label
+        customer_id = st.session_state.get('customer_id_for_label')
+        entity_id = st.session_state.get('entity_id_for_label')
+        requirement_bundles = labels_svc.get_requirement_bundles(customer_id)
+        label_requirements = [bundle.requirement for bundle in requirement_bundles.values()]
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.subheader("📃 Product Information")
+            with st.container(border=True):
+                c1_info, c2_info = st.columns(2)
+                with c1_info:
+                    st.text_input("Customer", value=product_info.get('customer', 'N/A'), disabled=True)
+                    st.text_input("DN Number", value=product_info.get('dn_number', 'N/A'), disabled=True)
+                    st.text_input("Vendor Product Code", value=product_info.get('product_mapped_code', 'N/A'), disabled=True)
+                    st.text_input("PT Code", value=product_info.get('pt_code', 'N/A'), disabled=True)
+                    st.text_input("Package Size", value=product_info.get('package_size', 'N/A'), disabled=True)
+                    st.text_input("Total Standard Qty", value=product_info.get('total_standard_qty', 'N/A'), disabled=True)
+                    st.text_input("Brand", value=product_info.get('brand', 'N/A'), disabled=True)
+                with c2_info:
+                    st.text_input("Entity", value=product_info.get('legal_entity', 'N/A'), disabled=True)
+                    st.text_input("Product Code", value=product_info.get('product_pn', 'N/A'), disabled=True)
+                    st.text_input("Vendor Product Name", value=product_info.get('product_mapped_name', 'N/A'), disabled=True)
+                    st.text_input("Batch No", value=product_info.get('batch_no', 'N/A'), disabled=True)
+                    st.text_input("Shelf Life", value=product_info.get('shelf_life', 'N/A'), disabled=True)
+                    st.text_input("Total Selling Qty", value=product_info.get('total_selling_qty', 'N/A'), disabled=True)
+                    st.text_input("UOM", value=product_info.get('uom', 'N/A'), disabled=True)
+
+        number_of_labels = 0
+        qty_per_carton = 1
+        form_data = {}
+        content_fields = []
+
+        with col2:
+            st.subheader("🎫 Customer Label Requirements")
+
+            selected_requirement = None
+
+            if label_requirements:
+                if len(label_requirements) > 1:
+                    requirement_options = {
+                        f"{req['requirement_name']} ({req['requirement_type']})": req
+                        for req in label_requirements
+                    }
+                    selected_option_key = st.selectbox(
+                        "Select a label requirement:",
+                        options=requirement_options.keys()
+                    )
+                    selected_requirement = requirement_options[selected_option_key]
+                else:
+                    selected_requirement = label_requirements[0]
+
+            if selected_requirement:
+                with st.container(border=True):
+                    req_col1, req_col2 = st.columns(2)
+                    with req_col1:
+                        st.text_input("Label Name", value=selected_requirement.get('requirement_name', 'N/A'), disabled=True, key="selected_req_name")
+                        st.text_input("Label Type", value=selected_requirement.get('requirement_type', 'N/A'), disabled=True, key="selected_req_type")
+                        st.text_input("Printer Dpi", value=selected_requirement.get('printer_dpi', 'N/A'), disabled=True, key="selected_req_dpi")
+                    with req_col2:
+                        st.text_input("Label Size", value=selected_requirement.get('label_size', 'N/A'), disabled=True, key="selected_req_size")
+                        st.text_input("Special Notes", value=selected_requirement.get('special_notes', 'N/A'), disabled=True, key="selected_req_notes")
+                        st.text_input("Printer Type", value=selected_requirement.get('printer_type', 'N/A'), disabled=True, key="selected_req_printer")
+            else:
+                st.warning("No existing Customer Label Requirements")
+
+        st.divider()
+
+        st.subheader("⌨️ Enter data for the label")
+
+        # Lấy cờ khóa (lock flag) ra ngoài để cả col1 (form) và col2 (settings) đều dùng được
+        is_locked_for_package = st.session_state.get("is_package_from_history", False)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if selected_requirement:
+                content_fields = load_content_fields_from_bundles(requirement_bundles, selected_requirement.get('id'))
+                render_label_form(selected_requirement, content_fields, product_info, is_locked_for_package)
+                form_data = st.session_state.get("label_form_data", {})
+        with col2:
+            with st.container(border=True):
+
+                label_type_options = ["ITEM_LABEL", "CARTON_LABEL", "PACKAGE_LABEL"]
+                default_index = 0
+                
+                if is_locked_for_package:
+                    # 1. Ưu tiên cao nhất: Khóa nếu là package từ history
+                    default_index = label_type_options.index("PACKAGE_LABEL")
+                    # Xóa cờ "override" dùng một lần nếu có, vì cờ "is_locked" đã thay thế
+                    if 'default_label_type_override' in st.session_state:
+                        del st.session_state.default_label_type_override
+                
+                elif 'default_label_type_override' in st.session_state and st.session_state.default_label_type_override in label_type_options:
+                    # 2. Ưu tiên nhì: Tín hiệu 1 lần (nếu có, mặc dù Tab 3 set cả 2)
+                    default_index = label_type_options.index(st.session_state.default_label_type_override)
+                    # Xóa tín hiệu để không bị dính cho lần sau
+                    del st.session_state.default_label_type_override
+                
+                elif selected_requirement: 
+                    # 3. Mặc định: Lấy từ requirement
+                    default_label_type = selected_requirement.get('requirement_type')
+                    if default_label_type in label_type_options:
+                        default_index = label_type_options.index(default_label_type)
+
+                label_template = st.selectbox(
+                    "Label Type:",
+                    options=label_type_options,
+                    index=default_index,
+                    disabled=is_locked_for_package
+                )
+
+                total_selling_qty = int(product_info.get('total_selling_qty', 0))
+
+                if label_template == "ITEM_LABEL" or label_template == "CARTON_LABEL":
+                    qty_per_carton_value = int(product_info.get('total_standard_qty', 1))
+                    qty_per_carton = st.number_input(
+                        "Quantity Per Carton:",
+                        min_value=1,
+                        max_value=total_selling_qty if total_selling_qty > 0 else 1,
+                        value=qty_per_carton_value,
+                        help=f"Nhập số lượng sản phẩm trong một thùng / một pcs. Tối đa: {total_selling_qty}"
+                    )
+                    ceil_value = math.ceil(total_selling_qty / qty_per_carton) if qty_per_carton > 0 else 0
+                    floor_value = math.floor(total_selling_qty / qty_per_carton) if qty_per_carton > 0 else 0
+                    if ceil_value == floor_value or floor_value == 0:
+                        number_of_labels = st.number_input(
+                            "Number of Labels:",
+                            value=ceil_value,
+                            disabled=True,
+                            help="Số lượng thùng được tính tự động bằng công thức total_selling_quantity / Quantity Per Carton"
+                        )
+                    else:
+                        st.caption("Due to odd products, please select the number of boxes to print labels")
+                        number_of_labels = st.radio(
+                            "Select the number of labels:",
+                            options=[floor_value, ceil_value],
+                            index=1,
+                            format_func=lambda x: f"{x} labels (Round down)" if x == floor_value else f"{x} labels (Round up)",
+                            horizontal=True
+                        )
+                else: # PACKAGE_LABEL
+                    number_of_labels = st.number_input(
+                        "Number of Label:",
+                        min_value=1,
+                        value=1,
+                        disabled=True,
+                        help="Với 'PACKAGE_LABEL', số lượng nhãn luôn là 1"
+                    )
+
+        if st.button("👁️ Preview Label", type="primary", width='stretch'):
+
+            errors = {}
+            
+            if label_template != "PACKAGE_LABEL":
+                data_for_validation = {
+                    field.get('field_name'): form_data.get(field.get('field_code'))
+                    for field in content_fields
+                }
+                
+                errors = form_builder_svc.validate_form(data_for_validation, content_fields)
+            
+            if errors:
+                error_messages = []
+                for field_name, message in errors.items():
+                    error_messages.append(f"- **{field_name}** {message}")
+                st.warning("Please check the form again:\n" + "\n".join(error_messages), icon="🚨")
+            else:
+                st.session_state.temp_label_form_data = form_data
+                st.session_state.temp_label_settings = {
+                    "label_type": label_template, 
+                    "number_of_labels": number_of_labels
+                }
+                st.session_state.temp_content_fields_map = {
+                    f.get('field_code'): f.get('field_name') for f in content_fields
+                }
+                review_label_modal.open()
+
+        # Hiển thị modal review
+        if review_label_modal.is_open():
+            with review_label_modal.container():
+                
+                # Lấy dữ liệu tạm thời
+                form_data_review = st.session_state.get('temp_label_form_data', {})
+                settings_review = st.session_state.get('temp_label_settings', {})
+                field_map_review = st.session_state.get('temp_content_fields_map', {})
+
+                st.subheader("⌨️ Label Data")
+                with st.container(border=True):
+                    col_set1, col_set2 = st.columns(2)
+                    with col_set1:
+                        st.text_input("Label Type", value=settings_review.get('label_type', 'N/A'), disabled=True, key="modal_label_type")
+                    with col_set2:
+                        st.text_input("Number of Labels", value=settings_review.get('number_of_labels', 'N/A'), disabled=True, key="modal_num_labels")
+                if form_data_review:
+                    display_data = []
+                    for field_code, value in form_data_review.items():
+                        field_name = field_map_review.get(field_code, field_code) 
+                        display_data.append({"Field": field_name, "Data": str(value)})
+                    
+                    st.dataframe(pd.DataFrame(display_data), hide_index=True, width='stretch')
+                else:
+                    st.warning("No additional data is entered", icon="🚨")
+                
+                st.divider()
+
+                modal_col1, modal_col2 = st.columns(2)
+                with modal_col1:
+                    st.button(
+                        "✅ Confirm & Update Preview", 
+                        type="primary", 
+                        width='stretch',
+                        on_click=confirm_label_and_update_preview
+                    )
+                with modal_col2:
+                    if st.button("❌ Cancel", width='stretch'):
+                        st.session_state.temp_label_form_data = {}
+                        st.session_state.temp_label_settings = {}
+                        st.session_state.temp_content_fields_map = {}
+                        review_label_modal.close()
+
+        st.divider()
+        
+        st.header("👁️‍🗨️ Preview & Customize Layout")
+
+        st.divider()
+
+        content_fields_for_preview = load_content_fields_from_bundles(requirement_bundles, selected_requirement.get('id')) if selected_requirement else ()
+
+        render_label_layout(selected_requirement, content_fields_for_preview, number_of_labels)
+
+        render_print_actions(
+            selected_requirement, product_info, customer_id, entity_id,
+            label_template, number_of_labels, qty_per_carton, content_fields_for_preview
+        )
+
     else:
         st.warning("No products selected yet. Please return to tab '📦 Select Product' to get started", icon="🚨") 
         st.button("⬅️ Back to Select Product", on_click=switch_to_select_product_tab)
@@ -1219,6 +1375,63 @@ elif tab_selection == "⌛ History Label Printing":
     status_filter_val = status_filter if status_filter != "All" else None
     label_type_filter_val = label_type_filter if label_type_filter != "All" else None
 
+    # Export lịch sử: đọc DB theo từng khối, không cần tải toàn bộ grid
+    with st.expander("📤 Export History"):
+        exp_col1, exp_col2 = st.columns([1, 2])
+        with exp_col1:
+            export_format = st.selectbox(
+                "File Format",
+                history_export_svc.get_available_export_formats(),
+                key="history_export_format"
+            )
+        with exp_col2:
+            st.caption("The export uses the filters above. Large exports are uploaded to file storage and a download link is provided instead.")
+
+        if st.button("📤 Prepare Export", key="history_export_button"):
+            with st.spinner("Exporting label print history..."):
+                ok, msg, export_file, row_count = history_export_svc.build_history_export(
+                    export_format,
+                    start_date=start_date,
+                    end_date=end_date,
+                    customer_id=customer_id_filter_val,
+                    entity_id=entity_id_filter_val,
+                    dn_number=dn_filter_val,
+                    pt_code=pt_code_filter_val,
+                    print_status=status_filter_val,
+                    label_type=label_type_filter_val
+                )
+
+            if not ok:
+                st.error(msg)
+            elif row_count == 0:
+                export_file.close()
+                st.info("No records were found matching the search criteria")
+            else:
+                file_name = history_export_svc.get_export_file_name(export_format, start_date, end_date)
+                export_size = history_export_svc.get_export_size(export_file)
+
+                if export_size <= history_export_svc.BROWSER_EXPORT_MAX_BYTES:
+                    # st.download_button không nhận SpooledTemporaryFile: đọc ra bytes rồi đóng file
+                    try:
+                        export_bytes = export_file.read()
+                    finally:
+                        export_file.close()
+                    st.download_button(
+                        label=f"💾 Download {file_name} ({row_count} rows)",
+                        data=export_bytes,
+                        file_name=file_name,
+                        mime=history_export_svc.EXPORT_FORMATS[export_format][1],
+                        key="history_export_download"
+                    )
+                else:
+                    with st.spinner("Uploading export to file storage..."):
+                        uploaded, result = history_export_svc.upload_history_export(export_file, export_format, file_name)
+                    export_file.close()
+                    if uploaded:
+                        st.success(f"Export is ready ({row_count} rows). [Download {file_name}]({result}) (link valid for 1 hour)")
+                    else:
+                        st.error(result)
+
     history_data = fetch_history_data(
         start_date=start_date,
         end_date=end_date,
@@ -1234,6 +1447,7 @@ elif tab_selection == "⌛ History Label Printing":
         df_history = pd.DataFrame(history_data)
 
         display_columns = [
+            'id',
             'printed_date', 
             'customer_name', 
             'legal_entity',
@@ -1255,7 +1469,7 @@ elif tab_selection == "⌛ History Label Printing":
 
         st.success(f"Found {len(df_display)} results")
 
-        gb = GridOptionsBuilder.from_dataframe(df_display)
+        gb = st_aggrid.GridOptionsBuilder.from_dataframe(df_display)
 
         is_customer_selected = customer_id_filter_val is not None
 
@@ -1296,15 +1510,18 @@ elif tab_selection == "⌛ History Label Printing":
         # Định dạng cột JSON
         gb.configure_column("printed_data", headerName="Printed Data", width=300)
 
+        # Cột id ẩn: dòng được chọn vẫn mang id lịch sử để gộp dữ liệu cho package label
+        gb.configure_column("id", hide=True)
+
         gridOptions = gb.build()
 
         if not is_customer_selected or not is_entity_selected or not label_type_filter_val == 'CARTON_LABEL':
             st.info("ℹ️ Please select a customer, entity and label type CARTON_LABEL to be able to select labels")
 
-        grid_response_history = AgGrid(
+        grid_response_history = st_aggrid.AgGrid(
             df_display,
             gridOptions=gridOptions,
-            data_return_mode=DataReturnMode.AS_INPUT,
+            data_return_mode=st_aggrid.DataReturnMode.AS_INPUT,
             update_on=['selectionChanged'], 
             fit_columns_on_grid_load=False,
             height=500,
@@ -1335,11 +1552,18 @@ elif tab_selection == "⌛ History Label Printing":
         if st.session_state.get("create_package_label_hist"):
             # 1. Lấy dữ liệu đã chọn
             if isinstance(selected_rows_data, pd.DataFrame):
-                selected_df = selected_rows_data
+                selected_grid_df = selected_rows_data
             elif isinstance(selected_rows_data, list):
-                selected_df = pd.DataFrame(selected_rows_data)
+                selected_grid_df = pd.DataFrame(selected_rows_data)
             else:
-                selected_df = pd.DataFrame()
+                selected_grid_df = pd.DataFrame()
+
+            # Đối chiếu id (cột ẩn của grid) về df_history: dùng bản ghi gốc với đúng kiểu dữ liệu
+            selected_ids = pd.to_numeric(selected_grid_df['id'], errors='coerce') if 'id' in selected_grid_df.columns else []
+            selected_df = df_history[df_history['id'].isin(selected_ids)]
+
+            if selected_df.empty and not selected_grid_df.empty:
+                st.error("Could not match the selected rows to print history records. Please reload and select again.")
 
             if not selected_df.empty:
                 # 2. Lấy Customer ID (đã được chọn trong bộ lọc)
@@ -1358,21 +1582,16 @@ elif tab_selection == "⌛ History Label Printing":
                     total_sel_qty_sum = 1
 
                 # 3. Tổng hợp dữ liệu để "giả lập" một product_info cho Tab 2
-                package_product_info = {
-                    'customer': customer_name_for_pkg,
-                    'legal_entity': ', '.join(selected_df['legal_entity'].astype(str).unique()),
-                    'dn_number': ', '.join(selected_df['dn_number'].astype(str).unique()),
-                    'product_pn': ', '.join(selected_df['product_pn'].astype(str).unique()),
-                    'product_mapped_code': 'N/A',
-                    'product_mapped_name': 'N/A',
-                    'pt_code': ', '.join(selected_df['pt_code'].astype(str).unique()),
-                    'batch_no': 'N/A',
-                    'package_size': 'N/A',
-                    'shelf_life': 'N/A',
-                    'total_standard_qty': total_std_qty_sum, 
-                    'total_selling_qty': total_sel_qty_sum, 
-                    'brand': 'N/A'
-                }
+                package_product_info = ProductLine(
+                    customer=customer_name_for_pkg,
+                    legal_entity=', '.join(selected_df['legal_entity'].astype(str).unique()),
+                    dn_number=', '.join(selected_df['dn_number'].astype(str).unique()),
+                    product_pn=', '.join(selected_df['product_pn'].astype(str).unique()),
+                    pt_code=', '.join(selected_df['pt_code'].astype(str).unique()),
+                    shelf_life='N/A',
+                    total_standard_qty=total_std_qty_sum,
+                    total_selling_qty=total_sel_qty_sum
+                )
                 
                 # 4. Cập nhật session_state để Tab 2 sử dụng
                 st.session_state.product_for_label = package_product_info
@@ -1380,14 +1599,15 @@ elif tab_selection == "⌛ History Label Printing":
                 st.session_state.entity_id_for_label = entity_id_for_pkg
 
                 # Đặt lại label_preview_data với thông tin cơ bản này
-                st.session_state.label_preview_data = package_product_info.copy()
-
-                # Lấy danh sách các hàng đã chọn
-                selected_rows_list = selected_df.to_dict('records')
+                session_state_mgr.put("label_preview_data", package_product_info)
 
                 # Đặt cờ và dữ liệu cho chế độ preview đặc biệt
+                # Chỉ giữ id các bản ghi đã chọn, Tab 2 gộp printed_data qua package_aggregation
                 st.session_state.is_package_from_history = True
-                st.session_state.package_history_data = selected_rows_list
+                session_state_mgr.put(
+                    "package_history_ids",
+                    tuple(sorted(int(h) for h in selected_df['id'].tolist()))
+                )
 
                 # GỬI TÍN HIỆU qua Tab 2 để tự động chọn "PACKAGE_LABEL"
                 st.session_state.default_label_type_override = "PACKAGE_LABEL"
@@ -1405,4 +1625,8 @@ elif tab_selection == "⌛ History Label Printing":
                 st.caption("ℹ️ *Please select at least one row in the grid to create a Package Label.*")
 
     else:
-        st.info("No records were found matching the search criteria")
\ No newline at end of file
+        st.info("No records were found matching the search criteria")
+
+# Bộ nhớ session và thời gian chạy lại (chỉ hiển thị cho admin)
+session_state_mgr.record_rerun_time("page", time.perf_counter() - page_run_started)
+session_state_mgr.render_memory_panel()
@@ -0,0 +1,139 @@
+# pages/4_📊_Print_Statistics.py
+
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta
+from services import labels_v2 as labels_svc
+from services import print_stats as print_stats_svc
+from utils.auth import AuthManager
+
+# Authentication check
+auth_manager = AuthManager()
+if not auth_manager.require_auth():
+    st.stop()
+
+st.set_page_config(layout="wide")
+st.title("📊 Label Printing Statistics")
+st.caption("Số liệu được đọc từ bảng tổng hợp theo ngày (label_print_daily_stats)")
+
+@st.cache_data(ttl=600)
+def load_customers_for_stats():
+    all_customers = [{"customer_id": None, "customer_english_name": "All customers", "customer_code": ""}]
+    all_customers.extend(labels_svc.get_active_customers())
+    return all_customers
+
+@st.cache_data(ttl=600)
+def load_entities_for_stats():
+    all_entities = [{"entity_id": None, "entity_english_name": "All entities", "entity_code": ""}]
+    all_entities.extend(labels_svc.get_active_entities())
+    return all_entities
+
+@st.cache_data(ttl=300)
+def load_daily_stats(start_date, end_date, customer_id, entity_id, label_type):
+    return print_stats_svc.get_daily_print_stats(
+        start_date=start_date,
+        end_date=end_date,
+        customer_id=customer_id,
+        entity_id=entity_id,
+        label_type=label_type
+    )
+
+with st.expander("🔍 Filter", expanded=True):
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        today = datetime.now().date()
+        date_range = st.date_input(
+            "Printed Date",
+            value=(today - timedelta(days=30), today),
+            key="stats_date_range"
+        )
+        start_date = date_range[0] if date_range and len(date_range) > 0 else today - timedelta(days=30)
+        end_date = date_range[1] if date_range and len(date_range) > 1 else today
+    with col2:
+        selected_customer = st.selectbox(
+            "Customer",
+            options=load_customers_for_stats(),
+            format_func=lambda c: f"{c['customer_english_name']}" + (f" ({c['customer_code']})" if c['customer_code'] else ""),
+            key="stats_customer"
+        )
+    with col3:
+        selected_entity = st.selectbox(
+            "Entity",
+            options=load_entities_for_stats(),
+            format_func=lambda c: f"{c['entity_english_name']}" + (f" ({c['entity_code']})" if c['entity_code'] else ""),
+            key="stats_entity"
+        )
+    with col4:
+        label_type_filter = st.selectbox("Label Type", ["All", "ITEM_LABEL", "CARTON_LABEL", "PACKAGE_LABEL"], key="stats_label_type")
+
+stats = load_daily_stats(
+    start_date,
+    end_date,
+    selected_customer.get('customer_id'),
+    selected_entity.get('entity_id'),
+    label_type_filter if label_type_filter != "All" else None
+)
+
+if stats:
+    df_stats = pd.DataFrame(stats)
+    df_stats['stat_date'] = pd.to_datetime(df_stats['stat_date'])
+
+    total_jobs = int(df_stats['jobs'].sum())
+    total_labels = int(df_stats['labels'].sum())
+    total_failures = int(df_stats['failures'].sum())
+
+    m_col1, m_col2, m_col3, m_col4 = st.columns(4)
+    with m_col1:
+        st.metric("Print Jobs", f"{total_jobs:,}")
+    with m_col2:
+        st.metric("Labels Printed", f"{total_labels:,}")
+    with m_col3:
+        st.metric("Failed Jobs", f"{total_failures:,}")
+    with m_col4:
+        st.metric("Failure Rate", f"{(total_failures / total_jobs * 100) if total_jobs else 0:.1f}%")
+
+    st.divider()
+
+    st.subheader("📈 Labels Printed per Day")
+    daily_by_type = df_stats.pivot_table(
+        index='stat_date', columns='label_type', values='labels', aggfunc='sum', fill_value=0
+    )
+    st.bar_chart(daily_by_type)
+
+    col_left, col_right = st.columns(2)
+    with col_left:
+        st.subheader("👥 By Customer")
+        by_customer = (
+            df_stats.groupby('customer_name', as_index=False)[['jobs', 'labels', 'failures']]
+            .sum()
+            .sort_values('labels', ascending=False)
+        )
+        st.dataframe(by_customer, hide_index=True, width='stretch')
+    with col_right:
+        st.subheader("🖨️ By Printer")
+        by_printer = (
+            df_stats.groupby('printer_name', as_index=False)[['jobs', 'labels', 'failures']]
+            .sum()
+            .sort_values('labels', ascending=False)
+        )
+        st.dataframe(by_printer, hide_index=True, width='stretch')
+
+    st.subheader("🚦 By Status")
+    by_status = df_stats.groupby(['label_type', 'print_status'], as_index=False)[['jobs', 'labels']].sum()
+    st.dataframe(by_status, hide_index=True, width='stretch')
+else:
+    st.info("No printing statistics for the selected period")
+
+# Tính lại số liệu tổng hợp từ lịch sử (chỉ admin)
+if st.session_state.get("user_role") == "admin":
+    st.divider()
+    with st.expander("🛠️ Rebuild Statistics"):
+        st.caption("Recalculate the daily rollup from label_print_history for the selected date range.")
+        if st.button("🔄 Rebuild", key="stats_rebuild"):
+            with st.spinner("Rebuilding statistics..."):
+                ok, msg, _ = print_stats_svc.rebuild_daily_print_stats(start_date, end_date)
+            if ok:
+                load_daily_stats.clear()
+                st.success(msg)
+            else:
+                st.error(msg)
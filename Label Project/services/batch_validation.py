@@ -0,0 +1,63 @@
+# services/batch_validation.py
+
+import logging
+from dataclasses import dataclass
+from typing import Any, Tuple
+import pandas as pd
+from services import field_mapping
+from services import validation
+
+logger = logging.getLogger(__name__)
+
+# Cột nhận diện dòng sản phẩm trong ma trận lỗi
+ROW_LABEL_COLUMNS = {'dn_number': 'DN', 'product_pn': 'Product Code', 'batch_no': 'Batch No'}
+
+
+@dataclass(frozen=True)
+class BatchValidationResult:
+    filled: pd.DataFrame            # dữ liệu nhãn tự điền (chưa định dạng), một dòng cho mỗi dòng sản phẩm
+    errors: pd.DataFrame            # ma trận lỗi gọn: chỉ các dòng/field có lỗi
+    manual_fields: Tuple[str, ...]  # field_code không có data_source, nhập tay khi in
+
+    @property
+    def error_count(self) -> int:
+        return int(self.errors.notna().sum().sum())
+
+    @property
+    def invalid_row_count(self) -> int:
+        return len(self.errors)
+
+
+def validate_product_lines(products: pd.DataFrame, content_fields: Tuple[Any, ...]) -> BatchValidationResult:
+    """
+    Kiểm tra trước toàn bộ dòng sản phẩm đã chọn với một requirement, trước khi in hàng loạt.
+
+    Dữ liệu nhãn được điền theo cột (field_mapping, gồm cả trường ngày tính toán) rồi qua
+    validator đã biên dịch của requirement theo cột. Chỉ kiểm tra các field điền được
+    từ dòng sản phẩm; field nhập tay được trả về riêng.
+    """
+    filled = field_mapping.fill_labels_for_products(products, content_fields, formatted=False)
+    validator = validation.get_validator(content_fields)
+    errors = validator.validate_frame(filled)
+
+    # Gọn: bỏ dòng và cột không có lỗi
+    errors = errors.dropna(how='all').dropna(axis=1, how='all')
+
+    manual_fields = tuple(
+        f.get('field_code') for f in content_fields
+        if f.get('field_code') and f.get('field_code') not in filled.columns
+    )
+
+    if not errors.empty:
+        logger.info(f"Batch validation found {int(errors.notna().sum().sum())} errors in {len(errors)} of {len(products)} product lines")
+
+    return BatchValidationResult(filled=filled, errors=errors, manual_fields=manual_fields)
+
+
+def error_matrix_for_display(result: BatchValidationResult, products: pd.DataFrame, content_fields: Tuple[Any, ...]) -> pd.DataFrame:
+    """Ma trận lỗi kèm cột nhận diện dòng sản phẩm, cột field đổi sang tên hiển thị."""
+    field_names = {f.get('field_code'): f.get('field_name') or f.get('field_code') for f in content_fields}
+    matrix = result.errors.fillna("").rename(columns=field_names)
+
+    labels = products.loc[result.errors.index, [c for c in ROW_LABEL_COLUMNS if c in products.columns]]
+    return pd.concat([labels.rename(columns=ROW_LABEL_COLUMNS), matrix], axis=1)
@@ -0,0 +1,278 @@
+# services/derived_fields.py
+
+import calendar
+import logging
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Optional, Tuple
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Trường ngày được tính từ data_source của content field, vd.
+#   "expiry = production_date + shelf_life months"
+#   "production_date + 24 months"
+#   "today + 180 days"
+# Giá trị tính ra là date (field DATE) hoặc chuỗi ISO; format_pattern được áp khi in (services.formatting).
+TODAY = "today"
+
+UNIT_DAYS = "days"
+UNIT_MONTHS = "months"
+
+# Đơn vị -> (đơn vị chuẩn, hệ số)
+_UNITS = {
+    "d": (UNIT_DAYS, 1), "day": (UNIT_DAYS, 1), "days": (UNIT_DAYS, 1), "ngày": (UNIT_DAYS, 1),
+    "w": (UNIT_DAYS, 7), "week": (UNIT_DAYS, 7), "weeks": (UNIT_DAYS, 7), "tuần": (UNIT_DAYS, 7),
+    "m": (UNIT_MONTHS, 1), "month": (UNIT_MONTHS, 1), "months": (UNIT_MONTHS, 1), "tháng": (UNIT_MONTHS, 1),
+    "y": (UNIT_MONTHS, 12), "year": (UNIT_MONTHS, 12), "years": (UNIT_MONTHS, 12), "năm": (UNIT_MONTHS, 12),
+}
+
+_EXPRESSION_PATTERN = re.compile(
+    r"^\s*(?:(?P<target>\w+)\s*=\s*)?"
+    r"(?P<base>\w+)"
+    r"(?:\s*(?P<sign>[+-])\s*(?P<amount>\w+)(?:\s+(?P<unit>\w+))?)?\s*$"
+)
+
+_DURATION_PATTERN = re.compile(r"(\d+)\s*(\w*)")
+
+# Token của format_pattern -> strftime, thử token dài trước
+_DATE_FORMAT_TOKENS = (
+    ("YYYY", "%Y"), ("YY", "%y"), ("MMM", "%b"), ("MM", "%m"), ("DD", "%d"),
+)
+_DATE_FORMAT_TOKEN_PATTERN = re.compile("|".join(token for token, _ in _DATE_FORMAT_TOKENS))
+_DATE_FORMAT_TOKEN_MAP = dict(_DATE_FORMAT_TOKENS)
+
+_DATE_INPUT_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+
+def parse_duration(value: Any, default_unit: str = "months") -> Optional[Tuple[int, str]]:
+    """
+    Đọc thời hạn (vd. shelf_life) thành (số lượng, UNIT_DAYS | UNIT_MONTHS).
+
+    Nhận số (đơn vị mặc định) hoặc chuỗi như '24 months', '2 years', '180 ngày'.
+    Trả về None nếu không đọc được hoặc <= 0.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        amount, unit = int(value), default_unit
+    else:
+        match = _DURATION_PATTERN.search(str(value or ""))
+        if not match:
+            return None
+        amount, unit = int(match.group(1)), match.group(2) or default_unit
+
+    normalized = _UNITS.get(unit.lower())
+    if normalized is None or amount <= 0:
+        return None
+    return amount * normalized[1], normalized[0]
+
+
+def add_months(base_date: date, months: int) -> date:
+    """Cộng tháng, ngày vượt quá cuối tháng được đưa về ngày cuối tháng (31/01 + 1 tháng = 28|29/02)."""
+    month_index = base_date.month - 1 + months
+    year, month = base_date.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(base_date.day, calendar.monthrange(year, month)[1]))
+
+
+def add_duration(base_date: date, duration: Tuple[int, str], sign: int = 1) -> date:
+    amount, unit = duration
+    if unit == UNIT_DAYS:
+        return base_date + timedelta(days=sign * amount)
+    return add_months(base_date, sign * amount)
+
+
+def to_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    text_value = str(value or "").strip()
+    if not text_value or text_value == 'N/A':
+        return None
+    for fmt in _DATE_INPUT_FORMATS:
+        try:
+            return datetime.strptime(text_value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+@lru_cache(maxsize=256)
+def compile_date_format(format_pattern: str) -> str:
+    """'DD/MM/YYYY' -> '%d/%m/%Y'. Chuỗi đã là strftime (có '%') được giữ nguyên."""
+    if "%" in format_pattern:
+        return format_pattern
+    return _DATE_FORMAT_TOKEN_PATTERN.sub(lambda m: _DATE_FORMAT_TOKEN_MAP[m.group(0)], format_pattern.upper())
+
+
+@dataclass(frozen=True)
+class DerivedField:
+    """Biểu thức ngày đã biên dịch của một content field."""
+
+    field_code: str
+    base: str                   # field_code của ngày gốc, hoặc TODAY
+    sign: int = 1
+    amount_literal: Optional[int] = None
+    amount_field: Optional[str] = None
+    unit: str = UNIT_MONTHS
+    date_format: Optional[str] = None   # strftime; None = trả về date
+
+    @property
+    def has_offset(self) -> bool:
+        return self.amount_literal is not None or self.amount_field is not None
+
+    def _duration(self, record: Mapping[str, Any]) -> Optional[Tuple[int, str]]:
+        if self.amount_literal is not None:
+            return parse_duration(self.amount_literal, self.unit)
+        return parse_duration(record.get(self.amount_field), self.unit)
+
+    def _base_date(self, record: Mapping[str, Any], today: date) -> Optional[date]:
+        if self.base == TODAY:
+            return today
+        return to_date(record.get(self.base))
+
+    def evaluate_date(self, record: Mapping[str, Any], today: Optional[date] = None) -> Optional[date]:
+        base_date = self._base_date(record, today or date.today())
+        if base_date is None:
+            return None
+        if not self.has_offset:
+            return base_date
+        duration = self._duration(record)
+        if duration is None:
+            return None
+        return add_duration(base_date, duration, self.sign)
+
+    def evaluate(self, record: Mapping[str, Any], today: Optional[date] = None) -> Any:
+        """Giá trị của field cho một bản ghi: date, chuỗi đã định dạng, hoặc None."""
+        value = self.evaluate_date(record, today)
+        if value is None or self.date_format is None:
+            return value
+        return value.strftime(self.date_format)
+
+    def evaluate_frame(self, frame: pd.DataFrame, today: Optional[date] = None) -> pd.Series:
+        """
+        Tính cho cả DataFrame (vd. mọi dòng của một DN) bằng phép toán theo cột.
+
+        Thời hạn theo cột (shelf_life) được nhóm theo giá trị khác nhau, mỗi nhóm
+        cộng một DateOffset cho cả cột thay vì tính từng dòng.
+        """
+        if self.base == TODAY:
+            base = pd.Series(pd.Timestamp(today or date.today()), index=frame.index)
+        elif self.base in frame.columns:
+            # Cùng bộ định dạng ngày với evaluate (to_date), để kết quả theo cột khớp kết quả từng nhãn
+            base = pd.to_datetime(frame[self.base].map(to_date), errors="coerce")
+        else:
+            base = pd.Series(pd.NaT, index=frame.index)
+
+        if not self.has_offset:
+            result = base
+        else:
+            if self.amount_literal is not None:
+                durations = pd.Series([self._duration({})] * len(frame), index=frame.index, dtype=object)
+            elif self.amount_field in frame.columns:
+                durations = frame[self.amount_field].map(lambda v: parse_duration(v, self.unit))
+            else:
+                durations = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+
+            result = pd.Series(pd.NaT, index=frame.index, dtype="datetime64[ns]")
+            for _, index in durations.groupby(durations.map(repr)).groups.items():
+                duration = durations[index[0]]
+                if duration is None:
+                    continue
+                amount, unit = duration
+                offset = pd.DateOffset(days=amount) if unit == UNIT_DAYS else pd.DateOffset(months=amount)
+                result.loc[index] = base.loc[index] + offset * self.sign
+
+        if self.date_format is None:
+            return result.dt.date.where(result.notna(), None)
+        return result.dt.strftime(self.date_format).astype(object).where(result.notna(), None)
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(
+    field_code: str,
+    data_source: Optional[str],
+    field_type: str = "TEXT"
+) -> Optional[DerivedField]:
+    """
+    Biên dịch data_source thành DerivedField, hoặc None nếu không phải biểu thức ngày.
+
+    Chỉ biểu thức có phép cộng/trừ thời hạn, hoặc gốc là 'today', được coi là trường tính toán;
+    tham chiếu trường đơn thuần (vd. 'batch_no') do bước ánh xạ data_source xử lý.
+    """
+    match = _EXPRESSION_PATTERN.match(data_source or "")
+    if not match:
+        return None
+
+    base = match.group("base")
+    if base.lower() == TODAY:
+        base = TODAY
+    if match.group("sign") is None and base != TODAY:
+        return None
+
+    amount = match.group("amount")
+    unit = (match.group("unit") or UNIT_MONTHS).lower()
+    if amount is not None and unit not in _UNITS:
+        logger.warning(f"Unknown duration unit '{unit}' in data_source of field {field_code}")
+        return None
+
+    date_format = None if str(field_type).upper() == "DATE" else "%Y-%m-%d"
+
+    return DerivedField(
+        field_code=field_code,
+        base=base,
+        sign=-1 if match.group("sign") == "-" else 1,
+        amount_literal=int(amount) if amount is not None and amount.isdigit() else None,
+        amount_field=amount if amount is not None and not amount.isdigit() else None,
+        unit=unit,
+        date_format=date_format
+    )
+
+
+@dataclass(frozen=True)
+class DerivedFieldPlan:
+    """Các trường tính toán của một requirement, theo thứ tự hiển thị."""
+
+    fields: Tuple[DerivedField, ...]
+
+    def __bool__(self) -> bool:
+        return bool(self.fields)
+
+    def get(self, field_code: str) -> Optional[DerivedField]:
+        return next((f for f in self.fields if f.field_code == field_code), None)
+
+    def apply(self, record: Mapping[str, Any], today: Optional[date] = None) -> Dict[str, Any]:
+        """Giá trị các trường tính toán cho một bản ghi; trường sau dùng được kết quả của trường trước."""
+        values: Dict[str, Any] = {}
+        for derived in self.fields:
+            value = derived.evaluate({**record, **values} if values else record, today)
+            if value is not None:
+                values[derived.field_code] = value
+        return values
+
+    def apply_frame(self, frame: pd.DataFrame, today: Optional[date] = None) -> pd.DataFrame:
+        """Thêm cột cho các trường tính toán vào bản sao của frame."""
+        frame = frame.copy()
+        for derived in self.fields:
+            frame[derived.field_code] = derived.evaluate_frame(frame, today)
+        return frame
+
+
+@lru_cache(maxsize=256)
+def get_derived_field_plan(content_fields: Tuple[Any, ...]) -> DerivedFieldPlan:
+    """
+    Biên dịch một lần cho mỗi bộ content field (RequirementBundle.fields là tuple bất biến,
+    nên cache theo chính nó và tự hết hiệu lực khi requirement thay đổi).
+    """
+    compiled = []
+    for field in sorted(content_fields, key=lambda f: f.get('display_order') or 999):
+        derived = compile_expression(
+            field.get('field_code') or '',
+            field.get('data_source'),
+            field.get('field_type') or 'TEXT'
+        )
+        if derived is not None and derived.field_code:
+            compiled.append(derived)
+    return DerivedFieldPlan(fields=tuple(compiled))
+
@@ -0,0 +1,61 @@
+# services/events.py
+
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Các sự kiện được phát sau khi một hàm ghi dữ liệu commit thành công.
+# Payload luôn chứa id của đối tượng vừa thay đổi và các khóa cha để cache xóa đúng entry.
+REQUIREMENT_CREATED = "requirement.created"        # customer_id, requirement_id
+CONTENT_FIELD_CREATED = "content_field.created"    # requirement_id, customer_id, field_id
+PRINT_HISTORY_CREATED = "print_history.created"    # history_id, customer_id, requirement_id, parent_print_id
+PACKAGING_UNIT_CREATED = "packaging_unit.created" # unit_id, unit_type, child_history_ids
+
+_subscribers: Dict[str, List[Callable[..., Any]]] = {}
+_lock = threading.Lock()
+
+
+def subscribe(event: str, handler: Optional[Callable[..., Any]] = None):
+    """
+    Đăng ký handler cho một sự kiện. Dùng trực tiếp hoặc làm decorator:
+
+        @events.subscribe(events.REQUIREMENT_CREATED)
+        def _on_requirement_created(customer_id, requirement_id, **_):
+            ...
+    """
+    def register(func: Callable[..., Any]) -> Callable[..., Any]:
+        with _lock:
+            handlers = _subscribers.setdefault(event, [])
+            if func not in handlers:
+                handlers.append(func)
+        return func
+
+    if handler is not None:
+        return register(handler)
+    return register
+
+
+def unsubscribe(event: str, handler: Callable[..., Any]):
+    with _lock:
+        handlers = _subscribers.get(event, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+
+def publish(event: str, **payload: Any):
+    """
+    Gọi đồng bộ mọi handler đã đăng ký cho sự kiện.
+
+    Lỗi trong một handler chỉ được ghi log: dữ liệu đã được lưu, không để việc
+    xóa cache làm hỏng kết quả của thao tác ghi.
+    """
+    with _lock:
+        handlers = list(_subscribers.get(event, []))
+
+    for handler in handlers:
+        try:
+            handler(**payload)
+        except Exception as e:
+            logger.error(f"Event handler {getattr(handler, '__name__', handler)} failed for '{event}': {e}")
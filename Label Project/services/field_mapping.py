@@ -0,0 +1,210 @@
+# services/field_mapping.py
+
+import logging
+import re
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Any, Dict, Mapping, Optional, Tuple
+import pandas as pd
+from services import derived_fields
+from services import formatting
+from services import gs1
+from services.labels_v2 import get_system_field_map
+from services.models import ProductLine
+
+logger = logging.getLogger(__name__)
+
+# Cách điền tự động một content field từ data_source:
+#   "batch_no" / "product.batch_no" / "Batch No"  -> lấy thẳng giá trị của dòng sản phẩm
+#   "{product_pn} - {batch_no}"                   -> ghép nhiều trường
+#   "'MADE IN VIETNAM'"                           -> hằng số
+#   "production_date + shelf_life months"         -> trường ngày tính toán (services.derived_fields)
+ACCESS_FIELD = "field"
+ACCESS_TEMPLATE = "template"
+ACCESS_CONSTANT = "constant"
+ACCESS_DERIVED = "derived"
+
+_SOURCE_PREFIXES = ("product.", "system.")
+_TEMPLATE_KEY_PATTERN = re.compile(r"\{(\w+)\}")
+_CONSTANT_PATTERN = re.compile(r"""^\s*(['"])(.*)\1\s*$""")
+
+_EMPTY_VALUES = (None, "", "N/A")
+
+
+@lru_cache(maxsize=1)
+def _source_keys() -> Dict[str, str]:
+    """Tên (viết thường) -> key nguồn: field của ProductLine và các trường hệ thống, kèm tên hiển thị."""
+    keys: Dict[str, str] = {}
+    for key, display_name in get_system_field_map().items():
+        keys[key.lower()] = key
+        keys.setdefault(display_name.lower(), key)
+    for field in fields(ProductLine):
+        keys[field.name.lower()] = field.name
+    return keys
+
+
+def resolve_source_key(name: str) -> Optional[str]:
+    name = name.strip()
+    for prefix in _SOURCE_PREFIXES:
+        if name.lower().startswith(prefix):
+            name = name[len(prefix):]
+            break
+    return _source_keys().get(name.lower())
+
+
+@dataclass(frozen=True)
+class FieldAccessor:
+    """Cách lấy giá trị của một content field, đã biên dịch từ data_source."""
+
+    field_code: str
+    kind: str
+    source_keys: Tuple[str, ...] = ()
+    template: str = ""
+    constant: str = ""
+    derived: Optional[derived_fields.DerivedField] = None
+
+    def __call__(self, record: Mapping[str, Any]) -> Any:
+        if self.kind == ACCESS_FIELD:
+            value = record.get(self.source_keys[0])
+            return None if value in _EMPTY_VALUES else value
+        if self.kind == ACCESS_TEMPLATE:
+            values = {key: record.get(key) for key in self.source_keys}
+            if all(v in _EMPTY_VALUES for v in values.values()):
+                return None
+            return self.template.format_map({k: "" if v in _EMPTY_VALUES else v for k, v in values.items()})
+        if self.kind == ACCESS_CONSTANT:
+            return self.constant
+        return self.derived.evaluate(record)
+
+    def evaluate_frame(self, frame: pd.DataFrame) -> pd.Series:
+        """Giá trị cho mọi dòng của frame bằng phép toán theo cột."""
+        def column(key: str) -> pd.Series:
+            if key not in frame.columns:
+                return pd.Series([None] * len(frame), index=frame.index, dtype=object)
+            values = frame[key]
+            return values.where(values.notna() & ~values.isin(_EMPTY_VALUES[1:]), None)
+
+        if self.kind == ACCESS_FIELD:
+            return column(self.source_keys[0])
+        if self.kind == ACCESS_CONSTANT:
+            return pd.Series(self.constant, index=frame.index, dtype=object)
+        if self.kind == ACCESS_DERIVED:
+            return self.derived.evaluate_frame(frame)
+
+        # Ghép chuỗi theo cột: tách template thành phần cố định và phần lấy từ cột
+        parts = _TEMPLATE_KEY_PATTERN.split(self.template)
+        result = pd.Series("", index=frame.index, dtype=object)
+        has_value = pd.Series(False, index=frame.index)
+        for i, part in enumerate(parts):
+            if i % 2 == 0:
+                result = result + part
+            else:
+                values = column(part)
+                has_value |= values.notna()
+                result = result + values.fillna("").astype(str)
+        return result.where(has_value, None)
+
+
+def compile_accessor(
+    field_code: str,
+    data_source: Optional[str],
+    field_type: str = "TEXT"
+) -> Optional[FieldAccessor]:
+    """Biên dịch data_source của một field; None nếu không có/không hiểu (field vẫn nhập tay)."""
+    data_source = (data_source or "").strip()
+    if not data_source or not field_code or gs1.is_element_template(data_source):
+        return None
+
+    derived = derived_fields.compile_expression(field_code, data_source, field_type)
+    if derived is not None:
+        return FieldAccessor(field_code=field_code, kind=ACCESS_DERIVED, derived=derived)
+
+    constant = _CONSTANT_PATTERN.match(data_source)
+    if constant:
+        return FieldAccessor(field_code=field_code, kind=ACCESS_CONSTANT, constant=constant.group(2))
+
+    if "{" in data_source:
+        source_keys = []
+        template = data_source
+        for name in _TEMPLATE_KEY_PATTERN.findall(data_source):
+            key = resolve_source_key(name)
+            if key is None:
+                logger.warning(f"Unknown data_source key '{name}' for field {field_code}")
+                return None
+            template = template.replace(f"{{{name}}}", f"{{{key}}}")
+            source_keys.append(key)
+        return FieldAccessor(field_code=field_code, kind=ACCESS_TEMPLATE, source_keys=tuple(source_keys), template=template)
+
+    key = resolve_source_key(data_source)
+    if key is None:
+        logger.warning(f"Unknown data_source '{data_source}' for field {field_code}")
+        return None
+    return FieldAccessor(field_code=field_code, kind=ACCESS_FIELD, source_keys=(key,))
+
+
+@dataclass(frozen=True)
+class MappingPlan:
+    """Accessor của các field có data_source trong một requirement, theo thứ tự hiển thị."""
+
+    accessors: Tuple[FieldAccessor, ...]
+
+    def __bool__(self) -> bool:
+        return bool(self.accessors)
+
+    @property
+    def field_codes(self) -> Tuple[str, ...]:
+        return tuple(a.field_code for a in self.accessors)
+
+    def get(self, field_code: str) -> Optional[FieldAccessor]:
+        return next((a for a in self.accessors if a.field_code == field_code), None)
+
+    def apply(self, record: Mapping[str, Any]) -> Dict[str, Any]:
+        """Giá trị tự điền cho một dòng sản phẩm; field sau dùng được kết quả của field trước."""
+        values: Dict[str, Any] = {}
+        for accessor in self.accessors:
+            value = accessor({**record, **values} if values else record)
+            if value is not None:
+                values[accessor.field_code] = value
+        return values
+
+    def apply_frame(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """Điền cho cả DN trong một lượt: mỗi field là một phép toán trên cột, không lặp từng dòng."""
+        frame = frame.copy()
+        for accessor in self.accessors:
+            frame[accessor.field_code] = accessor.evaluate_frame(frame)
+        return frame
+
+
+@lru_cache(maxsize=256)
+def get_mapping_plan(content_fields: Tuple[Any, ...]) -> MappingPlan:
+    """Biên dịch một lần cho mỗi bộ content field bất biến (RequirementBundle.fields)."""
+    accessors = []
+    for field in sorted(content_fields, key=lambda f: f.get('display_order') or 999):
+        accessor = compile_accessor(
+            field.get('field_code') or '',
+            field.get('data_source'),
+            field.get('field_type') or 'TEXT'
+        )
+        if accessor is not None:
+            accessors.append(accessor)
+    return MappingPlan(accessors=tuple(accessors))
+
+
+def fill_labels_for_products(products: pd.DataFrame, content_fields: Tuple[Any, ...], formatted: bool = True) -> pd.DataFrame:
+    """
+    Dữ liệu nhãn (một dòng cho mỗi dòng sản phẩm) với mọi field điền được từ data_source.
+
+    formatted=False trả về giá trị gốc (date, số...) để kiểm tra hợp lệ trước khi định dạng.
+    """
+    plan = get_mapping_plan(content_fields)
+    if products.empty or not plan:
+        return pd.DataFrame(index=products.index, columns=list(plan.field_codes))
+    filled = plan.apply_frame(products)[list(plan.field_codes)]
+    if not formatted:
+        return filled
+
+    # Cùng format_pattern như khi in từng nhãn
+    for field_code, formatter in formatting.get_field_formatters(tuple(content_fields)).items():
+        if field_code in filled.columns:
+            filled[field_code] = filled[field_code].map(formatter, na_action='ignore')
+    return filled
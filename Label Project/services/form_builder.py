@@ -1,34 +1,31 @@
 # services/form_builder.py
 import streamlit as st
 from typing import Dict, Any, List
-import re # Thêm thư viện re để kiểm tra email
+from services import form_schema as form_schema_svc
+from services import validation as validation_svc
 
 def render_dynamic_form(fields: List[Dict[str,Any]], initial:Dict[str,Any]|None=None) -> Dict[str,Any]:
     initial = initial or {}
     form_data: Dict[str,Any] = {}
-    for f in fields:
-        fname = f["field_name"]
-        ftype = f.get("field_type","text")
-        required = bool(f.get("is_required", False))
-        maxlen = f.get("max_length")
-        default = initial.get(fname) or f.get("default_value")
-
-        label = f"{fname}" + (" *" if required else "")
-        if ftype in ("text","email","phone","barcode","qr_code"):
-            v = st.text_input(label, value=default or "", max_chars=maxlen if maxlen else None)
-        elif ftype == "number":
-            v = st.number_input(label, value=float(default) if (default not in (None,"")) else 0.0)
-        elif ftype == "date":
+    # Loại widget, options, giá trị mặc định đã được phân tích sẵn trong schema
+    for spec in form_schema_svc.get_form_schema(fields, key_prefix="dynamic_form"):
+        fname = spec.field_name
+        maxlen = spec.max_length
+        value = initial.get(fname)
+
+        label = f"{fname}" + (" *" if spec.required else "")
+        if spec.widget == form_schema_svc.WIDGET_NUMBER:
+            v = st.number_input(label, value=float(spec.bind(value)))
+        elif spec.widget == form_schema_svc.WIDGET_DATE:
             v = st.date_input(label, value=None)
-        elif ftype == "textarea":
-            v = st.text_area(label, value=default or "", max_chars=maxlen if maxlen else None, height=100)
-        elif ftype == "checkbox":
-            v = st.checkbox(label, value=bool(default) if default not in (None,"") else False)
-        elif ftype == "select":
-            opts = (default or "").split("|") if default else []
-            v = st.selectbox(label, options=opts, index=0 if opts else None)
+        elif spec.widget == form_schema_svc.WIDGET_TEXTAREA:
+            v = st.text_area(label, value=spec.bind(value), max_chars=maxlen if maxlen else None, height=100)
+        elif spec.widget == form_schema_svc.WIDGET_CHECKBOX:
+            v = st.checkbox(label, value=spec.bind(value))
+        elif spec.widget == form_schema_svc.WIDGET_SELECT:
+            v = st.selectbox(label, options=spec.options, index=spec.bind(value))
         else:
-            v = st.text_input(label, value=default or "")
+            v = st.text_input(label, value=spec.bind(value), max_chars=maxlen if maxlen else None)
 
         # BỎ PHẦN VALIDATE TẠI ĐÂY ĐỂ TẬP TRUNG LOGIC VÀO HÀM VALIDATE_FORM
         # if required and (v is None or v == ""):
@@ -52,34 +49,6 @@ def validate_form(form_data: Dict[str, Any], fields_definition: List[Dict[str, A
         Dict[str, str]: Một dictionary chứa các lỗi. Key là tên trường, value là thông báo lỗi.
                         Trả về dictionary rỗng nếu không có lỗi.
     """
-    errors: Dict[str, str] = {}
-
-    for field in fields_definition:
-        field_name = field.get("field_name")
-        is_required = bool(field.get("is_required"))
-        field_type = field.get("field_type", "text")
-        
-        value = form_data.get(field_name)
-
-        # 1. Kiểm tra trường bắt buộc
-        # Chuyển value về string để .strip(), áp dụng cho text_input, number_input...
-        if is_required and (value is None or str(value).strip() == ""):
-            errors[field_name] = "is a required field, cannot be left blank"
-            continue # Nếu đã lỗi required thì không cần kiểm tra các lỗi khác
-
-        # 2. (Mở rộng) Kiểm tra các loại dữ liệu khác nếu cần
-        if value and str(value).strip() != "":
-            if field_type == "email":
-                # Biểu thức chính quy đơn giản để kiểm tra email
-                if not re.match(r"[^@]+@[^@]+\.[^@]+", str(value)):
-                    errors[field_name] = "has invalid email format"
-
-                elif field_type == "phone":
-                # Loại bỏ các ký tự phổ biến như спейс, (), -, +
-                    cleaned_phone = re.sub(r'[\s\+\-\(\)]', '', str(value))
-                    if not cleaned_phone.isdigit() or not (9 <= len(cleaned_phone) <= 15):
-                        errors[field_name] = "has invalid phone number format"
-            
-            # Thêm các quy tắc khác ở đây nếu muốn, ví dụ: phone, number format...
-
-    return errors
\ No newline at end of file
+    # Quy tắc (kiểu dữ liệu, độ dài, special_rules, check digit GS1...) được biên dịch một lần
+    # cho mỗi bộ field trong services.validation; ở đây chỉ đọc theo field_name như form trả về
+    return validation_svc.get_validator(fields_definition).validate(form_data, key="field_name")
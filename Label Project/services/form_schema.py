@@ -0,0 +1,148 @@
+# services/form_schema.py
+
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Iterable, Mapping, Optional, Tuple
+
+# Loại widget của một field trong form nhập dữ liệu nhãn
+WIDGET_TEXT = "text"
+WIDGET_NUMBER = "number"
+WIDGET_DATE = "date"
+WIDGET_TEXTAREA = "textarea"
+WIDGET_CHECKBOX = "checkbox"
+WIDGET_SELECT = "select"
+
+# field_type (content field viết hoa, form builder viết thường) -> widget
+_WIDGETS = {
+    "number": WIDGET_NUMBER,
+    "date": WIDGET_DATE,
+    "textarea": WIDGET_TEXTAREA,
+    "checkbox": WIDGET_CHECKBOX,
+    "select": WIDGET_SELECT,
+}
+
+_DATE_FORMAT = "%Y-%m-%d"
+
+
+def _parse_date(value: Any) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value), _DATE_FORMAT).date()
+    except (ValueError, TypeError):
+        return None
+
+
+def _parse_number(value: Any) -> Optional[float]:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        return float(str(value).replace(",", "").strip())
+    except (ValueError, TypeError):
+        return None
+
+
+@dataclass(frozen=True)
+class FieldSpec:
+    """Định nghĩa widget của một field, đã phân tích sẵn; mỗi lần rerun chỉ còn gắn giá trị."""
+
+    field_code: str
+    field_name: str
+    widget: str
+    key: str
+    placeholder: Optional[str] = None
+    required: bool = False
+    max_length: Optional[int] = None
+    options: Tuple[str, ...] = ()
+    default: Any = None   # giá trị mặc định đã chuyển kiểu (sample_value / default_value)
+
+    def bind(self, value: Any) -> Any:
+        """Chuyển giá trị hiện có (dữ liệu preview, initial) thành giá trị cho widget."""
+        if self.widget == WIDGET_NUMBER:
+            number = _parse_number(value) if value not in (None, "") else None
+            if number is not None:
+                return number
+            return self.default if self.default is not None else 0
+
+        if self.widget == WIDGET_DATE:
+            if value:
+                return _parse_date(value) or date.today()
+            return self.default or date.today()
+
+        if self.widget == WIDGET_CHECKBOX:
+            return bool(value) if value not in (None, "") else bool(self.default)
+
+        if self.widget == WIDGET_SELECT:
+            return self.options.index(value) if value in self.options else (0 if self.options else None)
+
+        if value in (None, ""):
+            return self.default or ""
+        return str(value)
+
+
+@dataclass(frozen=True)
+class FormSchema:
+    fields: Tuple[FieldSpec, ...]
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+
+def _compile_field(field: Mapping[str, Any], key_prefix: str) -> FieldSpec:
+    field_code = field.get('field_code') or ''
+    field_name = field.get('field_name') or field_code
+    field_type = str(field.get('field_type') or 'text').lower()
+    widget = _WIDGETS.get(field_type, WIDGET_TEXT)
+    required = bool(field.get('is_required', False))
+    raw_default = field.get('default_value')
+    placeholder = field.get('sample_value')
+
+    options: Tuple[str, ...] = ()
+    default: Any = raw_default
+    if widget == WIDGET_SELECT:
+        options = tuple(str(raw_default).split("|")) if raw_default else ()
+        default = None
+    elif widget == WIDGET_NUMBER:
+        default = _parse_number(raw_default)
+    elif widget == WIDGET_DATE:
+        default = _parse_date(raw_default or placeholder)
+
+    identity = field.get('id') if field.get('id') is not None else (field_code or field_name)
+    return FieldSpec(
+        field_code=field_code,
+        field_name=field_name,
+        widget=widget,
+        key=f"{key_prefix}_{identity}",
+        placeholder=placeholder,
+        required=required,
+        max_length=int(field['max_length']) if field.get('max_length') else None,
+        options=options,
+        default=default
+    )
+
+
+def build_form_schema(content_fields: Iterable[Mapping[str, Any]], key_prefix: str = "dynamic_field") -> FormSchema:
+    return FormSchema(fields=tuple(_compile_field(f, key_prefix) for f in content_fields))
+
+
+@lru_cache(maxsize=256)
+def _cached_form_schema(content_fields: Tuple[Any, ...], key_prefix: str) -> FormSchema:
+    return build_form_schema(content_fields, key_prefix)
+
+
+def get_form_schema(content_fields: Iterable[Mapping[str, Any]], key_prefix: str = "dynamic_field") -> FormSchema:
+    """
+    Schema của form cho một bộ content field. Với RequirementBundle.fields (bất biến) schema
+    được biên dịch một lần và sống cùng bundle trong cache; list dict thì biên dịch lại mỗi lần.
+    """
+    content_fields = tuple(content_fields)
+    try:
+        return _cached_form_schema(content_fields, key_prefix)
+    except TypeError:
+        return build_form_schema(content_fields, key_prefix)
@@ -0,0 +1,211 @@
+# services/formatting.py
+
+import logging
+import re
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable, Dict, Mapping, Tuple
+from services import derived_fields
+
+logger = logging.getLogger(__name__)
+
+# format_pattern của content field: một hoặc nhiều chỉ thị, phân tách bằng '|', áp dụng từ trái sang phải
+#   DD/MM/YYYY, YYMMDD, MMM-YYYY   -> định dạng ngày
+#   000000                         -> đệm số 0 bên trái đủ 6 chữ số
+#   #,##0.00 / 0.0                 -> định dạng số (phân cách hàng nghìn, số chữ số thập phân)
+#   LOT-{} / {} PCS                -> tiền tố / hậu tố
+#   prefix:LOT- / suffix: PCS      -> như trên
+#   upper / lower                  -> chữ hoa / chữ thường
+#   width:12 / rjust:12            -> độ rộng cố định (cắt bớt, đệm khoảng trắng bên phải / bên trái)
+# Ví dụ: "upper|prefix:LOT-|width:16"
+Formatter = Callable[[Any], str]
+
+_DIRECTIVE_SEPARATOR = "|"
+_DATE_MASK_PATTERN = re.compile(r"^(?=.*(?:YY|MM|DD))[YMD/\-. ]+$", re.IGNORECASE)
+_ZERO_PAD_PATTERN = re.compile(r"^0+$")
+_NUMBER_PATTERN = re.compile(r"^[#0]*(?P<group>,)?[#0]*0(?:\.(?P<decimals>0+))?$")
+_KEYWORD_PATTERN = re.compile(r"^(?P<name>[a-z_]+)\s*:\s?(?P<arg>.*)$", re.IGNORECASE)
+
+_EMPTY_VALUES = (None, "")
+
+
+def _to_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return str(value)
+
+
+def _to_decimal(value: Any):
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return Decimal(str(value))
+    try:
+        return Decimal(str(value).replace(",", "").strip())
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _date_step(strftime_format: str) -> Formatter:
+    def step(value: Any) -> Any:
+        parsed = derived_fields.to_date(value)
+        return parsed.strftime(strftime_format) if parsed else value
+    return step
+
+
+def _zero_pad_step(width: int) -> Formatter:
+    def step(value: Any) -> Any:
+        number = _to_decimal(value)
+        if number is None or number != number.to_integral_value():
+            return value
+        return f"{int(number):0{width}d}"
+    return step
+
+
+def _number_step(grouping: bool, decimals: int) -> Formatter:
+    spec = f"{',' if grouping else ''}.{decimals}f"
+
+    def step(value: Any) -> Any:
+        number = _to_decimal(value)
+        return format(number, spec) if number is not None else value
+    return step
+
+
+def _affix_step(prefix: str, suffix: str) -> Formatter:
+    def step(value: Any) -> Any:
+        text = _to_text(value)
+        return f"{prefix}{text}{suffix}" if text else text
+    return step
+
+
+def _width_step(width: int, right_align: bool) -> Formatter:
+    def step(value: Any) -> Any:
+        text = _to_text(value)[:width]
+        return text.rjust(width) if right_align else text.ljust(width)
+    return step
+
+
+def _upper(value: Any) -> str:
+    return _to_text(value).upper()
+
+
+def _lower(value: Any) -> str:
+    return _to_text(value).lower()
+
+
+def _compile_directive(directive: str) -> Formatter:
+    lowered = directive.lower()
+    if lowered in ("upper", "uppercase"):
+        return _upper
+    if lowered in ("lower", "lowercase"):
+        return _lower
+
+    if "{}" in directive:
+        prefix, _, suffix = directive.partition("{}")
+        return _affix_step(prefix, suffix)
+
+    keyword = _KEYWORD_PATTERN.match(directive)
+    if keyword:
+        name, arg = keyword.group("name").lower(), keyword.group("arg")
+        if name == "prefix":
+            return _affix_step(arg, "")
+        if name == "suffix":
+            return _affix_step("", arg)
+        if name in ("width", "ljust", "rjust") and arg.strip().isdigit():
+            return _width_step(int(arg), right_align=name == "rjust")
+        if name in ("pad", "zfill") and arg.strip().isdigit():
+            return _zero_pad_step(int(arg))
+        if name == "date":
+            return _date_step(derived_fields.compile_date_format(arg.strip()))
+
+    if _ZERO_PAD_PATTERN.match(directive):
+        return _zero_pad_step(len(directive))
+    number = _NUMBER_PATTERN.match(directive)
+    if number:
+        return _number_step(bool(number.group("group")), len(number.group("decimals") or ""))
+    if _DATE_MASK_PATTERN.match(directive) or "%" in directive:
+        return _date_step(derived_fields.compile_date_format(directive))
+
+    raise ValueError(f"Unknown format directive: {directive!r}")
+
+
+@lru_cache(maxsize=1024)
+def compile_format(format_pattern: str) -> Formatter:
+    """
+    Biên dịch format_pattern thành một hàm value -> str (dùng lại cho mọi nhãn).
+
+    Pattern không hợp lệ được ghi log và bỏ qua (giá trị in như cũ bằng str()).
+    """
+    directives = [d.strip() for d in (format_pattern or "").split(_DIRECTIVE_SEPARATOR) if d.strip()]
+    try:
+        steps = tuple(_compile_directive(d) for d in directives)
+    except ValueError as e:
+        logger.warning(f"Ignoring format_pattern {format_pattern!r}: {e}")
+        steps = ()
+
+    if not steps:
+        return _to_text
+    if len(steps) == 1:
+        step = steps[0]
+        return lambda value: _to_text(step(value))
+
+    def formatter(value: Any) -> str:
+        for step in steps:
+            value = step(value)
+        return _to_text(value)
+    return formatter
+
+
+@lru_cache(maxsize=256)
+def get_field_formatters(content_fields: Tuple[Any, ...]) -> Dict[str, Formatter]:
+    """field_code -> formatter cho các field có format_pattern (cache theo RequirementBundle.fields)."""
+    return {
+        f.get('field_code'): compile_format(f.get('format_pattern'))
+        for f in content_fields
+        if f.get('field_code') and f.get('format_pattern')
+    }
+
+
+def format_value(value: Any, format_pattern: str) -> str:
+    return compile_format(format_pattern)(value)
+
+
+def format_label_data(label_data: Mapping[str, Any], content_fields: Tuple[Any, ...]) -> Mapping[str, Any]:
+    """
+    Dữ liệu nhãn đã áp format_pattern, dùng chung cho preview, ZPL, EZPX và printed_data.
+
+    Không field nào có format_pattern thì trả lại chính label_data (không copy).
+    """
+    formatters = get_field_formatters(tuple(content_fields))
+    if not formatters:
+        return label_data
+
+    formatted = {}
+    for field_code, formatter in formatters.items():
+        value = label_data.get(field_code)
+        if value not in _EMPTY_VALUES:
+            formatted[field_code] = formatter(value)
+    return {**label_data, **formatted} if formatted else label_data
+
+
+def _benchmark(count: int = 100_000) -> None:
+    """python -m services.formatting: đo tốc độ các formatter đã biên dịch."""
+    samples = {
+        "DD/MM/YYYY": [date(2024, 1, 1 + i % 28) for i in range(count)],
+        "000000": list(range(count)),
+        "#,##0.00": [i * 1.5 for i in range(count)],
+        "upper|prefix:LOT-|width:16": [f"b{i}" for i in range(count)],
+    }
+    for pattern, values in samples.items():
+        formatter = compile_format(pattern)
+        started = time.perf_counter()
+        for value in values:
+            formatter(value)
+        elapsed = time.perf_counter() - started
+        print(f"{pattern:<28} {count / elapsed:>12,.0f} values/s")
+
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,359 @@
+# services/gs1.py
+
+import re
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+from services import derived_fields
+
+
+def calculate_check_digit(digits: str) -> str:
+    """
+    Số kiểm tra GS1 (mod 10) cho chuỗi số chưa có check digit (GTIN, SSCC, GLN...).
+
+    Trọng số 3 và 1 luân phiên, bắt đầu bằng 3 từ chữ số bên phải.
+    """
+    if not digits.isdigit():
+        raise ValueError(f"GS1 data must be numeric: {digits!r}")
+
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return str((10 - total % 10) % 10)
+
+
+def is_valid_check_digit(number: str) -> bool:
+    return len(number) > 1 and number.isdigit() and calculate_check_digit(number[:-1]) == number[-1]
+
+
+def build_sscc(extension_digit: str, company_prefix: str, serial_reference: int) -> str:
+    """
+    SSCC-18 = extension digit (1) + GS1 company prefix + serial reference + check digit.
+
+    Company prefix và serial reference luôn chiếm đủ 16 chữ số.
+    """
+    if len(extension_digit) != 1 or not extension_digit.isdigit():
+        raise ValueError("SSCC extension digit must be a single digit")
+    if not company_prefix.isdigit() or not 7 <= len(company_prefix) <= 10:
+        raise ValueError("GS1 company prefix must be 7-10 digits")
+
+    serial_length = 16 - len(company_prefix)
+    if serial_reference < 0 or serial_reference >= 10 ** serial_length:
+        raise ValueError(f"SSCC serial reference {serial_reference} exceeds {serial_length} digits")
+
+    body = f"{extension_digit}{company_prefix}{serial_reference:0{serial_length}d}"
+    return body + calculate_check_digit(body)
+
+
+# --- GS1 APPLICATION IDENTIFIERS (GS1-128 / GS1 DataMatrix) ---
+
+@dataclass(frozen=True)
+class ApplicationIdentifier:
+    ai: str
+    title: str
+    max_length: int
+    fixed_length: bool = False
+    numeric: bool = True
+    check_digit: bool = False
+    is_date: bool = False
+
+
+# Các AI hay dùng trên nhãn carton/package
+_APPLICATION_IDENTIFIERS = (
+    ApplicationIdentifier("00", "SSCC", 18, fixed_length=True, check_digit=True),
+    ApplicationIdentifier("01", "GTIN", 14, fixed_length=True, check_digit=True),
+    ApplicationIdentifier("02", "CONTENT", 14, fixed_length=True, check_digit=True),
+    ApplicationIdentifier("10", "BATCH/LOT", 20, numeric=False),
+    ApplicationIdentifier("11", "PROD DATE", 6, fixed_length=True, is_date=True),
+    ApplicationIdentifier("13", "PACK DATE", 6, fixed_length=True, is_date=True),
+    ApplicationIdentifier("15", "BEST BEFORE", 6, fixed_length=True, is_date=True),
+    ApplicationIdentifier("17", "USE BY OR EXPIRY", 6, fixed_length=True, is_date=True),
+    ApplicationIdentifier("21", "SERIAL", 20, numeric=False),
+    ApplicationIdentifier("30", "VAR. COUNT", 8),
+    ApplicationIdentifier("37", "COUNT", 8),
+    ApplicationIdentifier("240", "ADDITIONAL ID", 30, numeric=False),
+    ApplicationIdentifier("241", "CUST. PART No.", 30, numeric=False),
+    ApplicationIdentifier("400", "ORDER NUMBER", 30, numeric=False),
+    *(ApplicationIdentifier(f"310{d}", "NET WEIGHT (kg)", 6, fixed_length=True) for d in range(6)),
+    *(ApplicationIdentifier(f"330{d}", "GROSS WEIGHT (kg)", 6, fixed_length=True) for d in range(6)),
+)
+
+APPLICATION_IDENTIFIERS: Dict[str, ApplicationIdentifier] = {a.ai: a for a in _APPLICATION_IDENTIFIERS}
+
+# Bảng độ dài cố định theo 2 chữ số đầu của AI (GS1 General Specifications, Figure 5.10.1-2):
+# phần tử có AI bắt đầu bằng các tiền tố này không cần FNC1 phân tách phía sau
+_PREDEFINED_LENGTH_PREFIXES = frozenset({
+    "00", "01", "02", "03", "04", "11", "12", "13", "14", "15", "16", "17", "18", "19", "20",
+    "31", "32", "33", "34", "35", "36", "41",
+})
+
+# Bộ ký tự GS1 AI encodable character set 82
+_GS1_CHARSET_82 = re.compile(r"[!\"%&'()*+,\-./0-9:;<=>?A-Z_a-z]*")
+
+_HUMAN_READABLE_PATTERN = re.compile(r"\((\d{2,4})\)([^(]*)")
+_TEMPLATE_PATTERN = re.compile(r"\((\d{2,4})\)(?:\{(\w+)\}|([^({]*))")
+
+# Dung lượng (data codewords) của các symbol DataMatrix ECC 200 vuông
+_DATAMATRIX_SQUARE_CAPACITY = (
+    (10, 3), (12, 5), (14, 8), (16, 12), (18, 18), (20, 22), (22, 30), (24, 36),
+    (26, 44), (32, 62), (36, 86), (40, 114), (44, 144), (48, 174), (52, 204),
+)
+
+# Khóa trong template được tính từ shelf_life nếu dữ liệu nhãn chưa có sẵn
+EXPIRY_DATE_KEY = "expiry_date"
+PRODUCTION_DATE_KEY = "production_date"
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d", "%y%m%d")
+
+GS1Elements = Tuple[Tuple[str, str], ...]
+
+
+def _to_gs1_date(value: Any) -> str:
+    """Ngày theo định dạng YYMMDD của các AI ngày (11, 13, 15, 17)."""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.strftime("%y%m%d")
+
+    text_value = str(value).strip()
+    if len(text_value) == 6 and text_value.isdigit():
+        return text_value
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text_value, fmt).strftime("%y%m%d")
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date for GS1 element: {value!r}")
+
+
+def _normalize_value(definition: ApplicationIdentifier, value: Any) -> str:
+    if definition.is_date:
+        return _to_gs1_date(value)
+
+    text_value = str(value).strip()
+    if definition.numeric and definition.check_digit and text_value.isdigit() and len(text_value) < definition.max_length:
+        # GTIN-8/12/13 được đệm số 0 bên trái thành GTIN-14
+        text_value = text_value.zfill(definition.max_length)
+    return text_value
+
+
+def validate_element(ai: str, value: str) -> None:
+    """Kiểm tra một phần tử (AI, giá trị) theo bảng AI; lỗi thì raise ValueError."""
+    definition = APPLICATION_IDENTIFIERS.get(ai)
+    if definition is None:
+        raise ValueError(f"Unsupported GS1 application identifier: ({ai})")
+    if not value:
+        raise ValueError(f"GS1 ({ai}) {definition.title} is empty")
+    if definition.fixed_length and len(value) != definition.max_length:
+        raise ValueError(f"GS1 ({ai}) {definition.title} must be {definition.max_length} characters: {value!r}")
+    if len(value) > definition.max_length:
+        raise ValueError(f"GS1 ({ai}) {definition.title} exceeds {definition.max_length} characters: {value!r}")
+    if definition.numeric and not value.isdigit():
+        raise ValueError(f"GS1 ({ai}) {definition.title} must be numeric: {value!r}")
+    if not _GS1_CHARSET_82.fullmatch(value):
+        raise ValueError(f"GS1 ({ai}) {definition.title} contains unsupported characters: {value!r}")
+    if definition.check_digit and not is_valid_check_digit(value):
+        raise ValueError(f"GS1 ({ai}) {definition.title} has an invalid check digit: {value}")
+    if definition.is_date:
+        month, day = int(value[2:4]), int(value[4:6])
+        # Ngày 00 được phép (nghĩa là cuối tháng)
+        if not 1 <= month <= 12 or day > 31:
+            raise ValueError(f"GS1 ({ai}) {definition.title} is not a valid YYMMDD date: {value}")
+
+
+def build_elements(pairs: Iterable[Tuple[str, Any]]) -> GS1Elements:
+    """Chuẩn hóa và kiểm tra danh sách (AI, giá trị), trả về element string dạng tuple."""
+    elements = []
+    for ai, value in pairs:
+        definition = APPLICATION_IDENTIFIERS.get(ai)
+        if definition is None:
+            raise ValueError(f"Unsupported GS1 application identifier: ({ai})")
+        normalized = _normalize_value(definition, value)
+        validate_element(ai, normalized)
+        elements.append((ai, normalized))
+    if not elements:
+        raise ValueError("GS1 element string is empty")
+    return tuple(elements)
+
+
+def parse_human_readable(value: str) -> GS1Elements:
+    """Đọc chuỗi dạng '(01)09501101020917(17)250508(10)ABC123'."""
+    matches = _HUMAN_READABLE_PATTERN.findall(str(value).replace(" ", ""))
+    if not matches:
+        raise ValueError(f"Not a GS1 element string: {value!r}")
+    return build_elements(matches)
+
+
+def to_human_readable(elements: GS1Elements) -> str:
+    return "".join(f"({ai}){value}" for ai, value in elements)
+
+
+def _needs_separator(ai: str) -> bool:
+    return ai[:2] not in _PREDEFINED_LENGTH_PREFIXES
+
+
+# Ký hiệu FNC1 trong danh sách đoạn dữ liệu trước khi mã hóa
+_FNC1 = None
+
+
+def _segments(elements: GS1Elements) -> List[Optional[str]]:
+    """Các đoạn dữ liệu liền nhau, phân tách bằng FNC1 sau phần tử có độ dài thay đổi."""
+    segments: List[Optional[str]] = []
+    current = ""
+    for index, (ai, value) in enumerate(elements):
+        current += ai + value
+        if _needs_separator(ai) and index < len(elements) - 1:
+            segments.append(current)
+            segments.append(_FNC1)
+            current = ""
+    if current:
+        segments.append(current)
+    return segments
+
+
+def _digit_run(data: str, start: int) -> int:
+    end = start
+    while end < len(data) and data[end].isdigit():
+        end += 1
+    return end - start
+
+
+@lru_cache(maxsize=4096)
+def encode_gs1_128_zpl(elements: GS1Elements) -> str:
+    """
+    Dữ liệu ^FD cho ^BC (Code 128) theo chuẩn GS1-128.
+
+    Bắt đầu bằng Start C + FNC1 (>;>8), cặp số mã hóa ở subset C, ký tự chữ
+    chuyển sang subset B (>6), FNC1 (>8) làm ký tự phân tách GS.
+    """
+    output = [">;>8"]
+    subset = "C"
+    for segment in _segments(elements):
+        if segment is _FNC1:
+            output.append(">8")
+            continue
+        i = 0
+        while i < len(segment):
+            run = _digit_run(segment, i)
+            if subset == "C":
+                if run >= 2:
+                    pairs = run - run % 2
+                    output.append(segment[i:i + pairs])
+                    i += pairs
+                    continue
+                output.append(">6")
+                subset = "B"
+            elif run >= 4:
+                output.append(">5")
+                subset = "C"
+                continue
+            # '>' là ký tự điều khiển của ^BC nên phải viết thành '><'
+            output.append("><" if segment[i] == ">" else segment[i])
+            i += 1
+    return "".join(output)
+
+
+@lru_cache(maxsize=4096)
+def encode_datamatrix_zpl(elements: GS1Elements, escape_char: str = "_") -> str:
+    """Dữ liệu ^FD cho ^BX (quality 200, ký tự escape '_'): FNC1 đầu và FNC1 phân tách là '_1'."""
+    output = [f"{escape_char}1"]
+    for segment in _segments(elements):
+        if segment is _FNC1:
+            output.append(f"{escape_char}1")
+        else:
+            output.append(segment.replace(escape_char, escape_char * 2))
+    return "".join(output)
+
+
+@lru_cache(maxsize=4096)
+def datamatrix_symbol_size(elements: GS1Elements) -> int:
+    """
+    Số module mỗi cạnh của symbol DataMatrix vuông nhỏ nhất chứa được dữ liệu.
+
+    Ước lượng theo ASCII encodation: mỗi cặp số là 1 codeword, ký tự khác và FNC1 là 1 codeword.
+    """
+    codewords = 1  # FNC1 đầu
+    for segment in _segments(elements):
+        if segment is _FNC1:
+            codewords += 1
+            continue
+        i = 0
+        while i < len(segment):
+            if _digit_run(segment, i) >= 2:
+                i += 2
+            else:
+                i += 1
+            codewords += 1
+
+    for size, capacity in _DATAMATRIX_SQUARE_CAPACITY:
+        if codewords <= capacity:
+            return size
+    return _DATAMATRIX_SQUARE_CAPACITY[-1][0]
+
+
+def expiry_from_shelf_life(base_date: date, shelf_life: Any) -> Optional[date]:
+    """Hạn dùng = ngày sản xuất + shelf_life (số tháng, hoặc chuỗi như '24 months', '180 days')."""
+    duration = derived_fields.parse_duration(shelf_life)
+    if duration is None:
+        return None
+    return derived_fields.add_duration(base_date, duration)
+
+
+@lru_cache(maxsize=256)
+def compile_element_template(template: str) -> Tuple[Tuple[str, Optional[str], str], ...]:
+    """
+    Phân tích template của field GS1 một lần, vd. '(01){product_mapped_code}(10){batch_no}(17){expiry_date}'.
+
+    Trả về tuple (AI, field_code hoặc None, giá trị cố định).
+    """
+    parts = tuple(
+        (ai, source_key or None, literal.strip())
+        for ai, source_key, literal in _TEMPLATE_PATTERN.findall(template.replace(" ", ""))
+    )
+    for ai, _, _ in parts:
+        if ai not in APPLICATION_IDENTIFIERS:
+            raise ValueError(f"Unsupported GS1 application identifier in template: ({ai})")
+    return parts
+
+
+def is_element_template(template: Any) -> bool:
+    return bool(template) and _TEMPLATE_PATTERN.match(str(template).strip()) is not None
+
+
+def build_elements_from_template(template: str, label_data: Mapping[str, Any]) -> GS1Elements:
+    """
+    Lấy giá trị các AI từ dữ liệu nhãn theo template.
+
+    expiry_date chưa có trong dữ liệu thì được tính từ production_date (mặc định hôm nay) + shelf_life.
+    """
+    pairs = []
+    for ai, source_key, literal in compile_element_template(template):
+        if source_key is None:
+            pairs.append((ai, literal))
+            continue
+
+        value = label_data.get(source_key)
+        if (value is None or value == '' or value == 'N/A') and source_key == EXPIRY_DATE_KEY:
+            production_date = label_data.get(PRODUCTION_DATE_KEY) or date.today()
+            if not isinstance(production_date, date):
+                production_date = datetime.strptime(_to_gs1_date(production_date), "%y%m%d").date()
+            value = expiry_from_shelf_life(production_date, label_data.get('shelf_life'))
+
+        if value is None or value == '' or value == 'N/A':
+            raise ValueError(f"Missing value '{source_key}' for GS1 ({ai})")
+        pairs.append((ai, value))
+    return build_elements(pairs)
+
+
+def resolve_field_elements(value: Any, template: Any, label_data: Mapping[str, Any]) -> Optional[GS1Elements]:
+    """
+    Element string của một field GS1_128 / GS1_DATAMATRIX.
+
+    Ưu tiên giá trị đã nhập dạng '(AI)...'; nếu trống thì dựng từ template trong data_source.
+    """
+    if value and str(value).strip().startswith("("):
+        return parse_human_readable(str(value))
+    if is_element_template(template):
+        return build_elements_from_template(str(template), label_data)
+    if value:
+        raise ValueError(f"GS1 value must be written as (AI)value: {value!r}")
+    return None
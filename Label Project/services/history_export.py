@@ -0,0 +1,269 @@
+# services/history_export.py
+
+import csv
+import importlib.util
+import io
+import json
+import logging
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, BinaryIO, Iterable, List, Mapping, Optional
+
+from services import labels_v2 as labels_svc
+from utils.lazy import lazy_import
+from utils.s3_utils import S3UnavailableError, get_s3_manager
+
+# xlsxwriter / pyarrow chỉ được import khi export thật (trang Label Management import module này lúc khởi động)
+xlsxwriter = lazy_import("xlsxwriter")
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+pa = lazy_import("pyarrow") if PARQUET_AVAILABLE else None
+pq = lazy_import("pyarrow.parquet") if PARQUET_AVAILABLE else None
+
+logger = logging.getLogger(__name__)
+
+# Số dòng đọc từ DB mỗi lần (server-side cursor)
+EXPORT_CHUNK_SIZE = 2000
+
+# File export được giữ trong RAM tới ngưỡng này, vượt quá sẽ tự chuyển xuống file tạm trên đĩa
+EXPORT_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# File lớn hơn ngưỡng này không gửi qua trình duyệt mà upload lên S3
+BROWSER_EXPORT_MAX_BYTES = 50 * 1024 * 1024
+
+# Excel giới hạn 1,048,576 dòng / sheet (trừ 1 dòng tiêu đề)
+XLSX_MAX_ROWS_PER_SHEET = 1_048_575
+
+EXPORT_COLUMNS = [
+    'id', 'printed_date', 'customer_id', 'customer_name', 'entity_id', 'legal_entity',
+    'dn_number', 'product_pn', 'pt_code', 'selling_quantity', 'standard_quantity',
+    'print_quantity', 'label_type', 'label_size', 'print_status', 'error_message',
+    'printer_name', 'printed_by', 'requirement_id', 'parent_print_id', 'printed_data'
+]
+
+EXPORT_FORMATS = {
+    # format: (file extension, mime type)
+    "CSV": ("csv", "text/csv"),
+    "XLSX": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet"),
+}
+
+
+def get_available_export_formats() -> List[str]:
+    """Các định dạng export khả dụng (Parquet cần pyarrow)."""
+    return [fmt for fmt in EXPORT_FORMATS if fmt != "Parquet" or pq is not None]
+
+
+def get_export_file_name(export_format: str, start_date: date, end_date: date) -> str:
+    extension, _ = EXPORT_FORMATS[export_format]
+    return f"label_print_history_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{extension}"
+
+
+def _printed_data_to_str(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _export_row(row: Mapping[str, Any]) -> List[Any]:
+    values = [row.get(col) for col in EXPORT_COLUMNS]
+    values[-1] = _printed_data_to_str(values[-1])
+    return values
+
+
+def _write_csv(chunks: Iterable[List[Mapping[str, Any]]], fileobj: BinaryIO) -> int:
+    # utf-8-sig để Excel mở đúng tiếng Việt
+    text_stream = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+    try:
+        writer = csv.writer(text_stream)
+        writer.writerow(EXPORT_COLUMNS)
+        row_count = 0
+        for chunk in chunks:
+            writer.writerows(_export_row(row) for row in chunk)
+            row_count += len(chunk)
+        text_stream.flush()
+    finally:
+        # Tách wrapper ra để không đóng file gốc
+        text_stream.detach()
+    return row_count
+
+
+def _write_xlsx(chunks: Iterable[List[Mapping[str, Any]]], fileobj: BinaryIO) -> int:
+    # constant_memory: mỗi dòng được ghi xuống file tạm ngay, bộ nhớ không tăng theo số dòng
+    workbook = xlsxwriter.Workbook(fileobj, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'remove_timezone': True,
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+    })
+    header_format = workbook.add_format({'bold': True})
+
+    def new_sheet(index: int):
+        sheet = workbook.add_worksheet(f"History {index}" if index > 1 else "History")
+        sheet.write_row(0, 0, EXPORT_COLUMNS, header_format)
+        return sheet
+
+    sheet_index = 1
+    worksheet = new_sheet(sheet_index)
+    sheet_row = 0
+    row_count = 0
+
+    for chunk in chunks:
+        for row in chunk:
+            if sheet_row >= XLSX_MAX_ROWS_PER_SHEET:
+                sheet_index += 1
+                worksheet = new_sheet(sheet_index)
+                sheet_row = 0
+            sheet_row += 1
+            for col_index, value in enumerate(_export_row(row)):
+                if value is None or value == '':
+                    continue
+                if isinstance(value, Decimal):
+                    value = float(value)
+                worksheet.write(sheet_row, col_index, value)
+        row_count += len(chunk)
+
+    workbook.close()
+    return row_count
+
+
+def _parquet_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('printed_date', pa.timestamp('s')),
+        ('customer_id', pa.int64()),
+        ('customer_name', pa.string()),
+        ('entity_id', pa.int64()),
+        ('legal_entity', pa.string()),
+        ('dn_number', pa.string()),
+        ('product_pn', pa.string()),
+        ('pt_code', pa.string()),
+        ('selling_quantity', pa.float64()),
+        ('standard_quantity', pa.float64()),
+        ('print_quantity', pa.int64()),
+        ('label_type', pa.string()),
+        ('label_size', pa.string()),
+        ('print_status', pa.string()),
+        ('error_message', pa.string()),
+        ('printer_name', pa.string()),
+        ('printed_by', pa.string()),
+        ('requirement_id', pa.int64()),
+        ('parent_print_id', pa.int64()),
+        ('printed_data', pa.string()),
+    ])
+
+
+def _parquet_value(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _write_parquet(chunks: Iterable[List[Mapping[str, Any]]], fileobj: BinaryIO) -> int:
+    if pq is None:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package.")
+
+    schema = _parquet_schema()
+    row_count = 0
+    # Mỗi chunk được ghi thành một row group, không giữ toàn bộ bảng trong bộ nhớ
+    with pq.ParquetWriter(fileobj, schema, compression='snappy') as writer:
+        for chunk in chunks:
+            columns = {
+                col: [_parquet_value(v) for v in values]
+                for col, values in zip(EXPORT_COLUMNS, zip(*(_export_row(row) for row in chunk)))
+            }
+            if columns:
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+            row_count += len(chunk)
+    return row_count
+
+
+_WRITERS = {
+    "CSV": _write_csv,
+    "XLSX": _write_xlsx,
+    "Parquet": _write_parquet,
+}
+
+
+def build_history_export(
+    export_format: str,
+    start_date: date,
+    end_date: date,
+    customer_id: Optional[int] = None,
+    entity_id: Optional[int] = None,
+    dn_number: Optional[str] = None,
+    pt_code: Optional[str] = None,
+    print_status: Optional[str] = None,
+    label_type: Optional[str] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE
+) -> tuple[bool, str, Optional[BinaryIO], int]:
+    """
+    Xuất lịch sử in tem ra file theo từng khối để bộ nhớ không phụ thuộc số dòng.
+
+    Returns:
+        Tuple of (success, message, file object đã seek(0), số dòng)
+    """
+    if export_format not in _WRITERS:
+        return False, f"Unsupported export format: {export_format}", None, 0
+
+    export_file = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    try:
+        chunks = labels_svc.iter_label_print_history(
+            start_date=start_date,
+            end_date=end_date,
+            customer_id=customer_id,
+            entity_id=entity_id,
+            dn_number=dn_number,
+            pt_code=pt_code,
+            print_status=print_status,
+            label_type=label_type,
+            chunk_size=chunk_size
+        )
+        row_count = _WRITERS[export_format](chunks, export_file)
+        export_file.seek(0)
+        msg = f"Exported {row_count} rows to {export_format}"
+        logger.info(msg)
+        return True, msg, export_file, row_count
+
+    except Exception as e:
+        export_file.close()
+        logger.error(f"Failed to export label print history: {e}")
+        return False, f"Export failed: {e}", None, 0
+
+
+def get_export_size(export_file: BinaryIO) -> int:
+    current = export_file.tell()
+    export_file.seek(0, io.SEEK_END)
+    size = export_file.tell()
+    export_file.seek(current)
+    return size
+
+
+def upload_history_export(export_file: BinaryIO, export_format: str, file_name: str) -> tuple[bool, str]:
+    """
+    Upload file export lên S3 (multipart) và trả về presigned URL để tải.
+
+    Returns:
+        Tuple of (success, presigned URL hoặc thông báo lỗi)
+    """
+    try:
+        s3_manager = get_s3_manager()
+    except S3UnavailableError as e:
+        logger.error(f"S3 unavailable: {e}")
+        return False, "Unable to connect to file storage service. Please contact support."
+    _, mime_type = EXPORT_FORMATS[export_format]
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    key = f"{s3_manager.app_prefix}/label-management/exports/{timestamp}_{file_name}"
+
+    export_file.seek(0)
+    ok, result = s3_manager.upload_fileobj(export_file, key, content_type=mime_type)
+    if not ok:
+        return False, result
+
+    url = s3_manager.get_presigned_url(key)
+    if not url:
+        return False, "Export was uploaded but the download link could not be created."
+    return True, url
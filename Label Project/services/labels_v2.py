@@ -5,54 +5,67 @@ from sqlalchemy import text, exc
 import logging
 import streamlit as st
 from datetime import date
-from typing import Dict, Any, List, Optional
+from typing import BinaryIO, Dict, Any, Iterator, List, Mapping, Optional
 import json
-from utils.s3_utils import S3Manager
+from utils.cache import SharedCache, coalesce, shared_cached
+from utils.config import config
+from utils.s3_utils import S3UnavailableError, get_s3_manager
+from services import print_stats as print_stats_svc
+from services import events
+from services.models import PrintRecord, ProductLine, RequirementBundle
+from types import MappingProxyType
 
 logger = logging.getLogger(__name__)
 
-# Initialize S3
-try:
-    s3_manager = S3Manager()
-except Exception as e:
-    st.error("Unable to connect to file storage service. Please contact support.")
-    logger.error(f"S3 initialization failed: {e}")
-    st.stop()
+# Cache dùng chung cho trang chủ (thống kê + hoạt động gần đây), xóa khi có requirement mới
+home_page_cache = SharedCache("home_page", ttl_seconds=config.get_app_setting("CACHE_TTL_SECONDS", 300))
+
+# Requirement và content field (template nhãn) được xóa cache chính xác qua services.events
+# nên có thể giữ lâu. Không có Redis thì các replica khác không nhận được thông báo xóa,
+# khi đó L1 chỉ giữ trong CACHE_TTL_SECONDS.
+REFERENCE_CACHE_TTL_SECONDS = config.get_app_setting("REFERENCE_CACHE_TTL_SECONDS", 21600)
+REFERENCE_L1_TTL_SECONDS = (
+    REFERENCE_CACHE_TTL_SECONDS if config.get_app_setting("REDIS_URL")
+    else config.get_app_setting("CACHE_TTL_SECONDS", 300)
+)
+
+@shared_cached("active_customers", ttl_seconds=600, l1_ttl_seconds=300, stale_while_revalidate=True)
+def _fetch_active_customers() -> List[Dict[str, Any]]:
+    engine = get_db_engine()
+    
+    summary_query = text("""
+    SELECT
+        c.id as customer_id,
+        c.local_name as customer_local_name,
+        c.english_name as customer_english_name,
+        c.company_code as customer_code,
+        ct.name as company_type
+    FROM companies AS c
+    JOIN companies_company_types AS cct ON c.id = cct.companies_id
+    JOIN company_types AS ct ON ct.id = cct.company_type_id
+    WHERE ct.name = "customer"
+    ORDER BY c.english_name
+    """)
+    
+    with engine.connect() as conn:
+        results = conn.execute(summary_query).fetchall()
+    
+    return [
+        {
+            'customer_id': int(row.customer_id or 0),
+            'customer_local_name': str(row.customer_local_name or "N/A"),
+            'customer_english_name': str(row.customer_english_name or "N/A"),
+            'customer_code': str(row.customer_code or "N/A"),
+            'company_type': str(row.company_type or "N/A")
+        }
+        for row in results
+    ]
+
 
 def get_active_customers() -> List[Dict[str, Any]]:
     """Lấy danh sách tất cả các khách hàng đang hoạt động."""
     try:
-        engine = get_db_engine()
-        
-        summary_query = text("""
-        SELECT
-            c.id as customer_id,
-            c.local_name as customer_local_name,
-            c.english_name as customer_english_name,
-            c.company_code as customer_code,
-            ct.name as company_type
-        FROM companies AS c
-        JOIN companies_company_types AS cct ON c.id = cct.companies_id
-        JOIN company_types AS ct ON ct.id = cct.company_type_id
-        WHERE ct.name = "customer"
-        ORDER BY c.english_name
-        """)
-        
-        with engine.connect() as conn:
-            results = conn.execute(summary_query).fetchall()
-        
-        if results:
-            customers_list = [
-                {
-                    'customer_id': int(row.customer_id or 0),
-                    'customer_local_name': str(row.customer_local_name or "N/A"),
-                    'customer_english_name': str(row.customer_english_name or "N/A"),
-                    'customer_code': str(row.customer_code or "N/A"),
-                    'company_type': str(row.company_type or "N/A")
-                }
-                for row in results
-            ]
-            return customers_list
+        return list(_fetch_active_customers())
             
     except Exception as e:
         logger.error(f"Failed to get customer list: {e}")
@@ -61,40 +74,43 @@ def get_active_customers() -> List[Dict[str, Any]]:
     return []
 
 
+@shared_cached("active_entities", ttl_seconds=600, l1_ttl_seconds=300, stale_while_revalidate=True)
+def _fetch_active_entities() -> List[Dict[str, Any]]:
+    engine = get_db_engine()
+    
+    summary_query = text("""
+    SELECT 
+        c.id as entity_id, 
+        c.local_name as entity_local_name, 
+        c.english_name as entity_english_name, 
+        c.company_code as entity_code, 
+        ct.name as company_type
+    FROM companies AS c
+    JOIN companies_company_types AS cct ON c.id = cct.companies_id
+    JOIN company_types AS ct ON ct.id = cct.company_type_id
+    WHERE ct.name = "internal"
+    ORDER BY c.english_name
+    """)
+    
+    with engine.connect() as conn:
+        results = conn.execute(summary_query).fetchall()
+    
+    return [
+        {
+            'entity_id': int(row.entity_id or 0),
+            'entity_local_name': str(row.entity_local_name or "N/A"),
+            'entity_english_name': str(row.entity_english_name or "N/A"),
+            'entity_code': str(row.entity_code or "N/A"),
+            'company_type': str(row.company_type or "N/A")
+        }
+        for row in results
+    ]
+
+
 def get_active_entities() -> List[Dict[str, Any]]:
     """Lấy danh sách tất cả các khách hàng đang hoạt động."""
     try:
-        engine = get_db_engine()
-        
-        summary_query = text("""
-        SELECT 
-            c.id as entity_id, 
-            c.local_name as entity_local_name, 
-            c.english_name as entity_english_name, 
-            c.company_code as entity_code, 
-            ct.name as company_type
-        FROM companies AS c
-        JOIN companies_company_types AS cct ON c.id = cct.companies_id
-        JOIN company_types AS ct ON ct.id = cct.company_type_id
-        WHERE ct.name = "internal"
-        ORDER BY c.english_name
-        """)
-        
-        with engine.connect() as conn:
-            results = conn.execute(summary_query).fetchall()
-        
-        if results:
-            entity_list = [
-                {
-                    'entity_id': int(row.entity_id or 0),
-                    'entity_local_name': str(row.entity_local_name or "N/A"),
-                    'entity_english_name': str(row.entity_english_name or "N/A"),
-                    'entity_code': str(row.entity_code or "N/A"),
-                    'company_type': str(row.company_type or "N/A")
-                }
-                for row in results
-            ]
-            return entity_list
+        return list(_fetch_active_entities())
             
     except Exception as e:
         logger.error(f"Failed to get entity list: {e}")
@@ -103,6 +119,28 @@ def get_active_entities() -> List[Dict[str, Any]]:
     return []
 
 
+@shared_cached("dns_for_customer_entity", ttl_seconds=300, l1_ttl_seconds=60)
+def _fetch_dns_for_customer_and_entity(customer_code: str, entity_code: str) -> List[str]:
+    engine = get_db_engine()
+    
+    query = text("""
+        SELECT DISTINCT dfv.dn_number
+        FROM delivery_full_view AS dfv
+        WHERE 
+            dfv.shipment_status = 'STOCKED_OUT'
+            AND dfv.customer_code = :customer_code
+            AND dfv.legal_entity_code = :entity_code
+        ORDER BY dfv.dn_number
+    """)
+    
+    with engine.connect() as conn:
+        # Truyền tham số là các code
+        params = {"customer_code": customer_code, "entity_code": entity_code}
+        results = conn.execute(query, params).fetchall()
+    
+    return [row.dn_number for row in results]
+
+
 def get_dns_for_customer_and_entity(customer_code: str, entity_code: str) -> List[Dict[str, Any]]:
 
     if not customer_code or not entity_code:
@@ -110,26 +148,7 @@ def get_dns_for_customer_and_entity(customer_code: str, entity_code: str) -> Lis
         return []
         
     try:
-        engine = get_db_engine()
-        
-        query = text("""
-            SELECT DISTINCT dfv.dn_number
-            FROM delivery_full_view AS dfv
-            WHERE 
-                dfv.shipment_status = 'STOCKED_OUT'
-                AND dfv.customer_code = :customer_code
-                AND dfv.legal_entity_code = :entity_code
-            ORDER BY dfv.dn_number
-        """)
-        
-        with engine.connect() as conn:
-            # Truyền tham số là các code
-            params = {"customer_code": customer_code, "entity_code": entity_code}
-            results = conn.execute(query, params).fetchall()
-        
-        if results:
-            dn_list = [row.dn_number for row in results]
-            return dn_list
+        return list(_fetch_dns_for_customer_and_entity(customer_code, entity_code))
             
     except Exception as e:
         logger.error(f"Failed to get DN list for customer code {customer_code} and entity code {entity_code}: {e}")
@@ -138,82 +157,86 @@ def get_dns_for_customer_and_entity(customer_code: str, entity_code: str) -> Lis
     return []
 
 
-def get_products_by_dns(dn_numbers: list[str], group_by_batch_no: bool = True) -> List[Dict[str, Any]]:
-    if not dn_numbers:
-        logger.warning("No DN numbers provided to get_products_by_dns.")
-        return []
-
-    try:
-        engine = get_db_engine()
-        
-        # Cấu hình câu truy vấn dựa trên lựa chọn grouping
-        if group_by_batch_no:
-            batch_no_select = "ih.batch_no"
-            group_by_clause = "GROUP BY dfv.product_id, TRIM(ih.batch_no), dfv.dn_number"
-        else:
-            # GROUP_CONCAT gộp nhiều batch_no thành một chuỗi, phân tách bởi dấu phẩy
-            batch_no_select = "GROUP_CONCAT(DISTINCT TRIM(ih.batch_no) SEPARATOR ', ') AS batch_no"
-            group_by_clause = "GROUP BY dfv.product_id, dfv.dn_number"
-
-        # Sử dụng f-string để chèn các phần đã cấu hình vào câu query chính
-        query_string = f"""
-            SELECT
-                dfv.dn_number, dfv.customer, dfv.legal_entity, dfv.pt_code, dfv.product_pn, {batch_no_select},
-                dfv.package_size, dfv.brand, p.shelf_life, p.uom,
-                SUM(DISTINCT dfv.standard_quantity) as total_standard_qty, 
-                SUM(DISTINCT dfv.selling_quantity) as total_selling_qty,
-                pcm.code AS product_mapped_code, pcm.mapped_name AS product_mapped_name
-            FROM
-                delivery_full_view AS dfv
-            JOIN 
+@coalesce()
+def _fetch_products_by_dns(dn_numbers: tuple, group_by_batch_no: bool) -> List[ProductLine]:
+    engine = get_db_engine()
+    
+    # Cấu hình câu truy vấn dựa trên lựa chọn grouping
+    if group_by_batch_no:
+        batch_no_select = "ih.batch_no"
+        group_by_clause = "GROUP BY dfv.product_id, TRIM(ih.batch_no), dfv.dn_number"
+    else:
+        # GROUP_CONCAT gộp nhiều batch_no thành một chuỗi, phân tách bởi dấu phẩy
+        batch_no_select = "GROUP_CONCAT(DISTINCT TRIM(ih.batch_no) SEPARATOR ', ') AS batch_no"
+        group_by_clause = "GROUP BY dfv.product_id, dfv.dn_number"
+
+    # Sử dụng f-string để chèn các phần đã cấu hình vào câu query chính
+    query_string = f"""
+        SELECT
+            dfv.dn_number, dfv.customer, dfv.legal_entity, dfv.pt_code, dfv.product_pn, {batch_no_select},
+            dfv.package_size, dfv.brand, p.shelf_life, p.uom,
+            SUM(DISTINCT dfv.standard_quantity) as total_standard_qty, 
+            SUM(DISTINCT dfv.selling_quantity) as total_selling_qty,
+            pcm.code AS product_mapped_code, pcm.mapped_name AS product_mapped_name
+        FROM
+            delivery_full_view AS dfv
+        JOIN 
 				order_comfirmation_details AS ocd ON dfv.oc_line_id = ocd.id
 			JOIN
 				quotation_details AS qd ON ocd.quotation_detail_id = qd.id
 			JOIN
 				product_code_mappings AS pcm ON qd.product_code_mapping_id = pcm.id
-            JOIN
-                products AS p ON dfv.product_id = p.id
-            JOIN
-                stock_out_delivery_request_details AS sodrd ON dfv.delivery_id = sodrd.delivery_id
-            JOIN
-                inventory_histories AS ih ON sodrd.id = ih.action_detail_id
-            WHERE
-                ih.type = 'stockOutDelivery' 
-                AND dfv.shipment_status = 'STOCKED_OUT'
-                AND dfv.dn_number IN :selected_dns
-            {group_by_clause}
-            ORDER BY
-                dfv.product_pn
-        """
-        
-        query = text(query_string)
+        JOIN
+            products AS p ON dfv.product_id = p.id
+        JOIN
+            stock_out_delivery_request_details AS sodrd ON dfv.delivery_id = sodrd.delivery_id
+        JOIN
+            inventory_histories AS ih ON sodrd.id = ih.action_detail_id
+        WHERE
+            ih.type = 'stockOutDelivery' 
+            AND dfv.shipment_status = 'STOCKED_OUT'
+            AND dfv.dn_number IN :selected_dns
+        {group_by_clause}
+        ORDER BY
+            dfv.product_pn
+    """
+    
+    query = text(query_string)
+
+    with engine.connect() as conn:
+        params = {"selected_dns": tuple(dn_numbers)}
+        results = conn.execute(query, params).fetchall()
+    
+    return [
+        ProductLine(
+            dn_number=str(row.dn_number or "N/A"),
+            customer=str(row.customer or "N/A"),
+            legal_entity=str(row.legal_entity or "N/A"),
+            pt_code=str(row.pt_code or "N/A"),
+            product_pn=str(row.product_pn or "N/A"),
+            batch_no=str(row.batch_no or "N/A"),
+            package_size=str(row.package_size or "N/A"),
+            brand=str(row.brand or "N/A"),
+            shelf_life=int(row.shelf_life or 0),
+            uom=str(row.uom or "N/A"),
+            total_standard_qty=float(row.total_standard_qty or 0.0),
+            total_selling_qty=float(row.total_selling_qty or 0.0),
+            product_mapped_code=str(row.product_mapped_code or "N/A"),
+            product_mapped_name=str(row.product_mapped_name or "N/A"),
+        )
+        for row in results
+    ]
+
+
+def get_products_by_dns(dn_numbers: list[str], group_by_batch_no: bool = True) -> List[ProductLine]:
+    if not dn_numbers:
+        logger.warning("No DN numbers provided to get_products_by_dns.")
+        return []
+
+    try:
+        # Các session chọn cùng bộ DN cùng lúc dùng chung một query
+        return list(_fetch_products_by_dns(tuple(dn_numbers), group_by_batch_no))
 
-        with engine.connect() as conn:
-            params = {"selected_dns": tuple(dn_numbers)}
-            results = conn.execute(query, params).fetchall()
-        
-        if results:
-            products_list = [
-                {
-                    'dn_number': str(row.dn_number or "N/A"),
-                    'customer': str(row.customer or "N/A"),
-                    'legal_entity': str(row.legal_entity or "N/A"),
-                    'pt_code': str(row.pt_code or "N/A"),
-                    'product_pn': str(row.product_pn or "N/A"),
-                    'batch_no': str(row.batch_no or "N/A"),
-                    'package_size': str(row.package_size or "N/A"),
-                    'brand': str(row.brand or "N/A"),
-                    'shelf_life': int(row.shelf_life or 0),
-                    'uom': str(row.uom or "N/A"),
-                    'total_standard_qty': float(row.total_standard_qty or 0.0),
-                    'total_selling_qty': float(row.total_selling_qty or 0.0),
-                    'product_mapped_code': str(row.product_mapped_code or "N/A"),
-                    'product_mapped_name': str(row.product_mapped_name or "N/A"),
-                }
-                for row in results
-            ]
-            return products_list
-            
     except Exception as e:
         logger.error(f"Failed to get products for DNs {dn_numbers} with grouping option: {e}")
         st.error("Không thể tải dữ liệu sản phẩm. Vui lòng thử lại.")
@@ -221,6 +244,65 @@ def get_products_by_dns(dn_numbers: list[str], group_by_batch_no: bool = True) -
     return []
 
 
+@shared_cached("customer_label_requirements", ttl_seconds=REFERENCE_CACHE_TTL_SECONDS, l1_ttl_seconds=REFERENCE_L1_TTL_SECONDS)
+def _fetch_customer_label_requirements(customer_id: int) -> List[Dict[str, Any]]:
+    engine = get_db_engine()
+    
+    # Câu query để lấy các yêu cầu đang hoạt động và còn hiệu lực
+    query = text("""
+        SELECT
+            id,
+            customer_id,
+            customer_code,
+            customer_name,
+            requirement_name,
+            requirement_type,
+            label_size,
+            printer_dpi,
+            printer_type,
+            requirement_file_s3_key,
+            sample_file_s3_key,
+            special_notes,
+            status,
+            effective_from,
+            effective_to,
+            version
+        FROM
+            customer_label_requirements
+        WHERE
+            customer_id = :customer_id
+            AND status = 'ACTIVE'
+        ORDER BY
+            requirement_type, requirement_name;
+    """)
+
+    with engine.connect() as conn:
+        params = {"customer_id": customer_id, "current_date": date.today()}
+        results = conn.execute(query, params).fetchall()
+
+    return [
+        {
+            'id': row.id,
+            'customer_id': row.customer_id,
+            'customer_code': str(row.customer_code or ''),
+            'customer_name': str(row.customer_name or ''),
+            'requirement_name': str(row.requirement_name or ''),
+            'requirement_type': str(row.requirement_type or ''),
+            'label_size': str(row.label_size or ''),
+            'printer_dpi': int(row.printer_dpi or 0),
+            'printer_type': str(row.printer_type or ''),
+            'requirement_file_s3_key': str(row.requirement_file_s3_key or ''),
+            'sample_file_s3_key': str(row.sample_file_s3_key or ''),
+            'special_notes': str(row.special_notes or ''),
+            'status': str(row.status or ''),
+            'effective_from': row.effective_from,
+            'effective_to': row.effective_to,
+            'version': int(row.version or 1)
+        }
+        for row in results
+    ]
+
+
 def get_customer_label_requirements(customer_id: int) -> List[Dict[str, Any]]:
 
     if not customer_id:
@@ -228,63 +310,8 @@ def get_customer_label_requirements(customer_id: int) -> List[Dict[str, Any]]:
         return []
 
     try:
-        engine = get_db_engine()
-        
-        # Câu query để lấy các yêu cầu đang hoạt động và còn hiệu lực
-        query = text("""
-            SELECT
-                id,
-                customer_id,
-                customer_code,
-                customer_name,
-                requirement_name,
-                requirement_type,
-                label_size,
-                printer_dpi,
-                printer_type,
-                requirement_file_s3_key,
-                sample_file_s3_key,
-                special_notes,
-                status,
-                effective_from,
-                effective_to,
-                version
-            FROM
-                customer_label_requirements
-            WHERE
-                customer_id = :customer_id
-                AND status = 'ACTIVE'
-            ORDER BY
-                requirement_type, requirement_name;
-        """)
-
-        with engine.connect() as conn:
-            params = {"customer_id": customer_id, "current_date": date.today()}
-            results = conn.execute(query, params).fetchall()
-
-        if results:
-            requirements_list = [
-                {
-                    'id': row.id,
-                    'customer_id': row.customer_id,
-                    'customer_code': str(row.customer_code or ''),
-                    'customer_name': str(row.customer_name or ''),
-                    'requirement_name': str(row.requirement_name or ''),
-                    'requirement_type': str(row.requirement_type or ''),
-                    'label_size': str(row.label_size or ''),
-                    'printer_dpi': int(row.printer_dpi or 0),
-                    'printer_type': str(row.printer_type or ''),
-                    'requirement_file_s3_key': str(row.requirement_file_s3_key or ''),
-                    'sample_file_s3_key': str(row.sample_file_s3_key or ''),
-                    'special_notes': str(row.special_notes or ''),
-                    'status': str(row.status or ''),
-                    'effective_from': row.effective_from,
-                    'effective_to': row.effective_to,
-                    'version': int(row.version or 1)
-                }
-                for row in results
-            ]
-            return requirements_list
+        # Các session gọi đồng thời với cùng customer_id dùng chung một query
+        return list(_fetch_customer_label_requirements(customer_id))
 
     except Exception as e:
         logger.error(f"Failed to get label requirements for customer ID {customer_id}: {e}")
@@ -293,6 +320,25 @@ def get_customer_label_requirements(customer_id: int) -> List[Dict[str, Any]]:
     return []
 
 
+def open_requirement_file(s3_key: str) -> tuple[bool, str, Optional[BinaryIO]]:
+    """
+    Mở file đính kèm của requirement (requirement_file_s3_key / sample_file_s3_key) từ S3.
+
+    File được tải qua TransferManager vào stream (SpooledTemporaryFile), không đọc cả file
+    vào một bytes object; nơi gọi phải đóng stream khi xong.
+    """
+    try:
+        s3_manager = get_s3_manager()
+    except S3UnavailableError as e:
+        logger.error(f"S3 unavailable: {e}")
+        return False, "Unable to connect to file storage service. Please contact support.", None
+
+    stream = s3_manager.open_file(s3_key)
+    if stream is None:
+        return False, f"Could not download file: {s3_key.rsplit('/', 1)[-1]}", None
+    return True, "File downloaded", stream
+
+
 def create_customer_label_requirement(requirement_data: Dict[str, Any]) -> tuple[bool, str, int | None]:
 
     try:
@@ -334,6 +380,7 @@ def create_customer_label_requirement(requirement_data: Dict[str, Any]) -> tuple
                 result = conn.execute(insert_query, params)
                 new_id = result.lastrowid
                 transaction.commit()
+                events.publish(events.REQUIREMENT_CREATED, customer_id=params["customer_id"], requirement_id=new_id)
                 msg = f"Successfully created new label requirement with ID: {new_id}"
                 logger.info(msg)
                 return True, msg, new_id
@@ -348,6 +395,128 @@ def create_customer_label_requirement(requirement_data: Dict[str, Any]) -> tuple
         return False, msg, None
 
 
+def _query_requirement_statistics() -> Dict[str, int]:
+    engine = get_db_engine()
+
+    stats_query = text("""
+    SELECT 
+        COUNT(DISTINCT id) as total_requirements,
+        COUNT(DISTINCT customer_id) as total_customers,
+        SUM(CASE WHEN status = 'ACTIVE' THEN 1 ELSE 0 END) as active_requirements,
+        SUM(CASE WHEN created_date >= DATE_SUB(NOW(), INTERVAL 7 DAY) THEN 1 ELSE 0 END) as recent_requirements
+    FROM customer_label_requirements
+    """)
+
+    with engine.connect() as conn:
+        stats = conn.execute(stats_query).fetchone()
+
+    return {
+        'total_requirements': int(stats.total_requirements or 0) if stats else 0,
+        'total_customers': int(stats.total_customers or 0) if stats else 0,
+        'active_requirements': int(stats.active_requirements or 0) if stats else 0,
+        'recent_requirements': int(stats.recent_requirements or 0) if stats else 0,
+    }
+
+
+def get_requirement_statistics() -> Optional[Dict[str, int]]:
+    """Thống kê nhanh customer_label_requirements cho trang chủ (cache dùng chung, TTL)."""
+    try:
+        return home_page_cache.get_or_load("requirement_statistics", _query_requirement_statistics)
+    except Exception as e:
+        logger.error(f"Failed to get requirement statistics: {e}")
+        return None
+
+
+def _query_recent_requirements(limit: int) -> List[Dict[str, Any]]:
+    engine = get_db_engine()
+
+    recent_query = text("""
+    SELECT 
+        requirement_name,
+        customer_name,
+        created_by,
+        created_date,
+        status
+    FROM customer_label_requirements
+    ORDER BY created_date DESC
+    LIMIT :limit
+    """)
+
+    with engine.connect() as conn:
+        results = conn.execute(recent_query, {"limit": limit}).fetchall()
+
+    return [
+        {
+            'requirement_name': str(row.requirement_name or ''),
+            'customer_name': str(row.customer_name or ''),
+            'created_by': str(row.created_by or ''),
+            'created_date': row.created_date,
+            'status': str(row.status or ''),
+        }
+        for row in results
+    ]
+
+
+def get_recent_requirements(limit: int = 5) -> Optional[List[Dict[str, Any]]]:
+    """Các requirement được tạo gần nhất cho trang chủ (cache dùng chung, TTL)."""
+    try:
+        return home_page_cache.get_or_load(
+            ("recent_requirements", limit),
+            lambda: _query_recent_requirements(limit)
+        )
+    except Exception as e:
+        logger.error(f"Failed to get recent requirements: {e}")
+        return None
+
+
+def _label_content_field_row_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'requirement_id': row.requirement_id,
+        'field_code': str(row.field_code or ''),
+        'field_name': str(row.field_name or ''),
+        'field_type': str(row.field_type or ''),
+        'data_source': str(row.data_source or ''),
+        'format_pattern': str(row.format_pattern or ''),
+        'sample_value': str(row.sample_value or ''),
+        'display_order': int(row.display_order or 999),
+        'is_required': bool(row.is_required),
+        'special_rules': str(row.special_rules or '')
+    }
+
+
+@shared_cached("label_content_fields", ttl_seconds=REFERENCE_CACHE_TTL_SECONDS, l1_ttl_seconds=REFERENCE_L1_TTL_SECONDS)
+def _fetch_label_content_fields(requirement_id: int) -> List[Dict[str, Any]]:
+    engine = get_db_engine()
+    
+    query = text("""
+        SELECT
+            id,
+            requirement_id,
+            field_code,
+            field_name,
+            field_type,
+            data_source,
+            format_pattern,
+            sample_value,
+            display_order,
+            is_required,
+            special_rules
+        FROM
+            label_content_fields
+        WHERE
+            requirement_id = :requirement_id
+        ORDER BY
+            display_order, field_name;
+    """)
+
+    with engine.connect() as conn:
+        params = {"requirement_id": requirement_id}
+        results = conn.execute(query, params).fetchall()
+
+    return [_label_content_field_row_to_dict(row) for row in results]
+
+
 def get_label_content_fields(requirement_id: int) -> List[Dict[str, Any]]:
 
     if not requirement_id:
@@ -355,51 +524,7 @@ def get_label_content_fields(requirement_id: int) -> List[Dict[str, Any]]:
         return []
 
     try:
-        engine = get_db_engine()
-        
-        query = text("""
-            SELECT
-                id,
-                requirement_id,
-                field_code,
-                field_name,
-                field_type,
-                data_source,
-                format_pattern,
-                sample_value,
-                display_order,
-                is_required,
-                special_rules
-            FROM
-                label_content_fields
-            WHERE
-                requirement_id = :requirement_id
-            ORDER BY
-                display_order, field_name;
-        """)
-
-        with engine.connect() as conn:
-            params = {"requirement_id": requirement_id}
-            results = conn.execute(query, params).fetchall()
-
-        if results:
-            fields_list = [
-                {
-                    'id': row.id,
-                    'requirement_id': row.requirement_id,
-                    'field_code': str(row.field_code or ''),
-                    'field_name': str(row.field_name or ''),
-                    'field_type': str(row.field_type or ''),
-                    'data_source': str(row.data_source or ''),
-                    'format_pattern': str(row.format_pattern or ''),
-                    'sample_value': str(row.sample_value or ''),
-                    'display_order': int(row.display_order or 999),
-                    'is_required': bool(row.is_required),
-                    'special_rules': str(row.special_rules or '')
-                }
-                for row in results
-            ]
-            return fields_list
+        return list(_fetch_label_content_fields(requirement_id))
 
     except Exception as e:
         logger.error(f"Failed to get label content fields for requirement ID {requirement_id}: {e}")
@@ -408,6 +533,77 @@ def get_label_content_fields(requirement_id: int) -> List[Dict[str, Any]]:
     return []
 
 
+@shared_cached("customer_content_fields", ttl_seconds=REFERENCE_CACHE_TTL_SECONDS, l1_ttl_seconds=REFERENCE_L1_TTL_SECONDS)
+def _fetch_content_fields_for_customer(customer_id: int) -> List[Dict[str, Any]]:
+    """Content field của mọi requirement ACTIVE của customer, trong một query."""
+    engine = get_db_engine()
+
+    query = text("""
+        SELECT
+            lcf.id,
+            lcf.requirement_id,
+            lcf.field_code,
+            lcf.field_name,
+            lcf.field_type,
+            lcf.data_source,
+            lcf.format_pattern,
+            lcf.sample_value,
+            lcf.display_order,
+            lcf.is_required,
+            lcf.special_rules
+        FROM
+            label_content_fields AS lcf
+        JOIN
+            customer_label_requirements AS clr ON clr.id = lcf.requirement_id
+        WHERE
+            clr.customer_id = :customer_id
+            AND clr.status = 'ACTIVE'
+        ORDER BY
+            lcf.requirement_id, lcf.display_order, lcf.field_name;
+    """)
+
+    with engine.connect() as conn:
+        results = conn.execute(query, {"customer_id": customer_id}).fetchall()
+
+    return [_label_content_field_row_to_dict(row) for row in results]
+
+
+@coalesce(ttl_seconds=REFERENCE_L1_TTL_SECONDS, maxsize=512)
+def _build_requirement_bundles(customer_id: int) -> Mapping[int, RequirementBundle]:
+    requirements = _fetch_customer_label_requirements(customer_id)
+    fields = _fetch_content_fields_for_customer(customer_id)
+
+    fields_by_requirement: Dict[int, List[Dict[str, Any]]] = {}
+    for field in fields:
+        fields_by_requirement.setdefault(field['requirement_id'], []).append(field)
+
+    return MappingProxyType({
+        req['id']: RequirementBundle.from_rows(req, fields_by_requirement.get(req['id'], []))
+        for req in requirements
+    })
+
+
+def get_requirement_bundles(customer_id: int) -> Mapping[int, RequirementBundle]:
+    """
+    Lấy tất cả requirement ACTIVE của customer kèm content field (2 query gộp), theo id.
+
+    Kết quả là đối tượng chỉ đọc được cache dùng chung theo customer,
+    đổi requirement trên giao diện chỉ là tra cứu dict.
+    """
+    if not customer_id:
+        logger.warning("Customer ID is not provided to get requirement bundles.")
+        return MappingProxyType({})
+
+    try:
+        return _build_requirement_bundles(customer_id)
+
+    except Exception as e:
+        logger.error(f"Failed to get requirement bundles for customer ID {customer_id}: {e}")
+        st.error("Không thể tải dữ liệu yêu cầu nhãn. Vui lòng thử lại.")
+
+    return MappingProxyType({})
+
+
 def add_label_content_field(field_data: Dict[str, Any]) -> tuple[bool, str, int | None]:
 
     try:
@@ -434,7 +630,17 @@ def add_label_content_field(field_data: Dict[str, Any]) -> tuple[bool, str, int
             with conn.begin() as transaction:
                 result = conn.execute(insert_query, field_data)
                 new_id = result.lastrowid
+                customer_id = conn.execute(
+                    text("SELECT customer_id FROM customer_label_requirements WHERE id = :requirement_id"),
+                    {"requirement_id": field_data["requirement_id"]}
+                ).scalar()
                 transaction.commit()
+                events.publish(
+                    events.CONTENT_FIELD_CREATED,
+                    requirement_id=field_data["requirement_id"],
+                    customer_id=customer_id,
+                    field_id=new_id
+                )
                 msg = f"Successfully added a new label content field with ID: {new_id}"
                 logger.info(msg)
                 return True, msg, new_id
@@ -455,6 +661,30 @@ def add_label_content_field(field_data: Dict[str, Any]) -> tuple[bool, str, int
         return False, msg, None
 
 
+# ==================== Xóa cache theo sự kiện ghi dữ liệu ====================
+
+# Bundle chỉ cache trong process, được dựng từ hai cache Redis cùng key customer_id:
+# xóa theo chúng để cả thông báo từ replica khác cũng làm mới bundle
+_fetch_customer_label_requirements.cache.add_invalidation_listener(_build_requirement_bundles.cache.invalidate)
+_fetch_content_fields_for_customer.cache.add_invalidation_listener(_build_requirement_bundles.cache.invalidate)
+
+
+@events.subscribe(events.REQUIREMENT_CREATED)
+def _evict_requirement_caches(customer_id: int, **_):
+    _fetch_customer_label_requirements.invalidate(customer_id)
+    _fetch_content_fields_for_customer.invalidate(customer_id)
+    home_page_cache.invalidate()
+
+
+@events.subscribe(events.CONTENT_FIELD_CREATED)
+def _evict_content_field_caches(requirement_id: int, customer_id: Optional[int] = None, **_):
+    _fetch_label_content_fields.invalidate(requirement_id)
+    if customer_id is not None:
+        _fetch_content_fields_for_customer.invalidate(customer_id)
+    else:
+        _fetch_content_fields_for_customer.invalidate_all()
+
+
 def get_system_field_map() -> Dict[str, str]:
     """
     Trả về một bản đồ (dictionary) các mã trường hệ thống/cố định 
@@ -478,6 +708,7 @@ def get_system_field_map() -> Dict[str, str]:
         'total_selling_qty': 'Total Selling Qty',
         'product_mapped_code': 'Vendor Product Code',
         'product_mapped_name': 'Vendor Product Name',
+        'carton_serial': 'Carton No',
         
         # Các trường bổ sung từ get_label_print_history (phòng trường hợp gộp)
         'customer_name': 'Customer', # (customer_name là alias của customer)
@@ -490,7 +721,19 @@ def get_system_field_map() -> Dict[str, str]:
     }
 
 
-def get_label_print_history(       
+_LABEL_PRINT_HISTORY_COLUMNS = """
+    id, requirement_id, delivery_id, delivery_detail_id, 
+    customer_id, customer_name, dn_number, 
+    product_id, product_pn, pt_code, selling_quantity, 
+    standard_quantity, label_type, 
+    print_quantity, printed_data, printer_name, 
+    print_status, error_message, 
+    printed_by, printed_date,
+    parent_print_id, label_size, legal_entity, entity_id
+"""
+
+
+def _build_label_print_history_query(
     start_date: date, 
     end_date: date, 
     customer_id: Optional[int] = None,
@@ -499,97 +742,105 @@ def get_label_print_history(
     pt_code: Optional[str] = None,
     print_status: Optional[str] = None,
     label_type: Optional[str] = None
-) -> List[Dict[str, Any]]:
+) -> tuple[Any, Dict[str, Any]]:
+    """Dựng câu query lịch sử in tem và tham số theo bộ lọc (dùng chung cho grid và export)."""
+
+    # Lấy tất cả các cột từ bảng
+    base_query = f"SELECT {_LABEL_PRINT_HISTORY_COLUMNS} FROM label_print_history"
     
-    try:
-        engine = get_db_engine()
+    where_clauses = []
+    params = {}
+    
+    # Lọc theo ngày (bắt buộc)
+    # Sử dụng DATE() để so sánh phần ngày, bỏ qua phần thời gian
+    where_clauses.append("DATE(printed_date) BETWEEN :start_date AND :end_date")
+    params["start_date"] = start_date
+    params["end_date"] = end_date
+
+    # Thêm các bộ lọc tùy chọn
+    if customer_id is not None:
+        where_clauses.append("customer_id = :customer_id")
+        params["customer_id"] = customer_id
+
+    if entity_id is not None:
+        where_clauses.append("entity_id = :entity_id")
+        params["entity_id"] = entity_id
         
-        # Lấy tất cả các cột từ bảng
-        base_query = """
-            SELECT
-                id, requirement_id, delivery_id, delivery_detail_id, 
-                customer_id, customer_name, dn_number, 
-                product_id, product_pn, pt_code, selling_quantity, 
-                standard_quantity, label_type, 
-                print_quantity, printed_data, printer_name, 
-                print_status, error_message, 
-                printed_by, printed_date,
-                parent_print_id, label_size, legal_entity, entity_id
-            FROM label_print_history
-        """
+    if dn_number:
+        where_clauses.append("dn_number = :dn_number")
+        params["dn_number"] = dn_number
+
+    if pt_code:
+        where_clauses.append("pt_code = :pt_code")
+        params["pt_code"] = pt_code
         
-        where_clauses = []
-        params = {}
+    if print_status:
+        where_clauses.append("print_status = :print_status")
+        params["print_status"] = print_status
         
-        # Lọc theo ngày (bắt buộc)
-        # Sử dụng DATE() để so sánh phần ngày, bỏ qua phần thời gian
-        where_clauses.append("DATE(printed_date) BETWEEN :start_date AND :end_date")
-        params["start_date"] = start_date
-        params["end_date"] = end_date
-
-        # Thêm các bộ lọc tùy chọn
-        if customer_id is not None:
-            where_clauses.append("customer_id = :customer_id")
-            params["customer_id"] = customer_id
-
-        if entity_id is not None:
-            where_clauses.append("entity_id = :entity_id")
-            params["entity_id"] = entity_id
-            
-        if dn_number:
-            where_clauses.append("dn_number = :dn_number")
-            params["dn_number"] = dn_number
+    if label_type:
+        where_clauses.append("label_type = :label_type")
+        params["label_type"] = label_type
+
+    # Ghép các điều kiện lọc
+    query_string = f"{base_query} WHERE {' AND '.join(where_clauses)} ORDER BY printed_date DESC"
+    
+    return text(query_string), params
+
+
+def _label_print_history_row_to_record(row) -> PrintRecord:
+    return PrintRecord(
+        id=row.id,
+        requirement_id=row.requirement_id,
+        delivery_id=row.delivery_id,
+        delivery_detail_id=row.delivery_detail_id,
+        customer_id=row.customer_id,
+        customer_name=str(row.customer_name or ''),
+        dn_number=str(row.dn_number or ''),
+        product_id=row.product_id,
+        product_pn=str(row.product_pn or ''),
+        pt_code=str(row.pt_code or ''),
+        selling_quantity=row.selling_quantity,
+        standard_quantity=row.standard_quantity,
+        label_type=str(row.label_type or ''),
+        print_quantity=int(row.print_quantity or 0),
+        printed_data=row.printed_data, # Dữ liệu JSON
+        printer_name=str(row.printer_name or ''),
+        print_status=str(row.print_status or ''),
+        error_message=str(row.error_message or ''),
+        printed_by=str(row.printed_by or ''),
+        printed_date=row.printed_date, # Giữ nguyên kiểu timestamp
+        parent_print_id=row.parent_print_id,
+        label_size=str(row.label_size or ''),
+        entity_id=row.entity_id,
+        legal_entity=str(row.legal_entity or ''),
+    )
 
-        if pt_code:
-            where_clauses.append("pt_code = :pt_code")
-            params["pt_code"] = pt_code
-            
-        if print_status:
-            where_clauses.append("print_status = :print_status")
-            params["print_status"] = print_status
-            
-        if label_type:
-            where_clauses.append("label_type = :label_type")
-            params["label_type"] = label_type
 
-        # Ghép các điều kiện lọc
-        query_string = f"{base_query} WHERE {' AND '.join(where_clauses)} ORDER BY printed_date DESC"
+def get_label_print_history(       
+    start_date: date, 
+    end_date: date, 
+    customer_id: Optional[int] = None,
+    entity_id: Optional[int] = None,
+    dn_number: Optional[str] = None,
+    pt_code: Optional[str] = None,
+    print_status: Optional[str] = None,
+    label_type: Optional[str] = None
+) -> List[PrintRecord]:
+    
+    try:
+        engine = get_db_engine()
         
-        query = text(query_string)
+        query, params = _build_label_print_history_query(
+            start_date, end_date, customer_id, entity_id,
+            dn_number, pt_code, print_status, label_type
+        )
         
         with engine.connect() as conn:
             results = conn.execute(query, params).fetchall()
         
         if results:
-            history_list = [
-                {
-                    'id': row.id,
-                    'requirement_id': row.requirement_id,
-                    'delivery_id': row.delivery_id,
-                    'delivery_detail_id': row.delivery_detail_id,
-                    'customer_id': row.customer_id,
-                    'customer_name': str(row.customer_name or ''),
-                    'dn_number': str(row.dn_number or ''),
-                    'product_id': row.product_id,
-                    'product_pn': str(row.product_pn or ''),
-                    'pt_code': str(row.pt_code or ''),
-                    'selling_quantity': row.selling_quantity,
-                    'standard_quantity': row.standard_quantity,
-                    'label_type': str(row.label_type or ''),
-                    'print_quantity': int(row.print_quantity or 0),
-                    'printed_data': row.printed_data, # Dữ liệu JSON
-                    'printer_name': str(row.printer_name or ''),
-                    'print_status': str(row.print_status or ''),
-                    'error_message': str(row.error_message or ''),
-                    'printed_by': str(row.printed_by or ''),
-                    'printed_date': row.printed_date, # Giữ nguyên kiểu timestamp
-                    'parent_print_id': row.parent_print_id,
-                    'label_size': str(row.label_size or ''),
-                    'entity_id': row.entity_id,
-                    'legal_entity': str(row.legal_entity or ''),
-                }
-                for row in results
-            ]
+            history_list = [_label_print_history_row_to_record(row) for row in results]
             return history_list
             
     except Exception as e:
@@ -599,6 +850,36 @@ def get_label_print_history(
     return []
 
 
+def iter_label_print_history(
+    start_date: date, 
+    end_date: date, 
+    customer_id: Optional[int] = None,
+    entity_id: Optional[int] = None,
+    dn_number: Optional[str] = None,
+    pt_code: Optional[str] = None,
+    print_status: Optional[str] = None,
+    label_type: Optional[str] = None,
+    chunk_size: int = 1000
+) -> Iterator[List[PrintRecord]]:
+    """
+    Duyệt lịch sử in tem theo từng khối (chunk) bằng server-side cursor.
+
+    Khác với get_label_print_history, hàm này không tải toàn bộ kết quả vào bộ nhớ:
+    mỗi lần chỉ giữ tối đa `chunk_size` dòng. Lỗi DB được ném ra cho nơi gọi xử lý.
+    """
+    engine = get_db_engine()
+
+    query, params = _build_label_print_history_query(
+        start_date, end_date, customer_id, entity_id,
+        dn_number, pt_code, print_status, label_type
+    )
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(query, params)
+        for partition in result.partitions():
+            yield [_label_print_history_row_to_record(row) for row in partition]
+
+
 def add_label_print_history(print_data: Dict[str, Any]) -> tuple[bool, str, int | None]:
     
     required_keys = ["requirement_id", "customer_id", "entity_id", "label_type", "printed_by"]
@@ -645,7 +926,16 @@ def add_label_print_history(print_data: Dict[str, Any]) -> tuple[bool, str, int
             with conn.begin() as transaction:
                 result = conn.execute(insert_query, valid_params)
                 new_id = result.lastrowid
+                # Cập nhật bảng tổng hợp theo ngày trong cùng transaction
+                print_stats_svc.record_print_job(conn, new_id, print_data)
                 transaction.commit()
+                events.publish(
+                    events.PRINT_HISTORY_CREATED,
+                    history_id=new_id,
+                    customer_id=print_data.get("customer_id"),
+                    requirement_id=print_data.get("requirement_id"),
+                    parent_print_id=print_data.get("parent_print_id")
+                )
                 msg = f"Successfully added label print history with ID: {new_id}"
                 logger.info(msg)
                 return True, msg, new_id
@@ -0,0 +1,164 @@
+# services/models.py
+
+from collections.abc import Mapping
+from dataclasses import dataclass, fields, replace
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+
+@lru_cache(maxsize=None)
+def _field_names(cls) -> Tuple[str, ...]:
+    return tuple(f.name for f in fields(cls))
+
+
+class _Record(Mapping):
+    """
+    Nền cho các model bất biến (frozen, __slots__).
+
+    Đọc được như dict (.get, [], in, **) để các page và printer dùng như trước,
+    nhưng không cần copy phòng thủ: cùng một object cache được chia sẻ giữa các session.
+    Muốn đổi giá trị thì dùng replace(), các thuộc tính còn lại được dùng chung.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _field_names(type(self)):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(_field_names(type(self)))
+
+    def __len__(self) -> int:
+        return len(_field_names(type(self)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in _field_names(type(self))}
+
+    def replace(self, **changes: Any):
+        return replace(self, **changes)
+
+    @classmethod
+    def from_row(cls, row: Mapping):
+        """Tạo model từ dict/row, bỏ qua các key không thuộc model."""
+        return cls(**{name: row[name] for name in _field_names(cls) if name in row})
+
+
+@dataclass(frozen=True, slots=True, eq=True)
+class Requirement(_Record):
+    id: int
+    customer_id: Optional[int] = None
+    customer_code: str = ''
+    customer_name: str = ''
+    requirement_name: str = ''
+    requirement_type: str = ''
+    label_size: str = ''
+    printer_dpi: int = 0
+    printer_type: str = ''
+    requirement_file_s3_key: str = ''
+    sample_file_s3_key: str = ''
+    special_notes: str = ''
+    status: str = ''
+    effective_from: Optional[date] = None
+    effective_to: Optional[date] = None
+    version: int = 1
+
+
+@dataclass(frozen=True, slots=True, eq=True)
+class ContentField(_Record):
+    id: int
+    requirement_id: int
+    field_code: str = ''
+    field_name: str = ''
+    field_type: str = ''
+    data_source: str = ''
+    format_pattern: str = ''
+    sample_value: str = ''
+    display_order: int = 999
+    is_required: bool = False
+    special_rules: str = ''
+
+
+@dataclass(frozen=True, slots=True, eq=True)
+class ProductLine(_Record):
+    """Một dòng sản phẩm của DN (hoặc dữ liệu gộp cho Package Label)."""
+
+    dn_number: str = 'N/A'
+    customer: str = 'N/A'
+    legal_entity: str = 'N/A'
+    pt_code: str = 'N/A'
+    product_pn: str = 'N/A'
+    batch_no: str = 'N/A'
+    package_size: str = 'N/A'
+    brand: str = 'N/A'
+    shelf_life: Any = 0
+    uom: str = 'N/A'
+    total_standard_qty: float = 0.0
+    total_selling_qty: float = 0.0
+    product_mapped_code: str = 'N/A'
+    product_mapped_name: str = 'N/A'
+
+
+@dataclass(frozen=True, slots=True, eq=True)
+class PrintRecord(_Record):
+    id: int
+    requirement_id: Optional[int] = None
+    delivery_id: Optional[int] = None
+    delivery_detail_id: Optional[int] = None
+    customer_id: Optional[int] = None
+    customer_name: str = ''
+    dn_number: str = ''
+    product_id: Optional[int] = None
+    product_pn: str = ''
+    pt_code: str = ''
+    selling_quantity: Any = None
+    standard_quantity: Any = None
+    label_type: str = ''
+    print_quantity: int = 0
+    printed_data: Any = None  # Dữ liệu JSON
+    printer_name: str = ''
+    print_status: str = ''
+    error_message: str = ''
+    printed_by: str = ''
+    printed_date: Optional[datetime] = None
+    parent_print_id: Optional[int] = None
+    label_size: str = ''
+    entity_id: Optional[int] = None
+    legal_entity: str = ''
+
+
+@dataclass(frozen=True, slots=True)
+class RequirementBundle:
+    """Một customer label requirement cùng toàn bộ content field của nó (chỉ đọc)."""
+
+    requirement: Requirement
+    fields: Tuple[ContentField, ...]
+
+    @property
+    def id(self) -> int:
+        return self.requirement.id
+
+    def get_field(self, field_code: str) -> Optional[ContentField]:
+        return next((f for f in self.fields if f.field_code == field_code), None)
+
+    @classmethod
+    def from_rows(cls, requirement: Dict[str, Any], fields: Iterable[Dict[str, Any]]) -> "RequirementBundle":
+        return cls(
+            requirement=Requirement.from_row(requirement),
+            fields=tuple(ContentField.from_row(f) for f in fields)
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class PackageAggregate:
+    """Kết quả gộp dữ liệu in của nhiều bản ghi lịch sử thành một Package Label."""
+
+    history_ids: Tuple[int, ...]
+    print_data: Mapping[str, str]                  # field_code -> giá trị đã gộp (dùng để in/lưu)
+    preview_rows: Tuple[Tuple[str, str, str], ...] # (field_code, tên hiển thị, giá trị), theo field_code
+
+    @property
+    def record_count(self) -> int:
+        return len(self.history_ids)
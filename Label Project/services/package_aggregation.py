@@ -0,0 +1,235 @@
+# services/package_aggregation.py
+
+from utils.db import get_db_engine
+from utils.cache import SharedCache
+from utils.config import config
+from sqlalchemy import text
+import hashlib
+import json
+import logging
+import re
+import streamlit as st
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from types import MappingProxyType
+from typing import Dict, Any, Iterable, Mapping, Optional, Tuple
+from services.models import PackageAggregate
+from services import packaging as packaging_svc
+
+logger = logging.getLogger(__name__)
+
+# Quy tắc gộp một field của printed_data
+AGG_DISTINCT = "distinct"   # Các giá trị khác nhau, sắp xếp, nối bằng ", " (mặc định)
+AGG_SUM = "sum"             # Tổng các giá trị số
+AGG_COUNT = "count"         # Số bản ghi có field này
+AGG_MIN_DATE = "min_date"   # Ngày nhỏ nhất (giữ nguyên định dạng đã in)
+AGG_MAX_DATE = "max_date"   # Ngày lớn nhất
+
+AGGREGATION_RULES = (AGG_DISTINCT, AGG_SUM, AGG_COUNT, AGG_MIN_DATE, AGG_MAX_DATE)
+
+# Cấu hình quy tắc trong special_rules của content field, vd. "aggregate=sum"
+_AGGREGATE_RULE_PATTERN = re.compile(r"aggregate\s*[:=]\s*([a-z_]+)", re.IGNORECASE)
+
+_DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+# Các key hay được gộp có cột sinh + index riêng trong label_print_history
+# (sql/002_label_print_history_printed_data_json.sql), không cần tách từ JSON
+INDEXED_PRINTED_KEYS = {
+    'batch_no': 'printed_batch_no',
+    'pt_code': 'printed_pt_code',
+    'dn_number': 'printed_dn_number',
+}
+
+# Lịch sử in không bị sửa sau khi ghi, nên kết quả gộp theo cùng bộ bản ghi dùng lại được
+package_aggregate_cache = SharedCache(
+    "package_aggregate",
+    ttl_seconds=config.get_app_setting("CACHE_TTL_SECONDS", 300),
+    maxsize=128
+)
+
+# Mỗi (key, value) trả về một dòng kèm số bản ghi chứa nó: loại trùng và đếm ngay trong MySQL.
+# JSON null bị bỏ qua ở cả hai nhánh (không gộp thành chuỗi "null").
+# COLLATE utf8mb4_bin để so sánh phân biệt hoa/thường như khi so chuỗi trong Python
+_indexed_selects = "\nUNION ALL\n".join(
+    f"""
+    SELECT '{key}' AS field_key, CAST({column} AS CHAR) COLLATE utf8mb4_bin AS field_value, COUNT(*) AS occurrences
+    FROM label_print_history
+    WHERE id IN :history_ids AND {column} IS NOT NULL
+        AND JSON_TYPE(JSON_EXTRACT(printed_data, '$.{key}')) <> 'NULL'
+    GROUP BY field_value
+    """
+    for key, column in INDEXED_PRINTED_KEYS.items()
+)
+
+_PRINTED_VALUE_COUNTS_QUERY = text(f"""
+    {_indexed_selects}
+    UNION ALL
+    SELECT
+        jk.field_key,
+        CAST(JSON_UNQUOTE(JSON_EXTRACT(h.printed_data, CONCAT('$."', jk.field_key, '"'))) AS CHAR) COLLATE utf8mb4_bin AS field_value,
+        COUNT(*) AS occurrences
+    FROM
+        label_print_history AS h
+    JOIN
+        JSON_TABLE(JSON_KEYS(h.printed_data), '$[*]' COLUMNS (field_key VARCHAR(255) PATH '$')) AS jk
+    WHERE
+        h.id IN :history_ids
+        AND jk.field_key NOT IN :indexed_keys
+        AND JSON_TYPE(JSON_EXTRACT(h.printed_data, CONCAT('$."', jk.field_key, '"'))) <> 'NULL'
+    GROUP BY
+        jk.field_key, field_value
+""")
+
+
+def get_aggregation_rules(content_fields: Iterable[Mapping[str, Any]]) -> Dict[str, str]:
+    """Đọc quy tắc gộp từ special_rules của các content field (vd. 'aggregate=sum')."""
+    rules = {}
+    for field in content_fields:
+        match = _AGGREGATE_RULE_PATTERN.search(field.get('special_rules') or '')
+        if not match or not field.get('field_code'):
+            continue
+        rule = match.group(1).lower()
+        if rule in AGGREGATION_RULES:
+            rules[field.get('field_code')] = rule
+        else:
+            logger.warning(f"Unknown aggregation rule '{rule}' for field {field.get('field_code')}")
+    return rules
+
+
+def _fetch_printed_value_counts(history_ids: Tuple[int, ...]) -> Dict[str, Dict[str, int]]:
+    """{key: {value: số bản ghi}} của printed_data, trong một query."""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        results = conn.execute(
+            _PRINTED_VALUE_COUNTS_QUERY,
+            {"history_ids": history_ids, "indexed_keys": tuple(INDEXED_PRINTED_KEYS)}
+        ).fetchall()
+
+    value_counts: Dict[str, Dict[str, int]] = {}
+    for row in results:
+        if row.field_value is None:
+            continue
+        counts = value_counts.setdefault(row.field_key, {})
+        value = str(row.field_value)
+        counts[value] = counts.get(value, 0) + int(row.occurrences)
+    return value_counts
+
+
+def _parse_date(value: str) -> Optional[date]:
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _format_number(number: Decimal) -> str:
+    if number == number.to_integral_value():
+        return str(int(number))
+    return format(number.normalize(), 'f')
+
+
+def _apply_rule(rule: str, counts: Dict[str, int]) -> str:
+    if rule == AGG_COUNT:
+        return str(sum(counts.values()))
+
+    if rule == AGG_SUM:
+        total = Decimal(0)
+        for value, occurrences in counts.items():
+            try:
+                total += Decimal(value.replace(',', '')) * occurrences
+            except InvalidOperation:
+                continue
+        return _format_number(total)
+
+    if rule in (AGG_MIN_DATE, AGG_MAX_DATE):
+        dated = [(parsed, value) for value in counts if (parsed := _parse_date(value)) is not None]
+        if dated:
+            pick = min if rule == AGG_MIN_DATE else max
+            return pick(dated)[1]
+        # Không đọc được ngày nào thì quay về gộp distinct
+
+    return ", ".join(sorted(counts))
+
+
+def _selection_key(history_ids: Tuple[int, ...], rules: Mapping[str, str], field_names: Mapping[str, str]) -> str:
+    payload = json.dumps([history_ids, sorted(rules.items()), sorted(field_names.items())], ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _build_package_aggregate(
+    history_ids: Tuple[int, ...],
+    rules: Mapping[str, str],
+    field_names: Mapping[str, str]
+) -> PackageAggregate:
+    value_counts = _fetch_printed_value_counts(history_ids)
+
+    print_data = {}
+    for key in sorted(value_counts):
+        # Bỏ các trường QR code (không gộp được), vẫn gộp phần text của barcode
+        if 'qr code' in str(field_names.get(key, key)).lower():
+            continue
+        print_data[key] = _apply_rule(rules.get(key, AGG_DISTINCT), value_counts[key])
+
+    return PackageAggregate(
+        history_ids=history_ids,
+        print_data=MappingProxyType(print_data),
+        preview_rows=tuple((key, field_names.get(key, key), value) for key, value in print_data.items())
+    )
+
+
+def aggregate_package(
+    history_ids: Iterable[int],
+    rules: Optional[Mapping[str, str]] = None,
+    field_names: Optional[Mapping[str, str]] = None
+) -> Optional[PackageAggregate]:
+    """
+    Gộp printed_data của các bản ghi lịch sử đã chọn thành dữ liệu cho một Package Label.
+
+    - Tự đọc dữ liệu cần thiết trong một query; loại trùng và đếm chạy trong MySQL.
+    - rules: field_code -> quy tắc (AGGREGATION_RULES), mặc định AGG_DISTINCT.
+    - field_names: field_code -> tên hiển thị, dùng cho preview và để bỏ các trường QR code.
+    - Kết quả được nhớ theo bộ bản ghi + quy tắc, các lần rerun không truy vấn lại.
+
+    Trả về None nếu không có bản ghi hoặc khi lỗi.
+    """
+    history_ids = tuple(sorted({int(h) for h in history_ids if h is not None}))
+    if not history_ids:
+        return None
+
+    rules = dict(rules or {})
+    field_names = dict(field_names or {})
+
+    try:
+        return package_aggregate_cache.get_or_load(
+            _selection_key(history_ids, rules, field_names),
+            lambda: _build_package_aggregate(history_ids, rules, field_names)
+        )
+
+    except Exception as e:
+        logger.error(f"Failed to aggregate printed data for history IDs {history_ids}: {e}")
+        st.error("Không thể gộp dữ liệu lịch sử in tem. Vui lòng thử lại.")
+
+    return None
+
+
+def aggregate_packaging_unit(
+    unit_id: int,
+    rules: Optional[Mapping[str, str]] = None,
+    field_names: Optional[Mapping[str, str]] = None
+) -> Optional[PackageAggregate]:
+    """Gộp dữ liệu của các đơn vị con đã ghi nhận trong packaging_units (đọc qua index parent_id)."""
+    try:
+        child_history_ids = packaging_svc.get_child_history_ids(unit_id)
+    except Exception as e:
+        logger.error(f"Failed to read child units of packaging unit {unit_id}: {e}")
+        st.error("Không thể đọc cấu trúc đóng gói. Vui lòng thử lại.")
+        return None
+
+    return aggregate_package(child_history_ids, rules=rules, field_names=field_names)
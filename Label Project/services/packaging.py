@@ -0,0 +1,256 @@
+# services/packaging.py
+
+from utils.db import get_db_engine
+from utils.config import config
+from sqlalchemy import text, exc
+import logging
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from services import gs1
+from services import events
+from services.sequences import get_block_sequence
+
+logger = logging.getLogger(__name__)
+
+# Cấp đóng gói: item/carton -> package -> pallet
+UNIT_CARTON = "CARTON"
+UNIT_PACKAGE = "PACKAGE"
+UNIT_PALLET = "PALLET"
+UNIT_TYPES = (UNIT_CARTON, UNIT_PACKAGE, UNIT_PALLET)
+
+SEQUENCE_BLOCK_SIZE = config.get_app_setting("SEQUENCE_BLOCK_SIZE", 100)
+
+_INSERT_UNIT_QUERY = text("""
+    INSERT INTO packaging_units (
+        unit_type, sscc, parent_id, print_history_id, customer_id, entity_id, created_by
+    ) VALUES (
+        :unit_type, :sscc, :parent_id, :print_history_id, :customer_id, :entity_id, :created_by
+    )
+""")
+
+_UNIT_COLUMNS = """
+    id, unit_type, sscc, parent_id, print_history_id,
+    customer_id, entity_id, created_by, created_date
+"""
+
+
+def is_sscc_enabled() -> bool:
+    """SSCC chỉ được cấp khi đã cấu hình GS1 company prefix."""
+    return bool(config.get_app_setting("GS1_COMPANY_PREFIX"))
+
+
+def next_sscc() -> Optional[str]:
+    """
+    Cấp một SSCC-18 mới (kèm check digit), hoặc None nếu chưa cấu hình GS1.
+
+    Serial reference lấy từ BlockSequence: mỗi process giữ một block trong bộ nhớ,
+    chỉ chạm label_sequences khi hết block, nên in nhiều nhãn không tranh chấp DB.
+    """
+    company_prefix = config.get_app_setting("GS1_COMPANY_PREFIX")
+    if not company_prefix:
+        return None
+
+    extension_digit = config.get_app_setting("SSCC_EXTENSION_DIGIT", "0")
+    sequence = get_block_sequence(
+        f"sscc:{extension_digit}{company_prefix}",
+        block_size=SEQUENCE_BLOCK_SIZE
+    )
+    return gs1.build_sscc(extension_digit, company_prefix, sequence.next_value())
+
+
+def _unit_row_to_dict(row) -> Dict[str, Any]:
+    return {
+        'id': row.id,
+        'unit_type': str(row.unit_type or ''),
+        'sscc': row.sscc,
+        'parent_id': row.parent_id,
+        'print_history_id': row.print_history_id,
+        'customer_id': row.customer_id,
+        'entity_id': row.entity_id,
+        'created_by': str(row.created_by or ''),
+        'created_date': row.created_date,
+    }
+
+
+def record_package_from_history(
+    child_history_ids: Iterable[int],
+    print_history_id: Optional[int],
+    customer_id: Optional[int],
+    entity_id: Optional[int],
+    created_by: str,
+    sscc: Optional[str] = None,
+    unit_type: str = UNIT_PACKAGE
+) -> tuple[bool, str, int | None]:
+    """
+    Ghi nhận một package (hoặc pallet) vừa in từ các nhãn con đã chọn trong lịch sử.
+
+    Trong một transaction:
+    - tạo đơn vị cha (kèm SSCC nếu có),
+    - tạo đơn vị CARTON cho các bản ghi lịch sử con chưa có, gắn mọi đơn vị con vào cha,
+    - đặt parent_print_id của các bản ghi lịch sử con về nhãn vừa in.
+    """
+    child_history_ids = tuple(sorted({int(h) for h in child_history_ids if h is not None}))
+    if not child_history_ids:
+        return False, "No child labels selected for the package", None
+    if unit_type not in UNIT_TYPES:
+        return False, f"Invalid packaging unit type: {unit_type}", None
+
+    try:
+        engine = get_db_engine()
+
+        with engine.connect() as conn:
+            with conn.begin() as transaction:
+                result = conn.execute(_INSERT_UNIT_QUERY, {
+                    "unit_type": unit_type,
+                    "sscc": sscc,
+                    "parent_id": None,
+                    "print_history_id": print_history_id,
+                    "customer_id": customer_id,
+                    "entity_id": entity_id,
+                    "created_by": created_by,
+                })
+                new_unit_id = result.lastrowid
+
+                existing = conn.execute(
+                    text("""
+                        SELECT id, print_history_id FROM packaging_units
+                        WHERE print_history_id IN :history_ids
+                    """),
+                    {"history_ids": child_history_ids}
+                ).fetchall()
+                existing_history_ids = {row.print_history_id for row in existing}
+
+                if existing:
+                    conn.execute(
+                        text("UPDATE packaging_units SET parent_id = :parent_id WHERE id IN :unit_ids"),
+                        {"parent_id": new_unit_id, "unit_ids": tuple(row.id for row in existing)}
+                    )
+
+                new_children = [
+                    {
+                        "unit_type": UNIT_CARTON,
+                        "sscc": None,
+                        "parent_id": new_unit_id,
+                        "print_history_id": history_id,
+                        "customer_id": customer_id,
+                        "entity_id": entity_id,
+                        "created_by": created_by,
+                    }
+                    for history_id in child_history_ids if history_id not in existing_history_ids
+                ]
+                if new_children:
+                    conn.execute(_INSERT_UNIT_QUERY, new_children)
+
+                if print_history_id is not None:
+                    conn.execute(
+                        text("UPDATE label_print_history SET parent_print_id = :parent_print_id WHERE id IN :history_ids"),
+                        {"parent_print_id": print_history_id, "history_ids": child_history_ids}
+                    )
+
+                transaction.commit()
+                events.publish(
+                    events.PACKAGING_UNIT_CREATED,
+                    unit_id=new_unit_id,
+                    unit_type=unit_type,
+                    child_history_ids=child_history_ids
+                )
+                msg = f"Recorded {unit_type} unit ID {new_unit_id} with {len(child_history_ids)} child labels"
+                logger.info(msg)
+                return True, msg, new_unit_id
+
+    except exc.SQLAlchemyError as e:
+        logger.error(f"Database error recording packaging unit: {e}")
+        return False, f"A database error occurred: {e}", None
+    except Exception as e:
+        logger.error(f"Unexpected error recording packaging unit: {e}")
+        return False, f"An unexpected error occurred: {e}", None
+
+
+def create_parent_unit(
+    unit_type: str,
+    child_unit_ids: Iterable[int],
+    customer_id: Optional[int],
+    entity_id: Optional[int],
+    created_by: str,
+    print_history_id: Optional[int] = None,
+    assign_sscc: bool = True
+) -> tuple[bool, str, int | None]:
+    """Gom các đơn vị đã có (vd. package) vào một đơn vị cha mới (vd. pallet)."""
+    child_unit_ids = tuple(sorted({int(u) for u in child_unit_ids if u is not None}))
+    if not child_unit_ids:
+        return False, "No child units selected", None
+    if unit_type not in UNIT_TYPES:
+        return False, f"Invalid packaging unit type: {unit_type}", None
+
+    try:
+        sscc = next_sscc() if assign_sscc else None
+        engine = get_db_engine()
+
+        with engine.connect() as conn:
+            with conn.begin() as transaction:
+                result = conn.execute(_INSERT_UNIT_QUERY, {
+                    "unit_type": unit_type,
+                    "sscc": sscc,
+                    "parent_id": None,
+                    "print_history_id": print_history_id,
+                    "customer_id": customer_id,
+                    "entity_id": entity_id,
+                    "created_by": created_by,
+                })
+                new_unit_id = result.lastrowid
+                conn.execute(
+                    text("UPDATE packaging_units SET parent_id = :parent_id WHERE id IN :unit_ids"),
+                    {"parent_id": new_unit_id, "unit_ids": child_unit_ids}
+                )
+                transaction.commit()
+                events.publish(
+                    events.PACKAGING_UNIT_CREATED,
+                    unit_id=new_unit_id,
+                    unit_type=unit_type,
+                    child_history_ids=()
+                )
+                msg = f"Created {unit_type} unit ID {new_unit_id} with {len(child_unit_ids)} child units"
+                logger.info(msg)
+                return True, msg, new_unit_id
+
+    except exc.SQLAlchemyError as e:
+        logger.error(f"Database error creating packaging unit: {e}")
+        return False, f"A database error occurred: {e}", None
+    except Exception as e:
+        logger.error(f"Unexpected error creating packaging unit: {e}")
+        return False, f"An unexpected error occurred: {e}", None
+
+
+def get_unit_by_sscc(sscc: str) -> Optional[Dict[str, Any]]:
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(f"SELECT {_UNIT_COLUMNS} FROM packaging_units WHERE sscc = :sscc"),
+            {"sscc": sscc}
+        ).fetchone()
+    return _unit_row_to_dict(row) if row else None
+
+
+def get_child_units(unit_id: int) -> List[Dict[str, Any]]:
+    """Các đơn vị con trực tiếp, đọc qua index parent_id."""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        results = conn.execute(
+            text(f"SELECT {_UNIT_COLUMNS} FROM packaging_units WHERE parent_id = :unit_id ORDER BY id"),
+            {"unit_id": unit_id}
+        ).fetchall()
+    return [_unit_row_to_dict(row) for row in results]
+
+
+def get_child_history_ids(unit_id: int) -> Tuple[int, ...]:
+    """id nhãn đã in của các đơn vị con trực tiếp (đầu vào cho package_aggregation)."""
+    engine = get_db_engine()
+    with engine.connect() as conn:
+        results = conn.execute(
+            text("""
+                SELECT print_history_id FROM packaging_units
+                WHERE parent_id = :unit_id AND print_history_id IS NOT NULL
+                ORDER BY print_history_id
+            """),
+            {"unit_id": unit_id}
+        ).fetchall()
+    return tuple(row.print_history_id for row in results)
@@ -0,0 +1,174 @@
+# services/print_stats.py
+
+from utils.db import get_db_engine
+from sqlalchemy import text, exc
+import logging
+import streamlit as st
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# printed_date do DB gán khi INSERT, đọc lại để cộng dồn đúng ngày như rebuild_daily_print_stats
+_PRINTED_DATE_QUERY = text("SELECT printed_date FROM label_print_history WHERE id = :history_id")
+
+# Cộng dồn 1 job vào dòng tổng hợp của ngày in (DATE(printed_date) của bản ghi lịch sử)
+_UPSERT_DAILY_STATS_QUERY = text("""
+    INSERT INTO label_print_daily_stats (
+        stat_date, customer_id, entity_id, label_type, printer_name, print_status,
+        customer_name, legal_entity, jobs, labels, failures
+    ) VALUES (
+        DATE(:printed_date), :customer_id, :entity_id, :label_type, :printer_name, :print_status,
+        :customer_name, :legal_entity, 1, :labels, :failures
+    )
+    ON DUPLICATE KEY UPDATE
+        jobs = jobs + VALUES(jobs),
+        labels = labels + VALUES(labels),
+        failures = failures + VALUES(failures),
+        customer_name = COALESCE(VALUES(customer_name), customer_name),
+        legal_entity = COALESCE(VALUES(legal_entity), legal_entity)
+""")
+
+
+def record_print_job(conn, history_id: int, print_data: Dict[str, Any]) -> bool:
+    """
+    Cập nhật bảng tổng hợp label_print_daily_stats cho một bản ghi lịch sử in mới.
+
+    Được gọi trong cùng transaction với INSERT vào label_print_history.
+    Lỗi ở bảng tổng hợp chỉ được ghi log, không làm hỏng việc lưu lịch sử
+    (có thể chạy lại rebuild_daily_print_stats để đồng bộ).
+    """
+    params = {
+        "printed_date": print_data.get("printed_date"),
+        "customer_id": print_data.get("customer_id") or 0,
+        "entity_id": print_data.get("entity_id") or 0,
+        "label_type": print_data.get("label_type") or '',
+        "printer_name": print_data.get("printer_name") or '',
+        "print_status": print_data.get("print_status") or '',
+        "customer_name": print_data.get("customer_name"),
+        "legal_entity": print_data.get("legal_entity"),
+        "labels": int(print_data.get("print_quantity") or 0),
+        "failures": 1 if print_data.get("print_status") == "FAILED" else 0,
+    }
+    try:
+        if params["printed_date"] is None:
+            params["printed_date"] = conn.execute(
+                _PRINTED_DATE_QUERY, {"history_id": history_id}
+            ).scalar()
+        conn.execute(_UPSERT_DAILY_STATS_QUERY, params)
+        return True
+    except exc.SQLAlchemyError as e:
+        logger.error(f"Could not update label_print_daily_stats for print history ID {history_id}: {e}")
+        return False
+
+
+def rebuild_daily_print_stats(start_date: date, end_date: date) -> tuple[bool, str, int]:
+    """Tính lại bảng tổng hợp từ label_print_history cho khoảng ngày đã chọn."""
+
+    delete_query = text("""
+        DELETE FROM label_print_daily_stats
+        WHERE stat_date BETWEEN :start_date AND :end_date
+    """)
+
+    insert_query = text("""
+        INSERT INTO label_print_daily_stats (
+            stat_date, customer_id, entity_id, label_type, printer_name, print_status,
+            customer_name, legal_entity, jobs, labels, failures
+        )
+        SELECT
+            DATE(printed_date), COALESCE(customer_id, 0), COALESCE(entity_id, 0),
+            COALESCE(label_type, ''), COALESCE(printer_name, ''), COALESCE(print_status, ''),
+            MAX(customer_name), MAX(legal_entity),
+            COUNT(*), COALESCE(SUM(print_quantity), 0),
+            SUM(CASE WHEN print_status = 'FAILED' THEN 1 ELSE 0 END)
+        FROM label_print_history
+        WHERE printed_date >= :start_date AND printed_date < DATE_ADD(:end_date, INTERVAL 1 DAY)
+        GROUP BY 1, 2, 3, 4, 5, 6
+    """)
+
+    try:
+        engine = get_db_engine()
+        params = {"start_date": start_date, "end_date": end_date}
+
+        with engine.connect() as conn:
+            with conn.begin() as transaction:
+                conn.execute(delete_query, params)
+                result = conn.execute(insert_query, params)
+                row_count = result.rowcount
+                transaction.commit()
+
+        msg = f"Rebuilt {row_count} daily statistic rows from {start_date} to {end_date}"
+        logger.info(msg)
+        return True, msg, row_count
+
+    except exc.SQLAlchemyError as e:
+        logger.error(f"Database error rebuilding daily print stats: {e}")
+        return False, f"Database Error: Could not rebuild statistics. Details: {e}", 0
+    except Exception as e:
+        logger.error(f"An unexpected error occurred in rebuild_daily_print_stats: {e}")
+        return False, f"An unexpected error occurred: {e}", 0
+
+
+def get_daily_print_stats(
+    start_date: date,
+    end_date: date,
+    customer_id: Optional[int] = None,
+    entity_id: Optional[int] = None,
+    label_type: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Đọc số liệu in tem theo ngày từ bảng tổng hợp (không truy vấn label_print_history)."""
+
+    where_clauses = ["stat_date BETWEEN :start_date AND :end_date"]
+    params = {"start_date": start_date, "end_date": end_date}
+
+    if customer_id is not None:
+        where_clauses.append("customer_id = :customer_id")
+        params["customer_id"] = customer_id
+
+    if entity_id is not None:
+        where_clauses.append("entity_id = :entity_id")
+        params["entity_id"] = entity_id
+
+    if label_type:
+        where_clauses.append("label_type = :label_type")
+        params["label_type"] = label_type
+
+    query = text(f"""
+        SELECT
+            stat_date, customer_id, customer_name, entity_id, legal_entity,
+            label_type, printer_name, print_status, jobs, labels, failures
+        FROM label_print_daily_stats
+        WHERE {' AND '.join(where_clauses)}
+        ORDER BY stat_date
+    """)
+
+    try:
+        engine = get_db_engine()
+
+        with engine.connect() as conn:
+            results = conn.execute(query, params).fetchall()
+
+        if results:
+            stats_list = [
+                {
+                    'stat_date': row.stat_date,
+                    'customer_id': row.customer_id,
+                    'customer_name': str(row.customer_name or 'N/A'),
+                    'entity_id': row.entity_id,
+                    'legal_entity': str(row.legal_entity or 'N/A'),
+                    'label_type': str(row.label_type or ''),
+                    'printer_name': str(row.printer_name or 'N/A'),
+                    'print_status': str(row.print_status or ''),
+                    'jobs': int(row.jobs or 0),
+                    'labels': int(row.labels or 0),
+                    'failures': int(row.failures or 0),
+                }
+                for row in results
+            ]
+            return stats_list
+
+    except Exception as e:
+        logger.error(f"Failed to get daily print stats: {e}")
+        st.error("Không thể tải thống kê in tem. Vui lòng thử lại.")
+
+    return []
@@ -1,19 +1,11 @@
 # services/printer.py
 import streamlit as st
 import html
-from utils.s3_utils import S3Manager
+from services import gs1
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Initialize S3
-try:
-    s3_manager = S3Manager()
-except Exception as e:
-    st.error("Unable to connect to file storage service. Please contact support.")
-    logger.error(f"S3 initialization failed: {e}")
-    st.stop()
-
 try:
     import win32print
 except ImportError:
@@ -32,6 +24,10 @@ def get_printers():
         return []
     
 def send_raw_data_to_printer(printer_name, raw_data):
+    return send_raw_stream_to_printer(printer_name, [raw_data])
+
+def send_raw_stream_to_printer(printer_name, raw_chunks):
+    """Gửi nhiều đoạn dữ liệu RAW (vd. từng nhãn ZPL) trong một print job, không ghép thành một chuỗi lớn."""
     if win32print is None:
         return False, "❌ Printing is only supported on Windows."
     try:
@@ -40,7 +36,8 @@ def send_raw_data_to_printer(printer_name, raw_data):
             h_job = win32print.StartDocPrinter(h_printer, 1, ("Streamlit Label Job", None, "RAW"))
             try:
                 win32print.StartPagePrinter(h_printer)
-                win32print.WritePrinter(h_printer, raw_data.encode('utf-8'))
+                for chunk in raw_chunks:
+                    win32print.WritePrinter(h_printer, chunk.encode('utf-8'))
                 win32print.EndPagePrinter(h_printer)
             finally:
                 win32print.EndDocPrinter(h_printer)
@@ -65,7 +62,9 @@ def generate_zpl_commands(
     num_copies=1,
     field_order=None,
     text_orientation="Horizontal",
-    display_name_map=None
+    display_name_map=None,
+    gs1_128_codes=None,
+    gs1_datamatrix_codes=None
 ):
     
     # --- 1. KHỞI TẠO VÀ CHUYỂN ĐỔI ĐƠN VỊ ---
@@ -76,6 +75,8 @@ def generate_zpl_commands(
     if barcodes_1d is None: barcodes_1d = []
     if barcode_1d_field_codes is None: barcode_1d_field_codes = []
     if field_order is None: field_order = []
+    if gs1_128_codes is None: gs1_128_codes = []
+    if gs1_datamatrix_codes is None: gs1_datamatrix_codes = []
     
     active_display_map = display_name_map if display_name_map is not None else {}
 
@@ -118,9 +119,9 @@ def generate_zpl_commands(
 
     # Tính toán chiều rộng khối hình ảnh dựa trên MÃ RỘNG NHẤT
     image_block_width_dots = 0
-    if qr_codes:
+    if qr_codes or gs1_datamatrix_codes:
         image_block_width_dots = max(image_block_width_dots, qr_width_dots)
-    if barcodes_1d:
+    if barcodes_1d or gs1_128_codes:
         image_block_width_dots = max(image_block_width_dots, barcode_1d_width_dots)
 
     # Chiều rộng có sẵn cho nội dung (trong lề)
@@ -189,8 +190,9 @@ def generate_zpl_commands(
     
     # Tính tổng chiều cao khối HÌNH ẢNH
     total_image_height_dots = 0
-    num_qrs = len(qr_codes)
-    num_bcs = len(barcodes_1d)
+    # GS1 DataMatrix chiếm chỗ như QR, GS1-128 chiếm chỗ như barcode 1D
+    num_qrs = len(qr_codes) + len(gs1_datamatrix_codes)
+    num_bcs = len(barcodes_1d) + len(gs1_128_codes)
     num_images = num_qrs + num_bcs
 
     if num_qrs > 0:
@@ -269,6 +271,20 @@ def generate_zpl_commands(
             commands.append(f'^FDQM,A{qr_content}^FS') # QM=Chế độ cao, A=Tự động
             current_y += qr_width_dots + image_spacing_dots
 
+    # 2a'. Vẽ GS1 DataMatrix (ECC 200, FNC1 đầu dữ liệu)
+    if gs1_datamatrix_codes:
+        dm_x = image_x_coord
+        if image_block_width_dots > qr_width_dots:
+            dm_x = image_x_coord + (image_block_width_dots - qr_width_dots) // 2
+
+        for elements in gs1_datamatrix_codes:
+            # Kích thước module theo symbol nhỏ nhất chứa được dữ liệu
+            module_dots = max(1, qr_width_dots // gs1.datamatrix_symbol_size(elements))
+            commands.append(f'^FO{dm_x},{current_y}')
+            commands.append(f'^BXN,{module_dots},200,0,0,6,_') # 200=ECC 200, '_'=ký tự escape
+            commands.append(f'^FD{gs1.encode_datamatrix_zpl(elements)}^FS')
+            current_y += qr_width_dots + image_spacing_dots
+
     # 2b. Vẽ Barcodes 1D
     if barcodes_1d:
         # *** [FIX 3] THÊM LỆNH ^BY ĐỂ CHUẨN HÓA ĐỘ RỘNG MODULE ***
@@ -289,10 +305,49 @@ def generate_zpl_commands(
             commands.append(f'^FD{bc_content}^FS')
             current_y += barcode_1d_height_dots + image_spacing_dots
 
+    # 2c. Vẽ GS1-128 (Code 128 có FNC1)
+    if gs1_128_codes:
+        commands.append('^BY2')
+
+        bc_x = image_x_coord
+        if image_block_width_dots > barcode_1d_width_dots:
+             bc_x = image_x_coord + (image_block_width_dots - barcode_1d_width_dots) // 2
+
+        for elements in gs1_128_codes:
+            commands.append(f'^FO{bc_x},{current_y}')
+            commands.append(f'^BCN,{barcode_1d_height_dots},N,N,N')
+            commands.append(f'^FD{gs1.encode_gs1_128_zpl(elements)}^FS')
+            current_y += barcode_1d_height_dots + image_spacing_dots
+
     commands.append(f'^PQ{num_copies}') # Số lượng bản in
     commands.append('^XZ')
     return "\n".join(commands)
 
+# Placeholder tạm cho giá trị thay đổi theo từng nhãn (không xuất hiện trong dữ liệu thật)
+_PER_LABEL_VALUE_TOKEN = "\x1ePER_LABEL_VALUE\x1e"
+
+def generate_zpl_batch(label_data, per_label_values, per_label_field_code, field_order=None, **zpl_options):
+    """
+    Sinh ZPL cho từng nhãn (mỗi nhãn một ^PQ1), thay vì một nhãn lặp lại bằng ^PQ.
+
+    Bố cục chỉ được tính một lần với placeholder cho per_label_field_code;
+    mỗi giá trị trong per_label_values (vd. số serial thùng) chỉ là một phép thay chuỗi.
+    Trả về generator để gửi thẳng tới máy in (send_raw_stream_to_printer).
+    """
+    field_order = list(field_order or [])
+    if per_label_field_code not in field_order:
+        field_order.append(per_label_field_code)
+    zpl_options.pop("num_copies", None)
+
+    template = generate_zpl_commands(
+        label_data={**label_data, per_label_field_code: _PER_LABEL_VALUE_TOKEN},
+        field_order=field_order,
+        num_copies=1,
+        **zpl_options
+    )
+    for value in per_label_values:
+        yield template.replace(_PER_LABEL_VALUE_TOKEN, str(value)) + "\n"
+
 def generate_ezpx_xml(label_type_name, label_data, qr_codes, qr_field_names, paper_width_mm, paper_height_mm, font_size_pt, margins_mm, qr_size_mm, num_copies=1):
     margin_top, margin_bottom, margin_left, margin_right = margins_mm
     QR_SPACING_MM = 2
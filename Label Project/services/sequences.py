@@ -0,0 +1,94 @@
+# services/sequences.py
+
+from utils.db import get_db_engine
+from sqlalchemy import text
+import logging
+import threading
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+# Cộng dồn next_value và đưa giá trị mới vào LAST_INSERT_ID() của connection,
+# đọc lại ngay không cần SELECT ... FOR UPDATE (không giữ lock giữa hai câu lệnh)
+_ADVANCE_SEQUENCE_QUERY = text("""
+    UPDATE label_sequences
+    SET next_value = LAST_INSERT_ID(next_value + :count)
+    WHERE sequence_name = :sequence_name
+""")
+
+_INIT_SEQUENCE_QUERY = text("""
+    INSERT IGNORE INTO label_sequences (sequence_name, next_value)
+    VALUES (:sequence_name, :start)
+""")
+
+
+def allocate_range(sequence_name: str, count: int, start: int = 1) -> range:
+    """
+    Dành riêng count số liên tục của một sequence bằng một câu UPDATE nguyên tử.
+
+    Sequence chưa tồn tại thì được tạo với giá trị đầu là start.
+    Các process/replica gọi đồng thời luôn nhận các dải không trùng nhau.
+    """
+    if count <= 0:
+        raise ValueError("count must be positive")
+
+    engine = get_db_engine()
+    params = {"sequence_name": sequence_name, "count": count, "start": start}
+
+    with engine.connect() as conn:
+        with conn.begin() as transaction:
+            result = conn.execute(_ADVANCE_SEQUENCE_QUERY, params)
+            if result.rowcount == 0:
+                conn.execute(_INIT_SEQUENCE_QUERY, params)
+                conn.execute(_ADVANCE_SEQUENCE_QUERY, params)
+            end = conn.execute(text("SELECT LAST_INSERT_ID()")).scalar()
+            transaction.commit()
+
+    end = int(end)
+    logger.info(f"Allocated {count} values [{end - count}, {end}) from sequence '{sequence_name}'")
+    return range(end - count, end)
+
+
+class BlockSequence:
+    """
+    Sequence cấp số trong bộ nhớ theo từng block.
+
+    Mỗi block_size số chỉ tốn một lần UPDATE vào label_sequences, các lần cấp số
+    còn lại không chạm DB. Số của block chưa dùng hết khi process dừng sẽ bị bỏ qua
+    (có khoảng trống, nhưng không bao giờ trùng).
+    """
+
+    def __init__(self, sequence_name: str, block_size: int = 100, start: int = 1):
+        self.sequence_name = sequence_name
+        self.block_size = block_size
+        self.start = start
+        self._next = 0
+        self._end = 0
+        self._lock = threading.Lock()
+
+    def next_value(self) -> int:
+        return self.take(1)[0]
+
+    def take(self, count: int) -> range:
+        """count số liên tục; lấy block mới nếu block hiện tại không còn đủ."""
+        with self._lock:
+            if self._end - self._next < count:
+                block = allocate_range(self.sequence_name, max(count, self.block_size), self.start)
+                self._next, self._end = block.start, block.stop
+            values = range(self._next, self._next + count)
+            self._next += count
+            return values
+
+
+_sequences: Dict[str, BlockSequence] = {}
+_sequences_lock = threading.Lock()
+
+
+def get_block_sequence(sequence_name: str, block_size: int = 100, start: int = 1) -> BlockSequence:
+    """BlockSequence dùng chung trong process cho một tên sequence."""
+    with _sequences_lock:
+        sequence = _sequences.get(sequence_name)
+        if sequence is None:
+            sequence = BlockSequence(sequence_name, block_size=block_size, start=start)
+            _sequences[sequence_name] = sequence
+        return sequence
@@ -0,0 +1,66 @@
+# services/serials.py
+
+from utils.config import config
+import logging
+import threading
+from typing import Dict, Tuple
+from services.sequences import get_block_sequence
+
+logger = logging.getLogger(__name__)
+
+# field_code dùng để in số thùng trên CARTON_LABEL
+CARTON_SERIAL_FIELD = "carton_serial"
+CARTON_SERIAL_WIDTH = 6
+
+SEQUENCE_BLOCK_SIZE = config.get_app_setting("SEQUENCE_BLOCK_SIZE", 100)
+
+
+class SerialAllocator:
+    """
+    Cấp số serial liên tục cho một (customer, requirement).
+
+    Số được lấy từ block đã dành riêng trong bộ nhớ; một lượt in lớn hơn phần còn lại
+    của block chỉ tốn một câu UPDATE nguyên tử (label_sequences) để lấy đủ một dải liên tục.
+    """
+
+    def __init__(self, customer_id: int, requirement_id: int, block_size: int = SEQUENCE_BLOCK_SIZE):
+        self.customer_id = customer_id
+        self.requirement_id = requirement_id
+        self._sequence = get_block_sequence(
+            f"carton:{customer_id}:{requirement_id}",
+            block_size=block_size
+        )
+
+    def allocate(self, count: int) -> range:
+        serials = self._sequence.take(count)
+        logger.info(
+            f"Allocated carton serials {serials.start}-{serials.stop - 1} "
+            f"for customer {self.customer_id}, requirement {self.requirement_id}"
+        )
+        return serials
+
+
+_allocators: Dict[Tuple[int, int], SerialAllocator] = {}
+_allocators_lock = threading.Lock()
+
+
+def get_serial_allocator(customer_id: int, requirement_id: int) -> SerialAllocator:
+    with _allocators_lock:
+        allocator = _allocators.get((customer_id, requirement_id))
+        if allocator is None:
+            allocator = SerialAllocator(customer_id, requirement_id)
+            _allocators[(customer_id, requirement_id)] = allocator
+        return allocator
+
+
+def format_serial(value: int, width: int = CARTON_SERIAL_WIDTH) -> str:
+    return f"{value:0{width}d}"
+
+
+def format_serial_range(serials: range, width: int = CARTON_SERIAL_WIDTH) -> str:
+    """Dải serial để lưu vào printed_data, vd. '000101 - 000150'."""
+    if len(serials) == 0:
+        return ""
+    if len(serials) == 1:
+        return format_serial(serials.start, width)
+    return f"{format_serial(serials.start, width)} - {format_serial(serials[-1], width)}"
@@ -0,0 +1,289 @@
+# services/validation.py
+
+import logging
+import re
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+import pandas as pd
+from services import derived_fields
+from services import gs1
+
+logger = logging.getLogger(__name__)
+
+# Quy tắc trong special_rules của content field, mỗi quy tắc một dòng hoặc cách nhau bởi ';'
+#   min_length=3 / max_length=20   -> độ dài chuỗi
+#   min=1 / max=999                -> khoảng giá trị số
+#   regex=^[A-Z0-9]+$              -> phải khớp toàn bộ
+#   check_digit                    -> số kiểm tra GS1 (mod 10), vd. GTIN
+#   uppercase / digits             -> chỉ chữ hoa / chỉ chữ số
+# Các nội dung khác trong special_rules (ghi chú, aggregate=...) được bỏ qua.
+Check = Callable[[Any], Optional[str]]
+
+REQUIRED_MESSAGE = "is a required field, cannot be left blank"
+
+_RULE_SEPARATOR = re.compile(r"[;\n]")
+_RULE_PATTERN = re.compile(r"^\s*(?P<name>[a-z_]+)\s*(?:[:=]\s*(?P<arg>.+?))?\s*$", re.IGNORECASE)
+
+_EMAIL_PATTERN = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+_PHONE_STRIP_PATTERN = re.compile(r"[\s+\-()]")
+# Code 128 chỉ mã hóa ASCII in được
+_CODE128_PATTERN = re.compile(r"[\x20-\x7e]*")
+
+
+def _is_blank(value: Any) -> bool:
+    return value is None or str(value).strip() == ""
+
+
+def _to_decimal(value: Any) -> Optional[Decimal]:
+    try:
+        return Decimal(str(value).replace(",", "").strip())
+    except (InvalidOperation, ValueError):
+        return None
+
+
+# --- Kiểm tra theo field_type ---
+
+def _check_number(value: Any) -> Optional[str]:
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool):
+        return None
+    return None if _to_decimal(value) is not None else "must be a number"
+
+
+def _check_date(value: Any) -> Optional[str]:
+    return None if derived_fields.to_date(value) is not None else "must be a valid date"
+
+
+def _check_email(value: Any) -> Optional[str]:
+    return None if _EMAIL_PATTERN.fullmatch(str(value).strip()) else "has invalid email format"
+
+
+def _check_phone(value: Any) -> Optional[str]:
+    cleaned_phone = _PHONE_STRIP_PATTERN.sub("", str(value))
+    if not cleaned_phone.isdigit() or not 9 <= len(cleaned_phone) <= 15:
+        return "has invalid phone number format"
+    return None
+
+
+def _check_code128(value: Any) -> Optional[str]:
+    return None if _CODE128_PATTERN.fullmatch(str(value)) else "contains characters that cannot be encoded in a barcode"
+
+
+def _check_gs1(value: Any) -> Optional[str]:
+    try:
+        gs1.parse_human_readable(str(value))
+    except ValueError as e:
+        return f"is not a valid GS1 value: {e}"
+    return None
+
+
+_TYPE_CHECKS: Dict[str, Check] = {
+    "NUMBER": _check_number,
+    "DATE": _check_date,
+    "EMAIL": _check_email,
+    "PHONE": _check_phone,
+    "BARCODE_1D": _check_code128,
+    "BARCODE": _check_code128,
+    "GS1_128": _check_gs1,
+    "GS1_DATAMATRIX": _check_gs1,
+}
+
+
+# --- Kiểm tra theo special_rules ---
+
+def _min_length(limit: int) -> Check:
+    return lambda value: f"must be at least {limit} characters" if len(str(value)) < limit else None
+
+
+def _max_length(limit: int) -> Check:
+    return lambda value: f"must be at most {limit} characters" if len(str(value)) > limit else None
+
+
+def _min_value(limit: Decimal) -> Check:
+    def check(value: Any) -> Optional[str]:
+        number = _to_decimal(value)
+        return f"must be at least {limit}" if number is not None and number < limit else None
+    return check
+
+
+def _max_value(limit: Decimal) -> Check:
+    def check(value: Any) -> Optional[str]:
+        number = _to_decimal(value)
+        return f"must be at most {limit}" if number is not None and number > limit else None
+    return check
+
+
+def _regex(pattern: str) -> Check:
+    compiled = re.compile(pattern)
+    return lambda value: None if compiled.fullmatch(str(value)) else "has an invalid format"
+
+
+def _check_digit(value: Any) -> Optional[str]:
+    return None if gs1.is_valid_check_digit(str(value).strip()) else "has an invalid check digit"
+
+
+def _uppercase(value: Any) -> Optional[str]:
+    return None if str(value) == str(value).upper() else "must be upper case"
+
+
+def _digits(value: Any) -> Optional[str]:
+    return None if str(value).strip().isdigit() else "must contain digits only"
+
+
+def _positive_int(arg: str) -> int:
+    number = int(arg)
+    if number < 0:
+        raise ValueError(arg)
+    return number
+
+
+_RULE_BUILDERS: Dict[str, Callable[[str], Check]] = {
+    "min_length": lambda arg: _min_length(_positive_int(arg)),
+    "max_length": lambda arg: _max_length(_positive_int(arg)),
+    "min": lambda arg: _min_value(Decimal(arg)),
+    "max": lambda arg: _max_value(Decimal(arg)),
+    "regex": _regex,
+    "pattern": _regex,
+}
+
+_RULE_FLAGS: Dict[str, Check] = {
+    "check_digit": _check_digit,
+    "gs1_check_digit": _check_digit,
+    "uppercase": _uppercase,
+    "digits": _digits,
+}
+
+
+def parse_special_rules(special_rules: Optional[str], field_code: str = "") -> Tuple[Check, ...]:
+    checks = []
+    for part in _RULE_SEPARATOR.split(special_rules or ""):
+        match = _RULE_PATTERN.match(part)
+        if not match:
+            continue
+        name, arg = match.group("name").lower(), match.group("arg")
+        try:
+            if arg is not None and name in _RULE_BUILDERS:
+                checks.append(_RULE_BUILDERS[name](arg))
+            elif arg is None and name in _RULE_FLAGS:
+                checks.append(_RULE_FLAGS[name])
+        except (ValueError, InvalidOperation, re.error) as e:
+            logger.warning(f"Ignoring invalid rule '{part.strip()}' for field {field_code}: {e}")
+    return tuple(checks)
+
+
+@dataclass(frozen=True)
+class FieldValidator:
+    field_code: str
+    field_name: str
+    required: bool
+    checks: Tuple[Check, ...]
+
+    def validate(self, value: Any) -> Optional[str]:
+        """Thông báo lỗi đầu tiên, hoặc None nếu hợp lệ."""
+        if _is_blank(value):
+            return REQUIRED_MESSAGE if self.required else None
+        for check in self.checks:
+            message = check(value)
+            if message:
+                return message
+        return None
+
+
+@dataclass(frozen=True)
+class FormValidator:
+    """Validator đã biên dịch cho các content field của một requirement."""
+
+    fields: Tuple[FieldValidator, ...]
+
+    def validate(self, row: Mapping[str, Any], key: str = "field_code") -> Dict[str, str]:
+        """
+        Lỗi của một bộ dữ liệu; key chọn cách đọc/trả lỗi theo 'field_code' hoặc 'field_name'.
+        Trả về dict rỗng nếu hợp lệ.
+        """
+        errors: Dict[str, str] = {}
+        for field in self.fields:
+            name = getattr(field, key)
+            message = field.validate(row.get(name))
+            if message:
+                errors[name] = message
+        return errors
+
+    def validate_rows(self, rows: Iterable[Mapping[str, Any]], key: str = "field_code") -> List[Dict[str, str]]:
+        """Lỗi của từng dòng (cùng thứ tự với rows), vd. mọi dòng sản phẩm của một DN."""
+        return [self.validate(row, key) for row in rows]
+
+    def validate_frame(self, frame: pd.DataFrame, key: str = "field_code") -> pd.DataFrame:
+        """
+        Ma trận lỗi cho cả DataFrame: cùng index với frame, mỗi field một cột (None = hợp lệ).
+
+        Kiểm tra trống chạy theo cột; các kiểm tra còn lại chỉ chạy một lần cho mỗi giá trị
+        khác nhau của cột rồi ánh xạ lại (một DN có rất nhiều dòng trùng batch, ngày...).
+        Field không có cột trong frame được bỏ qua.
+        """
+        errors = pd.DataFrame(index=frame.index)
+        for field in self.fields:
+            name = getattr(field, key)
+            if name not in frame.columns:
+                continue
+
+            values = frame[name]
+            blank = values.isna() | (values.astype(str).str.strip() == "")
+            messages = pd.Series([None] * len(frame), index=frame.index, dtype=object)
+            if field.required:
+                messages[blank] = REQUIRED_MESSAGE
+
+            present = values[~blank]
+            if field.checks and not present.empty:
+                checked = {value: field.validate(value) for value in present.unique()}
+                # Gán bằng list: gán Series sẽ căn index và biến None thành NaN
+                messages[~blank] = [checked[value] for value in present]
+            errors[name] = messages
+        return errors
+
+
+def _build_field_validator(field: Mapping[str, Any]) -> FieldValidator:
+    field_code = field.get('field_code') or ''
+    field_type = str(field.get('field_type') or 'TEXT').upper()
+    checks: List[Check] = []
+
+    type_check = _TYPE_CHECKS.get(field_type)
+    if type_check:
+        checks.append(type_check)
+    if field.get('max_length'):
+        checks.append(_max_length(int(field.get('max_length'))))
+    checks.extend(parse_special_rules(field.get('special_rules'), field_code))
+
+    required = bool(field.get('is_required'))
+    if field_type in ('GS1_128', 'GS1_DATAMATRIX') and gs1.is_element_template(field.get('data_source')):
+        # Giá trị được dựng từ template khi preview, không bắt nhập tay
+        required = False
+
+    return FieldValidator(
+        field_code=field_code,
+        field_name=field.get('field_name') or field_code,
+        required=required,
+        checks=tuple(checks)
+    )
+
+
+def build_validator(content_fields: Iterable[Mapping[str, Any]]) -> FormValidator:
+    return FormValidator(fields=tuple(_build_field_validator(f) for f in content_fields))
+
+
+@lru_cache(maxsize=256)
+def _cached_validator(content_fields: Tuple[Any, ...]) -> FormValidator:
+    return build_validator(content_fields)
+
+
+def get_validator(content_fields: Iterable[Mapping[str, Any]]) -> FormValidator:
+    """
+    Validator cho một bộ content field, biên dịch một lần và dùng lại
+    khi content field là model bất biến (RequirementBundle.fields).
+    """
+    content_fields = tuple(content_fields)
+    try:
+        return _cached_validator(content_fields)
+    except TypeError:
+        # dict (vd. field định nghĩa trong form builder) không hash được: biên dịch lại mỗi lần
+        return build_validator(content_fields)
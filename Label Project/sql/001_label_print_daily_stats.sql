@@ -0,0 +1,39 @@
+-- sql/001_label_print_daily_stats.sql
+-- Bảng tổng hợp số liệu in tem theo ngày, được cập nhật tăng dần mỗi khi ghi label_print_history.
+-- Dashboard thống kê chỉ đọc bảng này, không quét label_print_history.
+
+CREATE TABLE IF NOT EXISTS label_print_daily_stats (
+    stat_date       DATE            NOT NULL,
+    customer_id     BIGINT          NOT NULL DEFAULT 0,
+    entity_id       BIGINT          NOT NULL DEFAULT 0,
+    label_type      VARCHAR(50)     NOT NULL DEFAULT '',
+    printer_name    VARCHAR(255)    NOT NULL DEFAULT '',
+    print_status    VARCHAR(20)     NOT NULL DEFAULT '',
+    customer_name   VARCHAR(255)    NULL,
+    legal_entity    VARCHAR(255)    NULL,
+    jobs            INT UNSIGNED    NOT NULL DEFAULT 0,
+    labels          BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    failures        INT UNSIGNED    NOT NULL DEFAULT 0,
+    updated_date    DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (stat_date, customer_id, entity_id, label_type, printer_name, print_status),
+    KEY idx_print_daily_stats_customer (customer_id, stat_date),
+    KEY idx_print_daily_stats_entity (entity_id, stat_date)
+);
+
+-- Backfill toàn bộ lịch sử hiện có (chạy một lần sau khi tạo bảng)
+INSERT INTO label_print_daily_stats (
+    stat_date, customer_id, entity_id, label_type, printer_name, print_status,
+    customer_name, legal_entity, jobs, labels, failures
+)
+SELECT
+    DATE(printed_date), COALESCE(customer_id, 0), COALESCE(entity_id, 0),
+    COALESCE(label_type, ''), COALESCE(printer_name, ''), COALESCE(print_status, ''),
+    MAX(customer_name), MAX(legal_entity),
+    COUNT(*), COALESCE(SUM(print_quantity), 0),
+    SUM(CASE WHEN print_status = 'FAILED' THEN 1 ELSE 0 END)
+FROM label_print_history
+GROUP BY 1, 2, 3, 4, 5, 6
+ON DUPLICATE KEY UPDATE
+    jobs = VALUES(jobs),
+    labels = VALUES(labels),
+    failures = VALUES(failures);
@@ -0,0 +1,50 @@
+-- sql/002_label_print_history_printed_data_json.sql
+-- printed_data chuyển sang kiểu JSON gốc của MySQL, kèm các cột sinh (generated) có index
+-- cho những key hay được gộp khi tạo Package Label (batch_no, pt_code, dn_number).
+-- services/package_aggregation.py đọc trực tiếp các cột này, không cần parse JSON từng dòng.
+
+-- 1. Sao lưu dữ liệu cũ không phải JSON hợp lệ trước khi sửa
+CREATE TABLE IF NOT EXISTS label_print_history_printed_data_backup (
+    history_id BIGINT NOT NULL PRIMARY KEY,
+    printed_data LONGTEXT NULL,
+    backed_up_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT IGNORE INTO label_print_history_printed_data_backup (history_id, printed_data)
+SELECT id, printed_data
+FROM label_print_history
+WHERE printed_data IS NOT NULL
+  AND (printed_data = '' OR JSON_VALID(printed_data) = 0);
+
+-- 2. Giữ nội dung cũ dưới dạng chuỗi JSON (chuỗi rỗng thì NULL) để ALTER không bị lỗi
+UPDATE label_print_history
+SET printed_data = CASE WHEN printed_data = '' THEN NULL ELSE JSON_QUOTE(printed_data) END
+WHERE printed_data IS NOT NULL
+  AND (printed_data = '' OR JSON_VALID(printed_data) = 0);
+
+-- 3. Đổi kiểu cột và thêm các cột sinh.
+-- Package label ghi dn_number/batch_no là danh sách nối bằng dấu phẩy, có thể dài hơn 255 ký tự:
+-- cột sinh là TEXT (giữ đủ giá trị để gộp), index chỉ lấy 255 ký tự đầu.
+-- JSON null thành SQL NULL (không thành chuỗi 'null').
+ALTER TABLE label_print_history
+    MODIFY COLUMN printed_data JSON NULL,
+    ADD COLUMN printed_batch_no TEXT
+        GENERATED ALWAYS AS (CASE WHEN JSON_TYPE(JSON_EXTRACT(printed_data, '$.batch_no')) = 'NULL' THEN NULL
+                                  ELSE JSON_UNQUOTE(JSON_EXTRACT(printed_data, '$.batch_no')) END) STORED,
+    ADD COLUMN printed_pt_code TEXT
+        GENERATED ALWAYS AS (CASE WHEN JSON_TYPE(JSON_EXTRACT(printed_data, '$.pt_code')) = 'NULL' THEN NULL
+                                  ELSE JSON_UNQUOTE(JSON_EXTRACT(printed_data, '$.pt_code')) END) STORED,
+    ADD COLUMN printed_dn_number TEXT
+        GENERATED ALWAYS AS (CASE WHEN JSON_TYPE(JSON_EXTRACT(printed_data, '$.dn_number')) = 'NULL' THEN NULL
+                                  ELSE JSON_UNQUOTE(JSON_EXTRACT(printed_data, '$.dn_number')) END) STORED,
+    ADD KEY idx_print_history_printed_batch_no (printed_batch_no(255)),
+    ADD KEY idx_print_history_printed_pt_code (printed_pt_code(255)),
+    ADD KEY idx_print_history_printed_dn_number (printed_dn_number(255));
+
+-- Hoàn tác (nếu cần):
+--   ALTER TABLE label_print_history
+--       DROP COLUMN printed_batch_no, DROP COLUMN printed_pt_code, DROP COLUMN printed_dn_number,
+--       MODIFY COLUMN printed_data LONGTEXT NULL;
+--   UPDATE label_print_history h
+--   JOIN label_print_history_printed_data_backup b ON b.history_id = h.id
+--   SET h.printed_data = b.printed_data;
@@ -0,0 +1,28 @@
+-- sql/003_packaging_hierarchy.sql
+-- Cấu trúc đóng gói lưu bền: item/carton -> package -> pallet, mỗi đơn vị có thể có SSCC-18.
+-- Bảng label_sequences cấp dải số liên tục (SSCC, số serial thùng...) bằng một câu UPDATE nguyên tử,
+-- mỗi process giữ một block trong bộ nhớ (services/sequences.py).
+
+CREATE TABLE IF NOT EXISTS label_sequences (
+    sequence_name   VARCHAR(100)    NOT NULL,
+    next_value      BIGINT UNSIGNED NOT NULL,
+    updated_date    DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    PRIMARY KEY (sequence_name)
+);
+
+CREATE TABLE IF NOT EXISTS packaging_units (
+    id                  BIGINT          NOT NULL AUTO_INCREMENT,
+    unit_type           VARCHAR(20)     NOT NULL,           -- CARTON, PACKAGE, PALLET
+    sscc                CHAR(18)        NULL,
+    parent_id           BIGINT          NULL,
+    print_history_id    BIGINT          NULL,               -- Nhãn đã in cho đơn vị này
+    customer_id         BIGINT          NULL,
+    entity_id           BIGINT          NULL,
+    created_by          VARCHAR(100)    NULL,
+    created_date        DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id),
+    UNIQUE KEY uq_packaging_units_sscc (sscc),
+    KEY idx_packaging_units_parent (parent_id),
+    KEY idx_packaging_units_print_history (print_history_id),
+    CONSTRAINT fk_packaging_units_parent FOREIGN KEY (parent_id) REFERENCES packaging_units (id)
+);
@@ -0,0 +1,11 @@
+# tests/conftest.py
+
+import os
+import sys
+
+# Chạy test từ thư mục gốc của app: import utils.*, services.* như các trang
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# utils.config yêu cầu cấu hình DB khi import; test không kết nối DB thật
+for _name in ("DB_HOST", "DB_USER", "DB_PASSWORD", "DB_NAME"):
+    os.environ.setdefault(_name, "test")
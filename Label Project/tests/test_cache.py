@@ -0,0 +1,116 @@
+# tests/test_cache.py
+
+import json
+import time
+
+import fakeredis
+import pytest
+import redis
+
+from utils import cache as cache_mod
+from utils.cache import REDIS_INVALIDATION_CHANNEL, TwoTierCache
+from utils.config import config
+
+
+def _wait_until(condition, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return condition()
+
+
+@pytest.fixture
+def redis_server(monkeypatch):
+    """Redis giả dùng chung cho client của cache và client đóng vai replica khác."""
+    server = fakeredis.FakeServer()
+    monkeypatch.setitem(config.app_config, "REDIS_URL", "redis://fake:6379/0")
+    monkeypatch.setattr(
+        redis.Redis, "from_url",
+        classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server))
+    )
+    monkeypatch.setattr(cache_mod, "_redis_client", None)
+    monkeypatch.setattr(cache_mod, "_redis_failed_at", 0.0)
+    monkeypatch.setattr(cache_mod, "_two_tier_caches", {})
+    monkeypatch.setattr(cache_mod, "REDIS_PUBSUB_RECONNECT_SECONDS", 0)
+    return server
+
+
+class CountingLoader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def test_set_stores_value_in_l1_and_redis(redis_server):
+    cache = TwoTierCache("test-set", ttl_seconds=60)
+    loader = CountingLoader({"name": "ACME"})
+
+    assert cache.get_or_load((1,), loader) == {"name": "ACME"}
+    assert cache.get_or_load((1,), loader) == {"name": "ACME"}
+    assert loader.calls == 1
+
+    # Replica khác (L1 rỗng) đọc được giá trị từ Redis mà không gọi loader
+    cache.invalidate_local()
+    assert cache.get_or_load((1,), loader) == {"name": "ACME"}
+    assert loader.calls == 1
+
+
+def test_invalidate_key_only_drops_that_key(redis_server):
+    cache = TwoTierCache("test-invalidate", ttl_seconds=60)
+    first, second = CountingLoader("a"), CountingLoader("b")
+    cache.get_or_load((1,), first)
+    cache.get_or_load((2,), second)
+
+    cache.invalidate((1,))
+    cache.invalidate_local((2,))  # Chỉ xóa L1: key 2 vẫn còn trong Redis
+
+    cache.get_or_load((1,), first)
+    cache.get_or_load((2,), second)
+    assert first.calls == 2
+    assert second.calls == 1
+
+
+def test_invalidation_from_other_replica_evicts_l1(redis_server):
+    cache = TwoTierCache("test-pubsub", ttl_seconds=60)
+    loader = CountingLoader("v1")
+    cache.get_or_load((7,), loader)
+    assert loader.calls == 1
+
+    # Replica khác cùng namespace: xóa key trong Redis rồi publish với process id của nó
+    other_replica = TwoTierCache("test-pubsub", ttl_seconds=60)
+    cache_mod._two_tier_caches["test-pubsub"] = cache
+    client = fakeredis.FakeRedis(server=redis_server)
+    assert _wait_until(lambda: client.pubsub_numsub(REDIS_INVALIDATION_CHANNEL)[0][1] == 1)
+
+    other_replica.invalidate((7,))
+    assert (7,) in cache.l1._entries  # Thông báo do chính process gửi thì bỏ qua
+    client.publish(REDIS_INVALIDATION_CHANNEL, json.dumps({
+        "namespace": "test-pubsub",
+        "key": [7],
+        "origin": "other-replica"
+    }))
+
+    assert _wait_until(lambda: (7,) not in cache.l1._entries)
+    loader.value = "v2"
+    assert cache.get_or_load((7,), loader) == "v2"
+    assert loader.calls == 2
+
+
+def test_subscriber_error_clears_l1_and_resubscribes(redis_server):
+    cache = TwoTierCache("test-reconnect", ttl_seconds=60)
+    cache.get_or_load((1,), CountingLoader("v1"))
+    client = cache_mod.get_redis_client()
+
+    pubsub = client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{REDIS_INVALIDATION_CHANNEL: cache_mod._handle_invalidation_message})
+    cache_mod._handle_pubsub_error(redis.ConnectionError("connection lost"), pubsub, None)
+
+    assert cache.l1._entries == {}
+    assert pubsub.connection is not None and pubsub.channels
+    pubsub.close()
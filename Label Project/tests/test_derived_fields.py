@@ -0,0 +1,89 @@
+# tests/test_derived_fields.py
+
+from datetime import date
+
+import pandas as pd
+import pytest
+
+from services import derived_fields
+from services.derived_fields import compile_expression
+from services.models import ContentField
+
+TODAY = date(2024, 1, 15)
+
+
+@pytest.mark.parametrize("value, expected", [
+    (24, (24, "months")),
+    ("24 months", (24, "months")),
+    ("2 years", (24, "months")),
+    ("180 ngày", (180, "days")),
+    ("3 weeks", (21, "days")),
+    ("0", None),
+    ("abc", None),
+    (None, None),
+])
+def test_parse_duration(value, expected):
+    assert derived_fields.parse_duration(value) == expected
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2024-02-03", date(2024, 2, 3)),
+    ("03/02/2024", date(2024, 2, 3)),       # DD/MM/YYYY, không phải MM/DD
+    ("25/02/2024", date(2024, 2, 25)),
+    ("25-02-2024", date(2024, 2, 25)),
+    ("2024/02/25", date(2024, 2, 25)),
+    ("N/A", None),
+    ("", None),
+    ("31/02/2024", None),
+])
+def test_to_date(value, expected):
+    assert derived_fields.to_date(value) == expected
+
+
+def test_add_months_clamps_to_month_end():
+    assert derived_fields.add_months(date(2024, 1, 31), 1) == date(2024, 2, 29)
+    assert derived_fields.add_months(date(2023, 12, 31), -10) == date(2023, 2, 28)
+
+
+@pytest.mark.parametrize("data_source, field_type, record, expected", [
+    ("expiry = production_date + shelf_life months", "TEXT",
+     {"production_date": "03/02/2024", "shelf_life": 24}, "2026-02-03"),
+    ("production_date + 1 months", "DATE", {"production_date": "25/02/2024"}, date(2024, 3, 25)),
+    ("production_date + 180 days", "TEXT", {"production_date": "2024-01-01"}, "2024-06-29"),
+    ("production_date - 1 years", "TEXT", {"production_date": "29/02/2024"}, "2023-02-28"),
+    ("today + 2 weeks", "DATE", {}, date(2024, 1, 29)),
+    ("production_date + shelf_life", "TEXT", {"production_date": "2024-01-01", "shelf_life": "N/A"}, None),
+    ("production_date + 1 months", "TEXT", {"production_date": "not a date"}, None),
+])
+def test_evaluate(data_source, field_type, record, expected):
+    derived = compile_expression("expiry_date", data_source, field_type)
+    assert derived.evaluate(record, TODAY) == expected
+
+
+@pytest.mark.parametrize("data_source", ["batch_no", "", None, "production_date + 3 fortnights"])
+def test_non_derived_expressions(data_source):
+    assert compile_expression("field", data_source) is None
+
+
+@pytest.mark.parametrize("field_type", ["TEXT", "DATE"])
+def test_evaluate_frame_matches_evaluate(field_type):
+    derived = compile_expression("expiry_date", "production_date + shelf_life months", field_type)
+    frame = pd.DataFrame({
+        "production_date": ["03/02/2024", "25/02/2024", "2024-01-31", "31/01/2024", None, "N/A"],
+        "shelf_life": [2, "1 month", 1, "12 months", 6, 6],
+    })
+
+    expected = [derived.evaluate(record, TODAY) for record in frame.to_dict("records")]
+    assert list(derived.evaluate_frame(frame, TODAY)) == expected
+    assert expected[:2] == (["2024-04-03", "2024-03-25"] if field_type == "TEXT" else [date(2024, 4, 3), date(2024, 3, 25)])
+
+
+def test_plan_apply_chains_fields():
+    content_fields = (
+        ContentField(id=2, requirement_id=1, field_code="expiry_date",
+                     data_source="production_date + 6 months", field_type="TEXT", display_order=2),
+        ContentField(id=1, requirement_id=1, field_code="production_date",
+                     data_source="today", field_type="DATE", display_order=1),
+    )
+    plan = derived_fields.get_derived_field_plan(content_fields)
+    assert plan.apply({}, TODAY) == {"production_date": TODAY, "expiry_date": "2024-07-15"}
@@ -0,0 +1,75 @@
+# tests/test_formatting.py
+
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+from services import formatting
+from services.models import ContentField
+
+
+@pytest.mark.parametrize("pattern, value, expected", [
+    # Ngày
+    ("DD/MM/YYYY", date(2024, 2, 3), "03/02/2024"),
+    ("DD/MM/YYYY", "2024-02-03", "03/02/2024"),
+    ("DD/MM/YYYY", "25/02/2024", "25/02/2024"),
+    ("YYMMDD", datetime(2024, 2, 3, 10, 30), "240203"),
+    ("MMM-YYYY", date(2024, 2, 3), "Feb-2024"),
+    ("yyyy.mm.dd", date(2024, 2, 3), "2024.02.03"),
+    ("date:DD-MM-YY", date(2024, 2, 3), "03-02-24"),
+    ("%d %b %Y", date(2024, 2, 3), "03 Feb 2024"),
+    ("DD/MM/YYYY", "not a date", "not a date"),
+    # Đệm số 0
+    ("000000", 42, "000042"),
+    ("000000", "42", "000042"),
+    ("pad:4", 7, "0007"),
+    ("000000", "12.5", "12.5"),
+    ("000", 12345, "12345"),
+    # Số
+    ("#,##0.00", 1234567.891, "1,234,567.89"),
+    ("#,##0.00", "1,234.5", "1,234.50"),
+    ("#,##0", Decimal("1234.5"), "1,234"),
+    ("0.0", 3, "3.0"),
+    ("#,##0.00", "N/A", "N/A"),
+    # Tiền tố / hậu tố
+    ("LOT-{}", "A1", "LOT-A1"),
+    ("{} PCS", 12, "12 PCS"),
+    ("prefix:LOT-", "A1", "LOT-A1"),
+    ("suffix:-PCS", "12", "12-PCS"),
+    ("suffix:  PCS", "12", "12 PCS"),     # Một khoảng trắng sau ':' là phân cách
+    ("LOT-{}", "", ""),
+    # Chữ hoa / thường, độ rộng
+    ("upper", "ab1", "AB1"),
+    ("lower", "AB1", "ab1"),
+    ("width:6", "abc", "abc   "),
+    ("rjust:6", "abc", "   abc"),
+    ("width:3", "abcdef", "abc"),
+    # Nhiều chỉ thị, áp dụng từ trái sang phải
+    ("upper|prefix:LOT-|width:10", "b12", "LOT-B12   "),
+    ("000000|prefix:SN", 42, "SN000042"),
+    ("#,##0.00|{} KG", 1500, "1,500.00 KG"),
+])
+def test_compile_format(pattern, value, expected):
+    assert formatting.compile_format(pattern)(value) == expected
+
+
+@pytest.mark.parametrize("pattern", ["", None, "bogus directive", "upper|???"])
+def test_invalid_or_empty_pattern_prints_value_unchanged(pattern):
+    assert formatting.compile_format(pattern)("AbC") == "AbC"
+    assert formatting.compile_format(pattern)(None) == ""
+
+
+def test_format_label_data_applies_field_patterns_only():
+    content_fields = (
+        ContentField(id=1, requirement_id=1, field_code="expiry_date", format_pattern="DD/MM/YYYY"),
+        ContentField(id=2, requirement_id=1, field_code="qty", format_pattern="#,##0"),
+        ContentField(id=3, requirement_id=1, field_code="batch_no"),
+    )
+    label_data = {"expiry_date": "2025-01-31", "qty": 1200, "batch_no": "b1", "note": ""}
+
+    assert formatting.format_label_data(label_data, content_fields) == {
+        "expiry_date": "31/01/2025", "qty": "1,200", "batch_no": "b1", "note": ""
+    }
+    # Không field nào có format_pattern: trả lại chính object
+    assert formatting.format_label_data(label_data, content_fields[2:]) is label_data
@@ -0,0 +1,77 @@
+# tests/test_gs1.py
+
+import pytest
+
+from services import gs1
+
+
+@pytest.mark.parametrize("digits, check_digit", [
+    ("10614141123456789", "7"),     # SSCC 106141411234567897
+    ("0950600013435", "2"),         # GTIN-14 09506000134352
+    ("629104150021", "3"),          # GTIN-13 6291041500213
+    ("9638507", "4"),               # GTIN-8 96385074
+])
+def test_calculate_check_digit(digits, check_digit):
+    assert gs1.calculate_check_digit(digits) == check_digit
+    assert gs1.is_valid_check_digit(digits + check_digit)
+
+
+def test_invalid_check_digit_and_non_numeric():
+    assert not gs1.is_valid_check_digit("09506000134353")
+    with pytest.raises(ValueError):
+        gs1.calculate_check_digit("12A4")
+
+
+def test_build_sscc():
+    assert gs1.build_sscc("1", "0614141", 123456789) == "106141411234567897"
+    # Serial reference được đệm 0 cho đủ 16 chữ số cùng company prefix
+    assert gs1.build_sscc("0", "0614141", 1) == "006141410000000012"
+
+
+@pytest.mark.parametrize("extension_digit, company_prefix, serial_reference", [
+    ("12", "0614141", 1),
+    ("1", "061414", 1),
+    ("1", "0614141", 10 ** 9),
+    ("1", "0614141", -1),
+])
+def test_build_sscc_rejects_invalid_input(extension_digit, company_prefix, serial_reference):
+    with pytest.raises(ValueError):
+        gs1.build_sscc(extension_digit, company_prefix, serial_reference)
+
+
+def test_parse_human_readable_pads_gtin_and_validates():
+    assert gs1.parse_human_readable("(01)9506000134352 (17)250508 (10)ABC123") == (
+        ("01", "09506000134352"), ("17", "250508"), ("10", "ABC123")
+    )
+    with pytest.raises(ValueError):
+        gs1.parse_human_readable("(01)09506000134353")
+    with pytest.raises(ValueError):
+        gs1.parse_human_readable("(17)251308")
+
+
+@pytest.mark.parametrize("elements, expected", [
+    # Toàn số: Start C + FNC1, cặp số ở subset C
+    ((("00", "106141411234567897"),), ">;>800106141411234567897"),
+    # AI cố định độ dài nối liền, chữ cái chuyển sang subset B, không FNC1 ở cuối
+    (
+        (("01", "09506000134352"), ("17", "250508"), ("10", "ABC123")),
+        ">;>801095060001343521725050810>6ABC123",
+    ),
+    # FNC1 sau phần tử độ dài thay đổi; >= 4 chữ số quay lại subset C, chữ số lẻ cuối ở subset B
+    ((("10", "AB"), ("21", "12345")), ">;>810>6AB>8>5211234>65"),
+    # '>' trong dữ liệu phải viết thành '><'
+    ((("10", "A>B"),), ">;>810>6A><B"),
+])
+def test_encode_gs1_128_zpl(elements, expected):
+    assert gs1.encode_gs1_128_zpl(elements) == expected
+
+
+def test_encode_datamatrix_zpl():
+    assert gs1.encode_datamatrix_zpl((("01", "09506000134352"), ("10", "AB"))) == "_10109506000134352" + "10AB"
+    # FNC1 phân tách là '_1', '_' trong dữ liệu được nhân đôi
+    assert gs1.encode_datamatrix_zpl((("10", "AB"), ("21", "X_1"))) == "_110AB_121X__1"
+
+
+def test_datamatrix_symbol_size():
+    # FNC1 + 10 cặp số = 11 codeword -> symbol 16x16 (12 data codeword)
+    assert gs1.datamatrix_symbol_size((("00", "106141411234567897"),)) == 16
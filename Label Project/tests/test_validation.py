@@ -0,0 +1,127 @@
+# tests/test_validation.py
+
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from services import validation
+from services.models import ContentField
+
+
+def _field(field_type="TEXT", special_rules="", is_required=False, **extra):
+    return {
+        "field_code": "value",
+        "field_name": "Value",
+        "field_type": field_type,
+        "special_rules": special_rules,
+        "is_required": is_required,
+        **extra,
+    }
+
+
+def _validate(field, value):
+    return validation.build_validator([field]).fields[0].validate(value)
+
+
+@pytest.mark.parametrize("special_rules, value, expected", [
+    ("min_length=3", "ab", "must be at least 3 characters"),
+    ("min_length=3", "abc", None),
+    ("max_length: 4", "abcde", "must be at most 4 characters"),
+    ("min=1; max=999", "0", "must be at least 1"),
+    ("min=1; max=999", "1,000", "must be at most 999"),
+    ("min=1; max=999", "500", None),
+    ("regex=^[A-Z]{2}\\d+$", "AB12", None),
+    ("regex=^[A-Z]{2}\\d+$", "AB12x", "has an invalid format"),
+    ("check_digit", "09506000134352", None),
+    ("check_digit", "09506000134353", "has an invalid check digit"),
+    ("uppercase", "Ab", "must be upper case"),
+    ("digits", "12a", "must contain digits only"),
+    # Quy tắc cách nhau bằng xuống dòng, ghi chú và aggregate=... bị bỏ qua
+    ("Ghi chú: in đậm\naggregate=sum\nmax_length=2", "abc", "must be at most 2 characters"),
+])
+def test_special_rules(special_rules, value, expected):
+    assert _validate(_field(special_rules=special_rules), value) == expected
+
+
+@pytest.mark.parametrize("special_rules", ["min_length=-1", "max=abc", "regex=[unclosed", "min_length", "uppercase=yes"])
+def test_invalid_rules_are_ignored(special_rules):
+    assert validation.parse_special_rules(special_rules, "value") == ()
+
+
+@pytest.mark.parametrize("field_type, value, expected", [
+    ("email", "ops@example.com", None),
+    ("email", "ops@example", "has invalid email format"),
+    ("email", "ops @example.com", "has invalid email format"),
+    # Trước đây nhánh phone nằm trong nhánh email nên không bao giờ chạy
+    ("phone", "+84 (28) 3822-1234", None),
+    ("phone", "12345", "has invalid phone number format"),
+    ("phone", "0909-ABC-123", "has invalid phone number format"),
+    ("NUMBER", "1,234.5", None),
+    ("NUMBER", "12a", "must be a number"),
+    ("DATE", "25/02/2024", None),
+    ("DATE", "2024-02-30", "must be a valid date"),
+    ("BARCODE_1D", "ABC-123", None),
+    ("BARCODE_1D", "ABCé", "contains characters that cannot be encoded in a barcode"),
+    ("GS1_128", "(01)09506000134352(10)AB1", None),
+])
+def test_type_checks(field_type, value, expected):
+    assert _validate(_field(field_type), value) == expected
+
+
+def test_required_and_blank_values():
+    assert _validate(_field(is_required=True), "  ") == validation.REQUIRED_MESSAGE
+    assert _validate(_field(is_required=True), None) == validation.REQUIRED_MESSAGE
+    # Trường không bắt buộc để trống thì không chạy các kiểm tra khác
+    assert _validate(_field("EMAIL", "min_length=5"), "") is None
+    # GS1 dựng từ template không bắt nhập tay
+    assert _validate(_field("GS1_128", is_required=True, data_source="(01){gtin}"), "") is None
+
+
+def test_max_length_column_and_first_error_wins():
+    field = _field("NUMBER", "max=10", max_length=3)
+    assert _validate(field, "abcd") == "must be a number"
+    assert _validate(field, "1234") == "must be at most 3 characters"
+    assert _validate(field, "11") == "must be at most 10"
+
+
+def test_form_validator_keys():
+    validator = validation.build_validator([
+        _field("EMAIL", is_required=True),
+        {**_field("PHONE"), "field_code": "phone", "field_name": "Phone"},
+    ])
+    row = {"value": "bad", "phone": "123"}
+    assert validator.validate(row) == {
+        "value": "has invalid email format",
+        "phone": "has invalid phone number format",
+    }
+    assert validator.validate({"Value": "ops@example.com"}, key="field_name") == {}
+
+
+def test_validate_frame_matches_validate_rows():
+    validator = validation.build_validator([
+        {**_field("NUMBER", "min=1", is_required=True), "field_code": "qty"},
+        {**_field(special_rules="uppercase"), "field_code": "batch_no"},
+        {**_field(), "field_code": "not_in_frame"},
+    ])
+    frame = pd.DataFrame({
+        "qty": [5, 0, None, "x", 5],
+        "batch_no": ["A1", "a1", "A1", "", None],
+    })
+
+    errors = validator.validate_frame(frame)
+    assert list(errors.columns) == ["qty", "batch_no"]
+    assert errors["qty"].tolist() == [None, "must be at least 1", validation.REQUIRED_MESSAGE, "must be a number", None]
+    assert errors["batch_no"].tolist() == [None, "must be upper case", None, None, None]
+
+    rows = validator.validate_rows(frame.astype(object).where(frame.notna(), None).to_dict("records"))
+    for index, row_errors in enumerate(rows):
+        frame_errors = {name: message for name, message in errors.loc[index].items() if message is not None}
+        assert frame_errors == row_errors
+
+
+def test_get_validator_caches_immutable_fields_and_accepts_dicts():
+    fields = (ContentField(id=1, requirement_id=1, field_code="qty", field_type="NUMBER", is_required=True),)
+    assert validation.get_validator(fields) is validation.get_validator(fields)
+    assert validation.get_validator([_field("NUMBER")]).fields[0].validate("x") == "must be a number"
+    assert validation.parse_special_rules("min=1.5")[0](Decimal("1.4")) == "must be at least 1.5"
@@ -0,0 +1,486 @@
+# utils/cache.py
+
+import functools
+import json
+import os
+import threading
+import time
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from .config import config
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class _InFlightCall:
+    """Một lần gọi loader đang chạy, các luồng khác chờ trên event để dùng chung kết quả."""
+
+    __slots__ = ("event", "value", "error", "invalidated")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        self.invalidated = False  # key bị invalidate trong lúc load: không lưu kết quả
+
+
+class SharedCache:
+    """
+    TTL cache dùng chung cho mọi session trong cùng process Streamlit.
+
+    - LRU: tối đa maxsize entry, entry ít được dùng nhất bị loại trước.
+    - Single-flight: khi nhiều session cùng miss một key, chỉ một luồng gọi loader
+      (một query DB), các luồng còn lại chờ và nhận cùng kết quả.
+    - stale_while_revalidate: khi entry hết hạn, trả ngay giá trị cũ và để một luồng
+      nền làm mới; giá trị cũ chỉ được dùng tối đa stale_ttl_seconds sau khi hết hạn.
+    - invalidate(key) xóa entry và bỏ qua kết quả của lần load key đó đang chạy dở,
+      để dữ liệu cũ không bị ghi lại vào cache; các key khác không bị ảnh hưởng.
+      invalidate() (không key) xóa toàn bộ và bỏ qua mọi lần load đang chạy.
+    - Lỗi của loader không được cache.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl_seconds: float,
+        maxsize: int = 256,
+        stale_while_revalidate: bool = False,
+        stale_ttl_seconds: float = 3600
+    ):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.maxsize = maxsize
+        self.stale_while_revalidate = stale_while_revalidate
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self._entries: OrderedDict = OrderedDict()  # key -> (value, expires_at)
+        self._inflight: Dict[Hashable, _InFlightCall] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        with self._lock:
+            now = time.monotonic()
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                self._entries.move_to_end(key)
+                if expires_at > now:
+                    return value
+                if self.stale_while_revalidate and expires_at + self.stale_ttl_seconds > now:
+                    if key not in self._inflight:
+                        call = _InFlightCall()
+                        self._inflight[key] = call
+                        threading.Thread(
+                            target=self._refresh_in_background,
+                            args=(key, call, loader, self._generation),
+                            name=f"cache-refresh-{self.name}",
+                            daemon=True
+                        ).start()
+                    return value
+
+            call = self._inflight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InFlightCall()
+                self._inflight[key] = call
+                generation = self._generation
+
+        if not is_leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        self._run_loader(key, call, loader, generation)
+        if call.error is not None:
+            raise call.error
+        return call.value
+
+    def _run_loader(self, key: Hashable, call: _InFlightCall, loader: Callable[[], Any], generation: int):
+        try:
+            call.value = loader()
+        except BaseException as e:
+            call.error = e
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is call:
+                    del self._inflight[key]
+                if call.error is None and not call.invalidated and generation == self._generation:
+                    self._store(key, call.value)
+            call.event.set()
+
+    def _refresh_in_background(self, key: Hashable, call: _InFlightCall, loader: Callable[[], Any], generation: int):
+        self._run_loader(key, call, loader, generation)
+        if call.error is not None:
+            logger.warning(f"Background refresh of cache '{self.name}' failed, keeping stale value: {call.error}")
+
+    def _store(self, key: Hashable, value: Any):
+        if self.ttl_seconds <= 0 and not self.stale_while_revalidate:
+            return  # Chỉ gộp lời gọi đang chạy, không giữ kết quả
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Xóa một key, hoặc toàn bộ cache nếu key=None."""
+        with self._lock:
+            if key is None:
+                self._generation += 1
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+                # Lần load đang chạy của key này có thể đã đọc dữ liệu cũ: không lưu kết quả,
+                # và lời gọi mới sẽ load lại thay vì chờ nó
+                call = self._inflight.pop(key, None)
+                if call is not None:
+                    call.invalidated = True
+        logger.info(f"Cache '{self.name}' invalidated: {key if key is not None else 'all keys'}")
+
+
+def make_call_key(args: tuple, kwargs: Dict[str, Any]) -> Hashable:
+    return (args, tuple(sorted(kwargs.items())))
+
+
+def coalesce(
+    ttl_seconds: float = 0,
+    stale_while_revalidate: bool = False,
+    stale_ttl_seconds: float = 3600,
+    maxsize: int = 256
+):
+    """
+    Decorator gộp các lời gọi giống nhau (cùng tham số) đang chạy đồng thời thành một.
+
+    Với ttl_seconds=0 chỉ dùng chung lời gọi đang chạy (không giữ kết quả);
+    ttl_seconds>0 giữ kết quả trong SharedCache. Hàm được bọc nên ném exception khi lỗi
+    (không trả về giá trị rỗng) để kết quả lỗi không bị dùng chung hoặc cache lại.
+
+    Hàm sau khi bọc có thêm:
+        .invalidate(*args, **kwargs): xóa kết quả của đúng lời gọi đó
+        .invalidate_all(): xóa toàn bộ
+    """
+    def decorator(func: Callable) -> Callable:
+        cache = SharedCache(
+            f"{func.__module__}.{func.__qualname__}",
+            ttl_seconds=ttl_seconds,
+            maxsize=maxsize,
+            stale_while_revalidate=stale_while_revalidate,
+            stale_ttl_seconds=stale_ttl_seconds
+        )
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_load(make_call_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(make_call_key(args, kwargs))
+        wrapper.invalidate_all = lambda: cache.invalidate()
+        return wrapper
+
+    return decorator
+
+
+# ==================== Redis (tầng cache dùng chung giữa các replica) ====================
+
+# Tăng khi thay đổi cấu trúc dữ liệu được cache để bỏ qua toàn bộ key cũ trong Redis
+CACHE_SCHEMA_VERSION = 1
+REDIS_KEY_PREFIX = f"label-mgmt:v{CACHE_SCHEMA_VERSION}"
+REDIS_INVALIDATION_CHANNEL = f"{REDIS_KEY_PREFIX}:invalidate"
+REDIS_RETRY_AFTER_SECONDS = 60
+REDIS_PUBSUB_RECONNECT_SECONDS = 5
+
+# Định danh process hiện tại, để bỏ qua thông báo invalidate do chính mình gửi
+_PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_redis_client = None
+_redis_failed_at = 0.0
+_redis_lock = threading.Lock()
+_two_tier_caches: Dict[str, "TwoTierCache"] = {}
+
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"__type__": "decimal", "value": str(value)}
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _json_object_hook(obj: Dict[str, Any]) -> Any:
+    value_type = obj.get("__type__")
+    if value_type == "datetime":
+        return datetime.fromisoformat(obj["value"])
+    if value_type == "date":
+        return date.fromisoformat(obj["value"])
+    if value_type == "decimal":
+        return Decimal(obj["value"])
+    return obj
+
+
+def dumps_cache_value(value: Any) -> bytes:
+    """Serialize giá trị cache sang JSON (không dùng pickle), giữ kiểu date/datetime/Decimal."""
+    return json.dumps(value, default=_json_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads_cache_value(raw: bytes) -> Any:
+    return json.loads(raw, object_hook=_json_object_hook)
+
+
+def _to_hashable(value: Any) -> Hashable:
+    # Key đi qua JSON sẽ thành list, chuyển lại thành tuple để khớp key của L1
+    if isinstance(value, list):
+        return tuple(_to_hashable(v) for v in value)
+    return value
+
+
+def _handle_invalidation_message(message: Dict[str, Any]):
+    try:
+        payload = json.loads(message["data"])
+    except (TypeError, ValueError) as e:
+        logger.warning(f"Ignoring malformed cache invalidation message: {e}")
+        return
+
+    if payload.get("origin") == _PROCESS_ID:
+        return
+
+    cache = _two_tier_caches.get(payload.get("namespace"))
+    if cache is None:
+        return
+
+    key = payload.get("key")
+    cache.invalidate_local(_to_hashable(key) if key is not None else None)
+
+
+def _invalidate_all_local():
+    for cache in list(_two_tier_caches.values()):
+        cache.invalidate_local()
+
+
+def _handle_pubsub_error(error: BaseException, pubsub, thread):
+    """
+    exception_handler của luồng pub/sub: kết nối lại và subscribe lại kênh invalidate.
+
+    Thông báo invalidate gửi trong lúc mất kết nối đã bị mất, nên sau khi kết nối lại
+    toàn bộ L1 trong process bị xóa để không giữ dữ liệu cũ tới hết l1_ttl_seconds.
+    """
+    logger.warning(f"Redis invalidation subscriber disconnected, reconnecting: {error}")
+    _invalidate_all_local()
+
+    while True:
+        time.sleep(REDIS_PUBSUB_RECONNECT_SECONDS)
+        try:
+            pubsub.connection.disconnect()
+            pubsub.connection.connect()  # PubSub.on_connect subscribe lại các kênh
+            break
+        except Exception as e:
+            logger.debug(f"Redis invalidation subscriber still unavailable: {e}")
+
+    _invalidate_all_local()
+    logger.info("✅ Redis invalidation subscriber reconnected")
+
+
+def get_redis_client():
+    """
+    Trả về Redis client dùng chung, hoặc None nếu không cấu hình REDIS_URL / không kết nối được.
+
+    Khi kết nối lỗi, thử lại sau REDIS_RETRY_AFTER_SECONDS; trong lúc đó cache chỉ dùng tầng L1.
+    """
+    global _redis_client, _redis_failed_at
+
+    if _redis_client is not None:
+        return _redis_client
+
+    redis_url = config.get_app_setting("REDIS_URL")
+    if redis is None or not redis_url:
+        return None
+
+    if time.monotonic() - _redis_failed_at < REDIS_RETRY_AFTER_SECONDS:
+        return None
+
+    with _redis_lock:
+        if _redis_client is not None:
+            return _redis_client
+        try:
+            client = redis.Redis.from_url(
+                redis_url,
+                socket_timeout=0.5,
+                socket_connect_timeout=0.5,
+                health_check_interval=30
+            )
+            client.ping()
+
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{REDIS_INVALIDATION_CHANNEL: _handle_invalidation_message})
+            pubsub.run_in_thread(sleep_time=1, daemon=True, exception_handler=_handle_pubsub_error)
+
+            _redis_client = client
+            logger.info("✅ Redis cache tier connected")
+        except Exception as e:
+            _redis_failed_at = time.monotonic()
+            logger.warning(f"Redis cache tier unavailable, using in-process cache only: {e}")
+            return None
+
+    return _redis_client
+
+
+class TwoTierCache:
+    """
+    Cache hai tầng: L1 là SharedCache trong process (LRU, single-flight),
+    L2 là Redis dùng chung giữa các replica.
+
+    Key Redis có dạng  label-mgmt:v{schema}:{namespace}:g{generation}:r{revision}:{key}
+    - schema: CACHE_SCHEMA_VERSION, đổi khi cấu trúc dữ liệu thay đổi
+    - generation: tăng khi invalidate cả namespace, mọi key cũ tự hết hiệu lực
+    - revision: tăng khi invalidate riêng key đó; lần load đang chạy dở chỉ ghi vào
+      key của revision cũ nên không ghi đè được dữ liệu mới
+    Invalidate được publish lên Redis để các replica khác xóa L1 của mình.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl_seconds: float,
+        l1_ttl_seconds: Optional[float] = None,
+        maxsize: int = 512,
+        stale_while_revalidate: bool = False
+    ):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.l1 = SharedCache(
+            f"l1:{namespace}",
+            ttl_seconds=l1_ttl_seconds if l1_ttl_seconds is not None else ttl_seconds,
+            maxsize=maxsize,
+            stale_while_revalidate=stale_while_revalidate
+        )
+        self._invalidation_listeners: list = []
+        _two_tier_caches[namespace] = self
+
+    def add_invalidation_listener(self, listener: Callable[[Optional[Hashable]], Any]):
+        """
+        Gọi listener(key) mỗi khi key bị invalidate, kể cả do replica khác gửi tới.
+
+        Dùng cho các cache chỉ nằm trong process được dựng từ cache này (cùng key).
+        """
+        self._invalidation_listeners.append(listener)
+
+    def invalidate_local(self, key: Optional[Hashable] = None):
+        self.l1.invalidate(key)
+        for listener in self._invalidation_listeners:
+            try:
+                listener(key)
+            except Exception as e:
+                logger.error(f"Invalidation listener failed for cache '{self.namespace}': {e}")
+
+    def _generation_key(self) -> str:
+        return f"{REDIS_KEY_PREFIX}:{self.namespace}:generation"
+
+    def _revision_key(self, encoded_key: str) -> str:
+        return f"{REDIS_KEY_PREFIX}:{self.namespace}:revision:{encoded_key}"
+
+    def _redis_key(self, client, key: Hashable) -> str:
+        encoded_key = dumps_cache_value(key).decode("utf-8")
+        generation, revision = client.mget(self._generation_key(), self._revision_key(encoded_key))
+        return f"{REDIS_KEY_PREFIX}:{self.namespace}:g{int(generation or 0)}:r{int(revision or 0)}:{encoded_key}"
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        return self.l1.get_or_load(key, lambda: self._load_through_redis(key, loader))
+
+    def _load_through_redis(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        client = get_redis_client()
+        if client is None:
+            return loader()
+
+        try:
+            redis_key = self._redis_key(client, key)
+            raw = client.get(redis_key)
+            if raw is not None:
+                return loads_cache_value(raw)
+        except Exception as e:
+            logger.warning(f"Redis read failed for cache '{self.namespace}': {e}")
+            return loader()
+
+        value = loader()
+        try:
+            client.set(redis_key, dumps_cache_value(value), ex=int(self.ttl_seconds))
+        except Exception as e:
+            logger.warning(f"Redis write failed for cache '{self.namespace}': {e}")
+        return value
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Xóa một key (hoặc cả namespace) ở L1, L2 và báo cho các replica khác."""
+        self.invalidate_local(key)
+
+        client = get_redis_client()
+        if client is None:
+            return
+
+        try:
+            if key is None:
+                client.incr(self._generation_key())
+            else:
+                revision_key = self._revision_key(dumps_cache_value(key).decode("utf-8"))
+                pipe = client.pipeline()
+                pipe.delete(self._redis_key(client, key))
+                pipe.incr(revision_key)
+                # Giữ revision lâu hơn giá trị của revision cũ (có TTL ttl_seconds)
+                pipe.expire(revision_key, int(self.ttl_seconds) * 2)
+                pipe.execute()
+            client.publish(REDIS_INVALIDATION_CHANNEL, json.dumps({
+                "namespace": self.namespace,
+                "key": key,
+                "origin": _PROCESS_ID
+            }, default=_json_default))
+        except Exception as e:
+            logger.warning(f"Redis invalidation failed for cache '{self.namespace}': {e}")
+
+
+def shared_cached(
+    namespace: str,
+    ttl_seconds: float,
+    l1_ttl_seconds: Optional[float] = None,
+    maxsize: int = 512,
+    stale_while_revalidate: bool = False
+):
+    """
+    Decorator cache hai tầng (L1 trong process + Redis) cho các hàm đọc dữ liệu.
+
+    Giá trị trả về phải serialize được bằng JSON (dict/list/str/số/date/datetime/Decimal).
+    Giống coalesce, hàm được bọc nên ném exception khi lỗi để lỗi không bị cache.
+
+    Hàm sau khi bọc có thêm:
+        .invalidate(*args, **kwargs): xóa kết quả của đúng lời gọi đó trên mọi replica
+        .invalidate_all(): xóa toàn bộ namespace trên mọi replica
+    """
+    def decorator(func: Callable) -> Callable:
+        cache = TwoTierCache(
+            namespace,
+            ttl_seconds=ttl_seconds,
+            l1_ttl_seconds=l1_ttl_seconds,
+            maxsize=maxsize,
+            stale_while_revalidate=stale_while_revalidate
+        )
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache.get_or_load(make_call_key(args, kwargs), lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        wrapper.invalidate = lambda *args, **kwargs: cache.invalidate(make_call_key(args, kwargs))
+        wrapper.invalidate_all = lambda: cache.invalidate()
+        return wrapper
+
+    return decorator
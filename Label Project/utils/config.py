@@ -158,8 +158,28 @@ class Config:
             
             # Performance
             "CACHE_TTL_SECONDS": int(os.getenv("CACHE_TTL_SECONDS", "300")),  # 5 minutes
+            "REFERENCE_CACHE_TTL_SECONDS": int(os.getenv("REFERENCE_CACHE_TTL_SECONDS", "21600")),  # 6 hours, invalidated on write
             "DB_POOL_SIZE": int(os.getenv("DB_POOL_SIZE", "5")),
             "DB_POOL_RECYCLE": int(os.getenv("DB_POOL_RECYCLE", "3600")),
+            "REDIS_URL": os.getenv("REDIS_URL", ""),  # Để trống: chỉ dùng cache trong process
+            "SEQUENCE_BLOCK_SIZE": int(os.getenv("SEQUENCE_BLOCK_SIZE", "100")),  # Số serial/SSCC mỗi process giữ sẵn
+            "SESSION_BLOB_MIN_BYTES": int(os.getenv("SESSION_BLOB_MIN_BYTES", "65536")),  # Giá trị lớn hơn được lưu bằng tham chiếu
+            "SESSION_BLOB_TTL_SECONDS": int(os.getenv("SESSION_BLOB_TTL_SECONDS", "3600")),  # Tính từ lần đọc cuối
+            "SESSION_BLOB_MAX_BYTES": int(os.getenv("SESSION_BLOB_MAX_BYTES", str(256 * 1024 * 1024))),
+            "IMPORT_TIME_BUDGET_MS": int(os.getenv("IMPORT_TIME_BUDGET_MS", "3000")),  # python -m utils.import_check
+            
+            # S3 client (một client dùng chung cho cả process)
+            "S3_MAX_POOL_CONNECTIONS": int(os.getenv("S3_MAX_POOL_CONNECTIONS", "32")),
+            "S3_MAX_ATTEMPTS": int(os.getenv("S3_MAX_ATTEMPTS", "5")),
+            "S3_CONNECT_TIMEOUT_SECONDS": int(os.getenv("S3_CONNECT_TIMEOUT_SECONDS", "5")),
+            "S3_READ_TIMEOUT_SECONDS": int(os.getenv("S3_READ_TIMEOUT_SECONDS", "60")),
+            "S3_TRANSFER_MAX_CONCURRENCY": int(os.getenv("S3_TRANSFER_MAX_CONCURRENCY", "8")),  # Số part upload/download song song
+            "S3_RETRY_AFTER_SECONDS": int(os.getenv("S3_RETRY_AFTER_SECONDS", "60")),  # Chờ trước khi thử kết nối lại sau lỗi
+            "S3_LISTING_CACHE_TTL_SECONDS": int(os.getenv("S3_LISTING_CACHE_TTL_SECONDS", "300")),  # Xóa khi upload/xóa file
+            
+            # GS1 / SSCC
+            "GS1_COMPANY_PREFIX": os.getenv("GS1_COMPANY_PREFIX", ""),
+            "SSCC_EXTENSION_DIGIT": os.getenv("SSCC_EXTENSION_DIGIT", "0"),
             
             # Localization
             "TIMEZONE": os.getenv("TIMEZONE", "Asia/Ho_Chi_Minh"),
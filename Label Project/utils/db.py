@@ -1,23 +1,41 @@
 import pandas as pd
+import threading
 from sqlalchemy import create_engine
 from urllib.parse import quote_plus
 import logging
-from .config import DB_CONFIG
+from .config import DB_CONFIG, APP_CONFIG
 
 logger = logging.getLogger(__name__)
 
+# Engine dùng chung cho cả process (một connection pool), tạo một lần khi cần
+_engine = None
+_engine_lock = threading.Lock()
+
 
 def get_db_engine():
-    """Create and return SQLAlchemy database engine"""
-    logger.info("🔌 Connecting to database...")
+    """Return the shared SQLAlchemy database engine, creating it on first use"""
+    global _engine
+    if _engine is not None:
+        return _engine
+
+    with _engine_lock:
+        if _engine is None:
+            logger.info("🔌 Connecting to database...")
+
+            user = DB_CONFIG["user"]
+            password = quote_plus(str(DB_CONFIG["password"]))
+            host = DB_CONFIG["host"]
+            port = DB_CONFIG["port"]
+            database = DB_CONFIG["database"]
 
-    user = DB_CONFIG["user"]
-    password = quote_plus(str(DB_CONFIG["password"]))
-    host = DB_CONFIG["host"]
-    port = DB_CONFIG["port"]
-    database = DB_CONFIG["database"]
+            url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
+            logger.info(f"🔐 Using SQLAlchemy URL: mysql+pymysql://{user}:***@{host}:{port}/{database}")
 
-    url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{database}"
-    logger.info(f"🔐 Using SQLAlchemy URL: mysql+pymysql://{user}:***@{host}:{port}/{database}")
+            _engine = create_engine(
+                url,
+                pool_size=APP_CONFIG["DB_POOL_SIZE"],
+                pool_recycle=APP_CONFIG["DB_POOL_RECYCLE"],
+                pool_pre_ping=True
+            )
 
-    return create_engine(url)
\ No newline at end of file
+    return _engine
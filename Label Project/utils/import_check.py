@@ -0,0 +1,121 @@
+# utils/import_check.py
+
+import ast
+import glob
+import os
+import re
+import subprocess
+import sys
+from typing import Iterable, List, Tuple
+
+from .config import config
+
+# Thư viện nặng chỉ được nạp khi cần (qua utils.lazy), không được import khi khởi động
+LAZY_MODULES = ("boto3", "botocore", "qrcode", "barcode", "PIL", "st_aggrid", "xlsxwriter", "pyarrow")
+
+IMPORT_TIME_BUDGET_MS = config.get_app_setting("IMPORT_TIME_BUDGET_MS", 3000)
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _is_project_module(name: str) -> bool:
+    path = os.path.join(_PROJECT_ROOT, *name.split("."))
+    return os.path.isfile(path + ".py") or os.path.isdir(path)
+
+
+def discover_startup_modules() -> Tuple[str, ...]:
+    """
+    Các module mà app.py và pages/*.py import ở cấp module (chạy trước khi tab nào được render).
+
+    Đọc trực tiếp câu lệnh import trong các trang nên danh sách không bị thiếu khi trang
+    thêm import mới; import nằm trong hàm hoặc qua utils.lazy không được tính.
+    """
+    page_files = [os.path.join(_PROJECT_ROOT, "app.py")]
+    page_files += sorted(glob.glob(os.path.join(_PROJECT_ROOT, "pages", "*.py")))
+
+    modules: List[str] = []
+    for path in page_files:
+        with open(path, encoding="utf-8") as f:
+            tree = ast.parse(f.read(), filename=path)
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                # "from services import labels_v2" import module con services.labels_v2
+                names = [
+                    f"{node.module}.{alias.name}" if _is_project_module(f"{node.module}.{alias.name}") else node.module
+                    for alias in node.names
+                ]
+            else:
+                continue
+            modules.extend(name for name in names if name not in modules)
+    return tuple(modules)
+
+
+STARTUP_MODULES = discover_startup_modules()
+
+# "import time:       self [us] |  cumulative | imported package"
+_IMPORT_TIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|( +)(\S+)\s*$")
+
+
+def measure_import_time(modules: Iterable[str]) -> List[Tuple[str, int, int]]:
+    """
+    Import các module trong một process Python mới với -X importtime.
+
+    Returns:
+        List (module, cấp lồng nhau, cumulative µs) theo thứ tự import; cấp 1 là import trực tiếp
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=_PROJECT_ROOT,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        match = _IMPORT_TIME_LINE.match(line)
+        if match:
+            level = (len(match.group(3)) + 1) // 2
+            timings.append((match.group(4), level, int(match.group(2))))
+    return timings
+
+
+def check_import_time(
+    timings: List[Tuple[str, int, int]],
+    budget_ms: float = IMPORT_TIME_BUDGET_MS
+) -> Tuple[float, List[str]]:
+    """Tổng thời gian import khi khởi động (ms) và các vấn đề tìm thấy (rỗng = đạt)."""
+    total_ms = sum(us for _, level, us in timings if level == 1) / 1000
+
+    problems = []
+    if total_ms > budget_ms:
+        problems.append(f"startup imports took {total_ms:,.0f} ms (budget {budget_ms:,.0f} ms)")
+
+    eager = sorted({name.split(".")[0] for name, _, _ in timings} & set(LAZY_MODULES))
+    for name in eager:
+        problems.append(f"'{name}' is imported at startup; load it through utils.lazy instead")
+    return total_ms, problems
+
+
+def main(argv: List[str]) -> int:
+    """python -m utils.import_check [budget_ms]: exit code 1 nếu thời gian khởi động bị chậm đi."""
+    budget_ms = float(argv[0]) if argv else IMPORT_TIME_BUDGET_MS
+
+    timings = measure_import_time(STARTUP_MODULES)
+    slowest = sorted((t for t in timings if t[1] == 1), key=lambda t: t[2], reverse=True)[:10]
+    for name, _, us in slowest:
+        print(f"{name:<40} {us / 1000:>10,.1f} ms")
+
+    total_ms, problems = check_import_time(timings, budget_ms)
+    print(f"{'total':<40} {total_ms:>10,.1f} ms (budget {budget_ms:,.0f} ms)")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,46 @@
+# utils/lazy.py
+
+import importlib
+import threading
+import types
+from typing import Any
+
+
+class LazyModule(types.ModuleType):
+    """
+    Module chỉ được import ở lần truy cập thuộc tính đầu tiên.
+
+    Dùng cho thư viện nặng chỉ cần ở một số tab (qrcode, barcode/PIL, st_aggrid, boto3...):
+    trang không render tới phần đó thì không tốn thời gian import.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+        self.__dict__["_lazy_lock"] = threading.Lock()
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            with self.__dict__["_lazy_lock"]:
+                module = self.__dict__["_lazy_module"]
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.__dict__["_lazy_module"] is not None else "not loaded"
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """vd. qrcode = lazy_import("qrcode"); import thật xảy ra khi gọi qrcode.QRCode(...)."""
+    return LazyModule(name)
+
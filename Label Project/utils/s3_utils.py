@@ -1,17 +1,93 @@
 # utils/s3_utils.py
 
-import boto3
-from botocore.exceptions import ClientError
+import io
 import logging
 import json
-from typing import List, Dict, Optional, Tuple
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+from functools import lru_cache
+from typing import BinaryIO, Iterator, List, Dict, Optional, Tuple, Union
 from datetime import datetime
 import os
+from .cache import SharedCache
 from .config import config
+from .lazy import lazy_import
+
+# boto3 (nạp model botocore, resolver endpoint...) chỉ được import khi tạo S3Manager lần đầu
+boto3 = lazy_import("boto3")
+boto3_transfer = lazy_import("boto3.s3.transfer")
+botocore_config = lazy_import("botocore.config")
+botocore_exceptions = lazy_import("botocore.exceptions")
 
 # Setup logger
 logger = logging.getLogger(__name__)
 
+# Multipart upload / ranged download: chia file lớn thành các part 8MB, tải song song
+MULTIPART_THRESHOLD_BYTES = 8 * 1024 * 1024
+MULTIPART_CHUNK_SIZE_BYTES = 8 * 1024 * 1024
+S3_TRANSFER_MAX_CONCURRENCY = config.get_app_setting("S3_TRANSFER_MAX_CONCURRENCY", 8)
+
+# open_file: giữ trong bộ nhớ tới ngưỡng này, lớn hơn thì ghi ra file tạm
+DOWNLOAD_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+
+# Client dùng chung cho mọi session: pool đủ lớn cho các luồng Streamlit, retry chuẩn, giữ kết nối
+S3_MAX_POOL_CONNECTIONS = config.get_app_setting("S3_MAX_POOL_CONNECTIONS", 32)
+S3_MAX_ATTEMPTS = config.get_app_setting("S3_MAX_ATTEMPTS", 5)
+S3_CONNECT_TIMEOUT_SECONDS = config.get_app_setting("S3_CONNECT_TIMEOUT_SECONDS", 5)
+S3_READ_TIMEOUT_SECONDS = config.get_app_setting("S3_READ_TIMEOUT_SECONDS", 60)
+S3_RETRY_AFTER_SECONDS = config.get_app_setting("S3_RETRY_AFTER_SECONDS", 60)
+
+# Danh sách file theo prefix được cache, xóa khi upload/xóa/copy trong prefix đó (trong process này).
+# Replica khác chỉ thấy thay đổi sau TTL.
+S3_LISTING_CACHE_TTL_SECONDS = config.get_app_setting("S3_LISTING_CACHE_TTL_SECONDS", 300)
+S3_LIST_PAGE_SIZE = 1000
+S3_LIST_MAX_WORKERS = 8
+
+_listing_cache = SharedCache("s3_listing", ttl_seconds=S3_LISTING_CACHE_TTL_SECONDS, maxsize=128)
+
+S3_STATUS_NOT_INITIALIZED = "not_initialized"
+S3_STATUS_OK = "ok"
+S3_STATUS_FAILED = "failed"
+
+
+class S3UnavailableError(RuntimeError):
+    """File storage chưa cấu hình hoặc không khởi tạo được client."""
+
+
+@dataclass(frozen=True)
+class S3Health:
+    status: str
+    error: Optional[str] = None
+    checked_at: Optional[float] = None   # time.time() của lần khởi tạo gần nhất
+    init_ms: Optional[float] = None
+
+
+@lru_cache(maxsize=1)
+def get_transfer_config():
+    """TransferConfig dùng chung cho upload_fileobj / download_fileobj."""
+    return boto3_transfer.TransferConfig(
+        multipart_threshold=MULTIPART_THRESHOLD_BYTES,
+        multipart_chunksize=MULTIPART_CHUNK_SIZE_BYTES,
+        max_concurrency=S3_TRANSFER_MAX_CONCURRENCY,
+        use_threads=True
+    )
+
+
+def build_client_config():
+    """botocore Config cho client dùng chung."""
+    return botocore_config.Config(
+        max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+        retries={'max_attempts': S3_MAX_ATTEMPTS, 'mode': 'standard'},
+        connect_timeout=S3_CONNECT_TIMEOUT_SECONDS,
+        read_timeout=S3_READ_TIMEOUT_SECONDS,
+        tcp_keepalive=True
+    )
+
+
 class S3Manager:
     """S3 Manager for handling all S3 operations"""
     
@@ -35,7 +111,8 @@ class S3Manager:
                 's3',
                 aws_access_key_id=aws_config['access_key_id'],
                 aws_secret_access_key=aws_config['secret_access_key'],
-                region_name=aws_config['region']
+                region_name=aws_config['region'],
+                config=build_client_config()
             )
             
             self.bucket_name = aws_config['bucket_name']
@@ -49,51 +126,121 @@ class S3Manager:
     
     # ==================== Basic S3 Operations ====================
     
-    def list_files(self, prefix: str = '', max_keys: int = 1000) -> List[Dict]:
+    @staticmethod
+    def _normalize_prefix(prefix: str) -> str:
+        # Ensure prefix ends with / if provided
+        if prefix and not prefix.endswith('/'):
+            prefix += '/'
+        return prefix
+    
+    @staticmethod
+    def _file_info(obj: Dict) -> Dict:
+        return {
+            'key': obj['Key'],
+            'name': obj['Key'].split('/')[-1],
+            'size': obj['Size'],
+            'size_mb': round(obj['Size'] / 1024 / 1024, 2),
+            'last_modified': obj['LastModified'],
+            'etag': obj.get('ETag', '').strip('"')
+        }
+    
+    def _iter_pages(self, prefix: str, delimiter: Optional[str] = None, page_size: int = S3_LIST_PAGE_SIZE) -> Iterator[Dict]:
+        """Các trang kết quả list_objects_v2 (paginator tự theo ContinuationToken). Raise botocore ClientError."""
+        params = {'Bucket': self.bucket_name, 'Prefix': prefix}
+        if delimiter:
+            params['Delimiter'] = delimiter
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        yield from paginator.paginate(**params, PaginationConfig={'PageSize': page_size})
+    
+    def _iter_file_infos(self, prefix: str, delimiter: Optional[str] = None) -> Iterator[Dict]:
+        for page in self._iter_pages(prefix, delimiter):
+            for obj in page.get('Contents', ()):
+                # Skip directory markers and .keep files
+                if obj['Key'].endswith('/') or obj['Key'].endswith('.keep'):
+                    continue
+                yield self._file_info(obj)
+    
+    def iter_files(self, prefix: str = '') -> Iterator[Dict]:
+        """
+        Duyệt mọi file dưới prefix theo từng trang (tối đa S3_LIST_PAGE_SIZE object mỗi lần gọi),
+        không giữ toàn bộ danh sách trong bộ nhớ.
+        
+        Args:
+            prefix: S3 prefix to filter files
+            
+        Yields:
+            File dictionaries with metadata
+        """
+        try:
+            yield from self._iter_file_infos(self._normalize_prefix(prefix))
+        except botocore_exceptions.ClientError as e:
+            logger.error(f"Error listing files: {e}")
+    
+    def _list_sharded(self, prefix: str, max_workers: int = S3_LIST_MAX_WORKERS) -> List[Dict]:
+        """Liệt kê song song: mỗi thư mục con một luồng, cộng các file nằm ngay dưới prefix."""
+        shards = [f"{prefix}{folder}/" for folder in self._get_folders(prefix)]
+        files = list(self._iter_file_infos(prefix, delimiter='/'))
+        if not shards:
+            return files
+        
+        # boto3 client dùng chung được giữa các luồng
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(shards)), thread_name_prefix="s3-list") as executor:
+            for shard_files in executor.map(lambda shard: list(self._iter_file_infos(shard)), shards):
+                files.extend(shard_files)
+        return files
+    
+    def list_files(self, prefix: str = '', max_keys: Optional[int] = None,
+                   parallel: bool = False, use_cache: bool = True) -> List[Dict]:
         """
         List files in S3 bucket with optional prefix filter
         
         Args:
             prefix: S3 prefix to filter files
-            max_keys: Maximum number of files to return
+            max_keys: Maximum number of files to return (None = all, không cache)
+            parallel: List each sub-folder of prefix in its own thread
+            use_cache: Reuse the cached listing of this prefix (cleared on upload/delete)
             
         Returns:
             List of file dictionaries with metadata
         """
-        try:
-            # Ensure prefix ends with / if provided
-            if prefix and not prefix.endswith('/'):
-                prefix += '/'
-            
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix,
-                MaxKeys=max_keys
-            )
-            
-            files = []
-            if 'Contents' in response:
-                for obj in response['Contents']:
-                    # Skip directory markers and .keep files
-                    if obj['Key'].endswith('/') or obj['Key'].endswith('.keep'):
-                        continue
-                        
-                    files.append({
-                        'key': obj['Key'],
-                        'name': obj['Key'].split('/')[-1],
-                        'size': obj['Size'],
-                        'size_mb': round(obj['Size'] / 1024 / 1024, 2),
-                        'last_modified': obj['LastModified'],
-                        'etag': obj.get('ETag', '').strip('"')
-                    })
-            
+        prefix = self._normalize_prefix(prefix)
+        
+        if max_keys is not None:
+            files = list(islice(self.iter_files(prefix), max_keys))
             logger.info(f"Listed {len(files)} files with prefix: {prefix}")
             return files
-            
-        except ClientError as e:
+        
+        def load() -> Tuple[Dict, ...]:
+            files = self._list_sharded(prefix) if parallel else list(self._iter_file_infos(prefix))
+            logger.info(f"Listed {len(files)} files with prefix: {prefix}")
+            return tuple(files)
+        
+        try:
+            if not use_cache:
+                return list(load())
+            # Lỗi không được cache; trả bản sao để nơi gọi sửa list không ảnh hưởng cache
+            return [dict(f) for f in _listing_cache.get_or_load((self.bucket_name, prefix), load)]
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error listing files: {e}")
             return []
     
+    def _invalidate_listing(self, *keys: str):
+        """Xóa listing đã cache của mọi prefix chứa các key (folder cha các cấp và gốc bucket)."""
+        prefixes = set()
+        for key in keys:
+            parts = key.split('/')[:-1]
+            prefixes.update(self._normalize_prefix('/'.join(parts[:depth])) for depth in range(len(parts) + 1))
+        for prefix in prefixes:
+            _listing_cache.invalidate((self.bucket_name, prefix))
+    
+    def _get_folders(self, prefix: str) -> List[str]:
+        folders = []
+        for page in self._iter_pages(prefix, delimiter='/'):
+            for prefix_info in page.get('CommonPrefixes', ()):
+                folder_path = prefix_info['Prefix']
+                folders.append(folder_path.rstrip('/').split('/')[-1])
+        return sorted(folders)
+    
     def get_folders(self, prefix: str = '') -> List[str]:
         """
         Get list of folders (common prefixes) in bucket
@@ -105,35 +252,36 @@ class S3Manager:
             List of folder names
         """
         try:
-            # Ensure prefix ends with / if provided
-            if prefix and not prefix.endswith('/'):
-                prefix += '/'
-                
-            response = self.s3_client.list_objects_v2(
-                Bucket=self.bucket_name,
-                Prefix=prefix,
-                Delimiter='/'
-            )
-            
-            folders = []
-            if 'CommonPrefixes' in response:
-                for prefix_info in response['CommonPrefixes']:
-                    folder_path = prefix_info['Prefix']
-                    folder_name = folder_path.rstrip('/').split('/')[-1]
-                    folders.append(folder_name)
-            
-            return sorted(folders)
+            return self._get_folders(self._normalize_prefix(prefix))
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error getting folders: {e}")
             return []
     
-    def upload_file(self, file_content: bytes, key: str, content_type: str = None) -> Tuple[bool, str]:
+    def upload_file(self, file_content: Union[bytes, BinaryIO], key: str, content_type: str = None) -> Tuple[bool, str]:
         """
         Upload file to S3
         
         Args:
-            file_content: File content as bytes
+            file_content: File content as bytes, or a readable binary file-like object
+            key: S3 key (path) for the file
+            content_type: MIME type of the file
+            
+        Returns:
+            Tuple of (success: bool, result: str)
+        """
+        if isinstance(file_content, (bytes, bytearray, memoryview)):
+            # BytesIO dùng chung buffer với bytes, không tạo bản copy
+            file_content = io.BytesIO(file_content)
+        return self.upload_fileobj(file_content, key, content_type=content_type)
+    
+    def upload_fileobj(self, fileobj: BinaryIO, key: str, content_type: str = None) -> Tuple[bool, str]:
+        """
+        Upload a file-like object to S3 using multipart upload for large files
+        
+        Args:
+            fileobj: Readable binary file-like object (read from its current position),
+                vd. UploadedFile của st.file_uploader
             key: S3 key (path) for the file
             content_type: MIME type of the file
             
@@ -145,25 +293,77 @@ class S3Manager:
             if content_type:
                 extra_args['ContentType'] = content_type
             
-            self.s3_client.put_object(
-                Bucket=self.bucket_name,
-                Key=key,
-                Body=file_content,
-                **extra_args
+            # TransferManager: file nhỏ hơn ngưỡng đi một put_object, file lớn chia part và tải song song
+            self.s3_client.upload_fileobj(
+                fileobj,
+                self.bucket_name,
+                key,
+                ExtraArgs=extra_args or None,
+                Config=get_transfer_config()
             )
             
-            logger.info(f"Successfully uploaded file to: {key}")
+            self._invalidate_listing(key)
+            logger.info(f"Successfully uploaded file object to: {key}")
             return True, key
             
-        except ClientError as e:
+        except (botocore_exceptions.ClientError, boto3.exceptions.Boto3Error) as e:
             error_msg = f"Failed to upload file: {str(e)}"
             logger.error(error_msg)
             return False, error_msg
     
+    def download_fileobj(self, key: str, fileobj: BinaryIO) -> bool:
+        """
+        Download file into a writable binary file-like object
+        
+        File lớn được tải bằng nhiều range GET song song (TransferManager), ghi thẳng vào fileobj.
+        
+        Args:
+            key: S3 key of the file
+            fileobj: Writable binary file-like object
+            
+        Returns:
+            True if successful, False otherwise
+        """
+        try:
+            self.s3_client.download_fileobj(
+                self.bucket_name,
+                key,
+                fileobj,
+                Config=get_transfer_config()
+            )
+            logger.info(f"Successfully downloaded file: {key}")
+            return True
+            
+        except (botocore_exceptions.ClientError, boto3.exceptions.Boto3Error) as e:
+            logger.error(f"Error downloading file {key}: {e}")
+            return False
+    
+    def open_file(self, key: str) -> Optional[BinaryIO]:
+        """
+        Download file to a seekable stream, positioned at the start
+        
+        Nội dung nằm trong bộ nhớ tới DOWNLOAD_SPOOL_MAX_BYTES, lớn hơn thì chuyển ra file tạm.
+        st.download_button không nhận SpooledTemporaryFile: truyền stream.read(); nơi gọi đóng stream khi xong.
+        
+        Args:
+            key: S3 key of the file
+            
+        Returns:
+            Binary file-like object or None if error
+        """
+        stream = tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_BYTES)
+        if not self.download_fileobj(key, stream):
+            stream.close()
+            return None
+        stream.seek(0)
+        return stream
+    
     def download_file(self, key: str) -> Optional[bytes]:
         """
         Download file content from S3
         
+        Dùng cho file nhỏ cần cả nội dung (vd. template JSON); file lớn dùng open_file.
+        
         Args:
             key: S3 key of the file
             
@@ -180,7 +380,7 @@ class S3Manager:
             logger.info(f"Successfully downloaded file: {key}")
             return content
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error downloading file {key}: {e}")
             return None
     
@@ -200,10 +400,11 @@ class S3Manager:
                 Key=key
             )
             
+            self._invalidate_listing(key)
             logger.info(f"Successfully deleted file: {key}")
             return True
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error deleting file {key}: {e}")
             return False
     
@@ -229,7 +430,7 @@ class S3Manager:
             )
             return url
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error generating presigned URL for {key}: {e}")
             return None
     
@@ -258,7 +459,7 @@ class S3Manager:
                 'metadata': response.get('Metadata', {})
             }
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error getting file info for {key}: {e}")
             return None
     
@@ -278,7 +479,7 @@ class S3Manager:
                 Key=key
             )
             return True
-        except ClientError:
+        except botocore_exceptions.ClientError:
             return False
     
     # ==================== Label Management Specific Methods ====================
@@ -335,13 +536,13 @@ class S3Manager:
         prefix = f"{self.app_prefix}/label-management/customer-requirements/{customer_id}/"
         return self.list_files(prefix=prefix)
     
-    def upload_label_requirement(self, file_content: bytes, filename: str, 
+    def upload_label_requirement(self, file_content: Union[bytes, BinaryIO], filename: str, 
                                customer_id: int, file_type: str = 'requirement') -> Tuple[bool, str]:
         """
         Upload label requirement file for a customer
         
         Args:
-            file_content: File content as bytes
+            file_content: File content as bytes or a readable binary file-like object
             filename: Original filename
             customer_id: Customer ID
             file_type: Type of file (requirement, sample, etc.)
@@ -356,12 +557,12 @@ class S3Manager:
         
         return self.upload_file(file_content, key)
     
-    def upload_label_asset(self, file_content: bytes, asset_type: str, filename: str) -> Tuple[bool, str]:
+    def upload_label_asset(self, file_content: Union[bytes, BinaryIO], asset_type: str, filename: str) -> Tuple[bool, str]:
         """
         Upload reusable asset (logo, icon, etc)
         
         Args:
-            file_content: File content as bytes
+            file_content: File content as bytes or a readable binary file-like object
             asset_type: Type of asset (logos, icons, fonts)
             filename: Asset filename
             
@@ -433,10 +634,11 @@ class S3Manager:
         if customer_code:
             safe_customer_code = customer_code.replace(' ', '_').lower()
             prefix = f"{self.app_prefix}/label-management/templates/{safe_customer_code}/"
-        else:
-            prefix = f"{self.app_prefix}/label-management/templates/"
+            return self.list_files(prefix=prefix)
         
-        return self.list_files(prefix=prefix)
+        # Mọi customer: mỗi thư mục customer được liệt kê song song
+        prefix = f"{self.app_prefix}/label-management/templates/"
+        return self.list_files(prefix=prefix, parallel=True)
     
     def copy_file(self, source_key: str, dest_key: str) -> bool:
         """
@@ -461,10 +663,11 @@ class S3Manager:
                 Key=dest_key
             )
             
+            self._invalidate_listing(dest_key)
             logger.info(f"Successfully copied {source_key} to {dest_key}")
             return True
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error copying file: {e}")
             return False
     
@@ -497,6 +700,7 @@ class S3Manager:
                 
                 if 'Deleted' in response:
                     result['deleted'].extend([obj['Key'] for obj in response['Deleted']])
+                    self._invalidate_listing(*(obj['Key'] for obj in response['Deleted']))
                 
                 if 'Errors' in response:
                     result['errors'].extend([
@@ -506,7 +710,7 @@ class S3Manager:
             
             logger.info(f"Batch delete complete. Deleted: {len(result['deleted'])}, Errors: {len(result['errors'])}")
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error in batch delete: {e}")
             result['errors'].append(str(e))
         
@@ -547,7 +751,7 @@ class S3Manager:
                 'file_count': file_count
             }
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error calculating folder size: {e}")
             return {
                 'total_bytes': 0,
@@ -584,6 +788,53 @@ class S3Manager:
             logger.info(f"Created folder: {folder_path}")
             return True
             
-        except ClientError as e:
+        except botocore_exceptions.ClientError as e:
             logger.error(f"Error creating folder: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+_s3_manager: Optional[S3Manager] = None
+_s3_manager_lock = threading.Lock()
+_s3_health = S3Health(S3_STATUS_NOT_INITIALIZED)
+
+
+def get_s3_manager() -> S3Manager:
+    """
+    S3Manager (một boto3 client) dùng chung cho cả process, tạo ở lần dùng đầu tiên.
+
+    Trang và service gọi hàm này ngay tại chỗ cần S3 thay vì tạo S3Manager khi import,
+    nên trang không dùng S3 không phải trả chi phí khởi tạo hay dừng lại khi S3 lỗi.
+
+    Raises:
+        S3UnavailableError: khởi tạo thất bại. Trong S3_RETRY_AFTER_SECONDS sau một lần lỗi,
+            lỗi cũ được trả lại ngay thay vì thử tạo client lại ở mỗi lần chạy trang.
+    """
+    global _s3_manager, _s3_health
+    if _s3_manager is not None:
+        return _s3_manager
+
+    with _s3_manager_lock:
+        if _s3_manager is not None:
+            return _s3_manager
+
+        health = _s3_health
+        if health.status == S3_STATUS_FAILED and time.time() - health.checked_at < S3_RETRY_AFTER_SECONDS:
+            raise S3UnavailableError(health.error)
+
+        started = time.perf_counter()
+        try:
+            _s3_manager = S3Manager()
+        except Exception as e:
+            _s3_health = S3Health(S3_STATUS_FAILED, error=str(e), checked_at=time.time())
+            raise S3UnavailableError(str(e)) from e
+
+        _s3_health = S3Health(
+            S3_STATUS_OK,
+            checked_at=time.time(),
+            init_ms=round((time.perf_counter() - started) * 1000, 1)
+        )
+        return _s3_manager
+
+
+def get_s3_health() -> S3Health:
+    return _s3_health
@@ -0,0 +1,356 @@
+# utils/session_state.py
+
+import sys
+import threading
+import time
+import logging
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Mapping, Optional
+
+import streamlit as st
+
+from .config import config
+from .s3_utils import get_s3_health
+
+logger = logging.getLogger(__name__)
+
+SESSION_BLOB_MIN_BYTES = config.get_app_setting("SESSION_BLOB_MIN_BYTES", 64 * 1024)
+SESSION_BLOB_TTL_SECONDS = config.get_app_setting("SESSION_BLOB_TTL_SECONDS", 3600)
+SESSION_BLOB_MAX_BYTES = config.get_app_setting("SESSION_BLOB_MAX_BYTES", 256 * 1024 * 1024)
+
+# Thống kê bộ nhớ của một session chỉ giữ trong khoảng này sau lần chạy cuối
+SESSION_USAGE_RETENTION_SECONDS = 3600
+
+# Metadata của manager trong st.session_state: key -> {"size", "tab", "shared"}
+_META_KEY = "_state_meta"
+_LAST_TAB_KEY = "_state_last_tab"
+# Thời gian chạy lại gần nhất của cả trang và của từng fragment: scope -> {"last_ms", "avg_ms", "runs"}
+_RERUN_TIMES_KEY = "_state_rerun_times"
+
+# Ước lượng kích thước: chỉ duyệt tối đa chừng này phần tử mỗi collection rồi ngoại suy
+_SIZE_SAMPLE_ITEMS = 200
+
+
+@dataclass(frozen=True, slots=True)
+class BlobRef:
+    """Tham chiếu tới một giá trị lớn trong blob store dùng chung, thay cho bản copy trong session."""
+
+    key: Hashable
+    size: int
+    owned: bool = False  # Blob riêng của session (không có share_key): xóa cùng key
+
+
+class _BlobStore:
+    """
+    Kho giá trị lớn dùng chung cho mọi session trong process.
+
+    - Cùng share_key (vd. cùng bộ history id) thì các session dùng chung một bản.
+    - TTL tính từ lần đọc cuối: session bỏ dở không giữ dữ liệu tới khi hết phiên đăng nhập.
+    - Tổng dung lượng bị giới hạn, entry ít được dùng nhất bị loại trước.
+    """
+
+    def __init__(self, ttl_seconds: float, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()  # key -> [value, size, last_access]
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, key: Hashable, value: Any, size: int):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            self._entries[key] = [value, size, time.monotonic()]
+            self._total_bytes += size
+            self._evict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            now = time.monotonic()
+            if entry[2] + self.ttl_seconds <= now:
+                self._remove(key)
+                return None
+            entry[2] = now
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def discard(self, key: Hashable):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key: Hashable):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry[1]
+
+    def _evict(self):
+        now = time.monotonic()
+        for key in [k for k, e in self._entries.items() if e[2] + self.ttl_seconds <= now]:
+            self._remove(key)
+        # Luôn giữ entry vừa ghi (cuối OrderedDict), kể cả khi một mình nó vượt ngân sách
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._total_bytes}
+
+
+_blob_store = _BlobStore(SESSION_BLOB_TTL_SECONDS, SESSION_BLOB_MAX_BYTES)
+
+# session_id -> {"user", "bytes", "keys", "updated_at"}; để admin xem mọi session của process
+_session_usage: Dict[str, Dict[str, Any]] = {}
+_session_usage_lock = threading.Lock()
+
+
+def estimate_size(value: Any, _seen: Optional[set] = None) -> int:
+    """
+    Ước lượng số byte mà một giá trị chiếm (gồm các object con).
+
+    DataFrame dùng memory_usage(deep=True); collection lớn chỉ được lấy mẫu rồi ngoại suy.
+    """
+    if _seen is None:
+        _seen = set()
+    if id(value) in _seen:
+        return 0
+    _seen.add(id(value))
+
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):
+        try:
+            return int(value.memory_usage(index=True, deep=True).sum())
+        except Exception:
+            pass
+
+    size = sys.getsizeof(value, 0)
+    if isinstance(value, (str, bytes, bytearray, int, float, bool)) or value is None:
+        return size
+
+    if isinstance(value, Mapping):
+        items = list(value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = list(value)
+    else:
+        return size
+
+    sample = items[:_SIZE_SAMPLE_ITEMS]
+    sample_size = sum(estimate_size(item, _seen) for item in sample)
+    if len(items) > len(sample):
+        sample_size = sample_size * len(items) // len(sample)
+    return size + sample_size
+
+
+def _get_meta() -> Dict[str, Dict[str, Any]]:
+    if _META_KEY not in st.session_state:
+        st.session_state[_META_KEY] = {}
+    return st.session_state[_META_KEY]
+
+
+def put(key: str, value: Any, tab: Optional[str] = None, share_key: Optional[Hashable] = None):
+    """
+    Lưu giá trị vào session_state và ghi nhận kích thước.
+
+    - tab: key chỉ thuộc về tab này, bị xóa khi người dùng chuyển sang tab khác (drop_stale_keys).
+    - Giá trị lớn hơn SESSION_BLOB_MIN_BYTES được đưa vào blob store dùng chung,
+      session chỉ giữ BlobRef. share_key giúp các session có cùng dữ liệu dùng chung một bản.
+      Blob không có share_key thuộc riêng key này, được giải phóng khi key bị ghi đè hoặc pop.
+    """
+    _release_blob(st.session_state.get(key))
+
+    size = estimate_size(value)
+    shared = size >= SESSION_BLOB_MIN_BYTES
+    if shared:
+        owned = share_key is None
+        blob_key = ("blob", uuid.uuid4().hex) if owned else ("blob", share_key)
+        _blob_store.put(blob_key, value, size)
+        st.session_state[key] = BlobRef(blob_key, size, owned)
+    else:
+        st.session_state[key] = value
+
+    _get_meta()[key] = {"size": size, "tab": tab, "shared": shared}
+
+
+def get(key: str, default: Any = None) -> Any:
+    """Đọc giá trị, tự giải tham chiếu BlobRef. Blob đã hết hạn thì xóa key và trả default."""
+    value = st.session_state.get(key, default)
+    if not isinstance(value, BlobRef):
+        return value
+
+    blob = _blob_store.get(value.key)
+    if blob is None:
+        logger.info(f"Session blob for '{key}' expired, dropping key")
+        pop(key)
+        return default
+    return blob
+
+
+def _release_blob(value: Any):
+    # Blob dùng chung (share_key) có thể còn session khác tham chiếu, để TTL/LRU tự dọn
+    if isinstance(value, BlobRef) and value.owned:
+        _blob_store.discard(value.key)
+
+
+def pop(key: str):
+    if key in st.session_state:
+        _release_blob(st.session_state[key])
+        del st.session_state[key]
+    _get_meta().pop(key, None)
+
+
+def drop_stale_keys(active_tab: str, tab_keys: Mapping[str, Iterable[str]]):
+    """
+    Khi tab thay đổi, xóa các key thuộc về tab khác.
+
+    tab_keys: tab -> các key chỉ dùng trong tab đó (ngoài các key đã put(..., tab=...)).
+    """
+    if st.session_state.get(_LAST_TAB_KEY) == active_tab:
+        return
+    st.session_state[_LAST_TAB_KEY] = active_tab
+
+    stale_keys = [
+        key
+        for tab, keys in tab_keys.items() if tab != active_tab
+        for key in keys
+    ]
+    stale_keys.extend(
+        key for key, meta in _get_meta().items()
+        if meta.get("tab") and meta["tab"] != active_tab
+    )
+    for key in stale_keys:
+        pop(key)
+
+
+def get_session_usage() -> List[Dict[str, Any]]:
+    """Kích thước từng key của session hiện tại, lớn nhất trước."""
+    meta = _get_meta()
+    usage = []
+    for key in list(st.session_state.keys()):
+        if key in (_META_KEY, _LAST_TAB_KEY, _RERUN_TIMES_KEY):
+            continue
+        value = st.session_state.get(key)
+        key_meta = meta.get(key, {})
+        # Với BlobRef, session chỉ giữ tham chiếu; bytes là kích thước trong blob store
+        size = value.size if isinstance(value, BlobRef) else estimate_size(value)
+        usage.append({
+            "key": key,
+            "bytes": size,
+            "stored_as": "shared" if isinstance(value, BlobRef) else "inline",
+            "tab": key_meta.get("tab") or "",
+        })
+    return sorted(usage, key=lambda row: row["bytes"], reverse=True)
+
+
+def _get_session_id() -> Optional[str]:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+def record_session_usage():
+    """Ghi lại tổng bộ nhớ (phần inline) của session hiện tại để admin xem toàn process."""
+    session_id = _get_session_id()
+    if not session_id:
+        return
+
+    usage = get_session_usage()
+    now = time.time()
+    with _session_usage_lock:
+        _session_usage[session_id] = {
+            "user": st.session_state.get("username", ""),
+            "inline_bytes": sum(row["bytes"] for row in usage if row["stored_as"] == "inline"),
+            "shared_refs": sum(1 for row in usage if row["stored_as"] == "shared"),
+            "keys": len(usage),
+            "updated_at": now,
+        }
+        for sid in [sid for sid, row in _session_usage.items() if row["updated_at"] + SESSION_USAGE_RETENTION_SECONDS < now]:
+            del _session_usage[sid]
+
+
+def get_process_usage() -> Dict[str, Any]:
+    with _session_usage_lock:
+        sessions = [{"session_id": sid[:8], **row} for sid, row in _session_usage.items()]
+    return {"sessions": sessions, "blob_store": _blob_store.stats()}
+
+
+def record_rerun_time(scope: str, seconds: float):
+    """Ghi nhận thời gian một lần chạy của scope (cả trang, hoặc một fragment)."""
+    if _RERUN_TIMES_KEY not in st.session_state:
+        st.session_state[_RERUN_TIMES_KEY] = {}
+    stats = st.session_state[_RERUN_TIMES_KEY].setdefault(scope, {"last_ms": 0.0, "avg_ms": 0.0, "runs": 0})
+    elapsed_ms = seconds * 1000
+    stats["runs"] += 1
+    stats["last_ms"] = elapsed_ms
+    stats["avg_ms"] += (elapsed_ms - stats["avg_ms"]) / stats["runs"]
+
+
+def timed_rerun(scope: str) -> Callable:
+    """
+    Decorator đo thời gian chạy của một hàm render, vd. đặt dưới @st.fragment để biết
+    một lần chạy lại riêng fragment tốn bao lâu so với chạy lại cả trang.
+    """
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_rerun_time(scope, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def get_rerun_times() -> List[Dict[str, Any]]:
+    times = st.session_state.get(_RERUN_TIMES_KEY, {})
+    return [
+        {"scope": scope, "last_ms": round(row["last_ms"], 1), "avg_ms": round(row["avg_ms"], 1), "runs": row["runs"]}
+        for scope, row in times.items()
+    ]
+
+
+def render_memory_panel():
+    """Bảng bộ nhớ session cho admin (sidebar)."""
+    record_session_usage()
+
+    if st.session_state.get("user_role") != "admin":
+        return
+
+    with st.sidebar.expander("🧠 Session Memory"):
+        session_usage = get_session_usage()
+        st.caption(f"This session: {sum(row['bytes'] for row in session_usage) / 1024:,.1f} KB")
+        st.dataframe(session_usage, hide_index=True, width='stretch')
+
+        process_usage = get_process_usage()
+        blob_stats = process_usage["blob_store"]
+        st.caption(
+            f"Shared blobs: {blob_stats['entries']} entries, {blob_stats['bytes'] / 1024 / 1024:,.1f} MB"
+        )
+        st.dataframe(
+            sorted(process_usage["sessions"], key=lambda row: row["inline_bytes"], reverse=True),
+            hide_index=True,
+            width='stretch'
+        )
+
+        # Trạng thái client S3 dùng chung (chỉ đọc, không tạo client)
+        s3_health = get_s3_health()
+        s3_status = s3_health.status
+        if s3_health.init_ms is not None:
+            s3_status += f", initialized in {s3_health.init_ms:,.0f} ms"
+        if s3_health.error:
+            s3_status += f": {s3_health.error}"
+        st.caption(f"File storage: {s3_status}")
+
+        rerun_times = get_rerun_times()
+        if rerun_times:
+            # Fragment chạy lại riêng không vẽ lại sidebar: số liệu được cập nhật ở lần chạy cả trang kế tiếp
+            st.caption("Rerun time (ms)")
+            st.dataframe(rerun_times, hide_index=True, width='stretch')